@@ -0,0 +1,113 @@
+"""
+Application clou_bench,
+benchmark of the frame pipeline of cloucon.py main loop:
+per-frame overhead of moving frames received from reader
+from framing to dispatch, the former way (dict() per frame,
+list.pop(0), deepcopy and sort of the frames list on every pass)
+against the current one (ReceivedFrame() records moved by reference
+through deque()). Decoding of frames with ClouRFIDFrame() is the same
+in both and included, handling of tags and matching of replies are not.
+
+python37 /usr/share/dev/clouweb/clou_bench.py 20000 500 0.05
+
+arguments: number of frames, frames per pass of main loop (as parse-limit),
+share of non-tag frames left for matching after priority filtering
+"""
+from sys import argv
+from time import perf_counter
+from copy import deepcopy
+from collections import deque
+import clouprotocol
+
+D = clouprotocol.ClouProtocolDefinitions()
+
+def build_frames(frames_count, other_share):
+    """ List of raw frames bytes(): tag data frames and OP_STOP replies mixed as other_share """
+    __frames = list()
+    __frame = clouprotocol.ClouRFIDFrame()
+    __other_every = int(1 / other_share) if other_share > 0 else 0
+    for __idx in range(frames_count):
+        __frame.clear()
+        if __other_every and ((__idx % __other_every) == 0):
+            __frame.message_id = D.OP_STOP
+            __frame.message_type = D.TYPE_CONF_OPERATE
+            __frame.init_by_reader = D.INIT_BY_USER
+            __frame.data_bytes = bytes([0x00])
+        else:
+            __epc = "{0:024X}".format(__idx).encode("ascii")[-12:]
+            __frame.message_id = D.OP_READER_EPC_DATA_UPLOAD
+            __frame.message_type = D.TYPE_CONF_OPERATE
+            __frame.init_by_reader = D.INIT_BY_READER
+            __frame.data_bytes = len(__epc).to_bytes(2, "big") + __epc + bytes([0x30, 0x00, 0x01, 0x01, 0x32]) + bytes([0x08]) + __idx.to_bytes(4, "big")
+        __frame.encodeFrame()
+        __frames.append(__frame.frame_raw_line)
+    return __frames
+
+def run_former(raw_frames, pass_size):
+    """ Frames path as it was: dict() per frame, pop(0), deepcopy and sort """
+    __rfidframe = clouprotocol.ClouRFIDFrame()
+    __tag_frame = (D.OP_READER_EPC_DATA_UPLOAD, D.TYPE_CONF_OPERATE, D.INIT_BY_READER)
+    __dispatched = 0
+    for __pass_start in range(0, len(raw_frames), pass_size):
+        __stream_frames = raw_frames[__pass_start:(__pass_start + pass_size)]
+        __decoded = list()
+        __to_log = list()
+        for __idx in range(len(__stream_frames)):
+            __rfidframe.clear()
+            __rfidframe.frame_raw_line = __stream_frames.pop(0)
+            __res = __rfidframe.decodeFrame()
+            __dict_frame = dict()
+            __dict_frame["res"] = __res
+            __dict_frame["frame"] = (__rfidframe.message_id, __rfidframe.message_type, __rfidframe.init_by_reader)
+            __dict_frame["data"] = __rfidframe.data_bytes
+            __dict_frame["recv-time"] = float()
+            if __res == 0:
+                __decoded.append(__dict_frame)
+            __to_log.append(__dict_frame)
+        __left = list()
+        for __idx in range(len(__decoded)):
+            __dict_frame = __decoded.pop(0)
+            if (__dict_frame["frame"] == __tag_frame) and (__dict_frame["res"] == 0):
+                __dispatched += 1
+            else:
+                __left.append(__dict_frame)
+        __decoded = deepcopy(__left)
+        __decoded = deepcopy(sorted(__decoded, key=lambda __key: __key["recv-time"]))
+        for __idx in range(len(__decoded)):
+            __decoded.pop(0)
+            __dispatched += 1
+    return __dispatched
+
+def run_current(raw_frames, pass_size):
+    """ Frames path as it is now: ReceivedFrame() records through deque() """
+    __rfidframe = clouprotocol.ClouRFIDFrame()
+    __tag_frame = (D.OP_READER_EPC_DATA_UPLOAD, D.TYPE_CONF_OPERATE, D.INIT_BY_READER)
+    __dispatched = 0
+    for __pass_start in range(0, len(raw_frames), pass_size):
+        __stream_frames = raw_frames[__pass_start:(__pass_start + pass_size)]
+        __decoded = deque()
+        for __raw_frame in __stream_frames:
+            __rfidframe.clear()
+            __rfidframe.frame_raw_line = __raw_frame
+            __fr = clouprotocol.ReceivedFrame(__rfidframe.decodeFrame(), (__rfidframe.message_id, __rfidframe.message_type, __rfidframe.init_by_reader), __rfidframe.data_bytes, float())
+            if __fr.res != 0:
+                continue
+            if __fr.frame == __tag_frame:
+                __dispatched += 1
+            else:
+                __decoded.append(__fr)
+        while __decoded:
+            __decoded.popleft()
+            __dispatched += 1
+    return __dispatched
+
+if __name__ == "__main__":
+    frames_count = int(argv[1]) if len(argv) > 1 else 20000
+    pass_size = int(argv[2]) if len(argv) > 2 else 500
+    other_share = float(argv[3]) if len(argv) > 3 else 0.05
+    raw_frames = build_frames(frames_count, other_share)
+    for run_name, run_func in [("former", run_former), ("current", run_current)]:
+        time_start = perf_counter()
+        dispatched = run_func(raw_frames, pass_size)
+        time_spent = perf_counter() - time_start
+        print(run_name + ": " + str(dispatched) + " frames in " + "{0:.3f}".format(time_spent) + " s, " + "{0:.2f}".format(time_spent * 1000000 / frames_count) + " us per frame")
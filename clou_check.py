@@ -0,0 +1,173 @@
+"""
+Application clou_check,
+checks of clouclient and of a running connector through the web API with clouclient:
+
+client - clouclient against WSGI server run in this process, with API replies
+made up by the server: keep-alive connections are reused, a call on connection
+closed by server after keep-alive timeout is repeated once, also POST, but never
+cleandata, cleanstats or shutdown, and never on timeout; batch() keeps the order
+of calls, AsyncClouClient gives the same replies
+
+python37 /usr/share/dev/clouweb/clou_check.py client
+
+job - job of steps waiting for the same reply, more steps than in-flight window
+of the reader, goes to reader one step at a time as replies come, and has
+to finish with all steps done, even when it takes longer than reply-from-reader-timeout
+
+python37 /usr/share/dev/clouweb/clou_check.py job http://testapp.viledadev.ru msk_cl7206b2 12
+
+arguments of job: base URL of web API, reader id, number of steps, 12 by default
+options:
+--msid=<command> - command of every step, OP_QUERY_POWER by default
+--timeout=<seconds> - max time to wait for the job to finish, 120 by default
+
+Prints OK or FAILED with the reason, the exit code is 0 for OK and 1 for FAILED
+"""
+from sys import argv, exit
+from time import time, sleep
+from json import dumps
+from threading import Thread, Lock
+from socket import timeout
+from socketserver import ThreadingMixIn
+from wsgiref.simple_server import make_server, WSGIServer, WSGIRequestHandler, ServerHandler
+import asyncio
+import clouclient
+
+class CheckApp:
+    """
+    WSGI application answering API calls with dict() of method, path and call number,
+    counting calls by path part after reader id; "getstats" is answered after delay
+    """
+    def __init__(self, delay_set):
+        self.delay = delay_set
+        self.calls = dict()
+        self.connections = 0
+        self.__lock = Lock()
+    def __call__(self, environ, start_response):
+        __body = environ["wsgi.input"].read(int(environ.get("CONTENT_LENGTH") or 0))
+        __api_path = environ["PATH_INFO"].split("/", 4)[-1]
+        with self.__lock:
+            self.calls[__api_path] = self.calls.get(__api_path, 0) + 1
+            __count = self.calls[__api_path]
+        if __api_path == "getstats":
+            sleep(self.delay)
+        __response_payload = dumps({"method": environ["REQUEST_METHOD"], "path": environ["PATH_INFO"], "count": __count, "body-len": len(__body)}).encode("ascii")
+        start_response("200 OK", [("Content-type", "application/json"), ("Content-Length", str(len(__response_payload)))])
+        return [__response_payload]
+
+class KeepAliveHandler(WSGIRequestHandler):
+    """ Request handler of HTTP/1.1 keep-alive connection, closed by server after idle_timeout """
+    protocol_version = "HTTP/1.1"
+    idle_timeout = 0.5
+    def handle(self):
+        self.server.get_app().connections += 1
+        self.connection.settimeout(self.idle_timeout)
+        self.close_connection = False
+        while not self.close_connection:
+            try:
+                self.raw_requestline = self.rfile.readline(65537)
+            except (timeout, OSError):
+                return
+            if (not self.raw_requestline) or (not self.parse_request()):
+                return
+            __handler = ServerHandler(self.rfile, self.wfile, self.get_stderr(), self.get_environ(), multithread=True)
+            __handler.http_version = "1.1"
+            __handler.request_handler = self
+            __handler.run(self.server.get_app())
+    def log_message(self, *args):
+        pass
+
+class CheckServer(ThreadingMixIn, WSGIServer):
+    """ WSGI server with thread per connection """
+    daemon_threads = True
+
+def check_client():
+    """ Checks of clouclient against CheckApp in this process, returns tuple (is ok, text) """
+    __app = CheckApp(2.0)
+    __server = make_server("127.0.0.1", 0, __app, server_class=CheckServer, handler_class=KeepAliveHandler)
+    __server_thread = Thread(target=__server.serve_forever, daemon=True)
+    __server_thread.start()
+    __base_url = "http://127.0.0.1:" + str(__server.server_address[1])
+    __client = clouclient.ClouClient(__base_url, pool_size_set=4, timeout_set=1.0)
+    __failed = list()
+    try:
+        # Sequential calls go over one pooled connection
+        __results = [__client.getstatus("rid1"), __client.query("rid1", {"msid": "OP_QUERY_POWER"})]
+        if any(__result[0] != 200 for __result in __results) or (__app.connections != 1):
+            __failed.append("keep-alive: " + repr(__results) + ", connections " + str(__app.connections))
+        # Connection closed by server while idle: POST is repeated on a new one, and reaches server once
+        sleep(KeepAliveHandler.idle_timeout * 2)
+        __result = __client.query("rid1", {"msid": "OP_QUERY_POWER"})
+        if (__result[0] != 200) or (__app.calls.get("query") != 2):
+            __failed.append("POST on closed keep-alive connection: " + repr(__result) + ", query calls " + repr(__app.calls.get("query")))
+        # Calls changing state are not repeated
+        sleep(KeepAliveHandler.idle_timeout * 2)
+        __result = __client.cleandata("rid1")
+        if (__result[0] != -1) or ("cleandata" in __app.calls):
+            __failed.append("cleandata on closed keep-alive connection is repeated: " + repr(__result) + ", cleandata calls " + repr(__app.calls.get("cleandata")))
+        # Timeout is not repeated
+        __result = __client.getstats("rid1")
+        if (__result[0] != -1) or (__app.calls.get("getstats") != 1):
+            __failed.append("timeout: " + repr(__result) + ", getstats calls " + repr(__app.calls.get("getstats")))
+        # Batch keeps the order of calls
+        __rids = ["rid" + str(__idx) for __idx in range(8)]
+        __results = __client.batch_readers("getdatacount", __rids)
+        if any((__results[__rid][0] != 200) or (__results[__rid][1]["path"] != "/api/v1/" + __rid + "/getdatacount") for __rid in __rids):
+            __failed.append("batch: " + repr(__results))
+        # Asyncio interface gives the same replies
+        __async_client = clouclient.AsyncClouClient(__base_url, pool_size_set=4, timeout_set=1.0)
+        async def __async_calls():
+            return await asyncio.gather(__async_client.query("rid1", {"msid": "OP_QUERY_POWER"}), __async_client.profile("rid1", "stages", 1.0), __async_client.memstats("rid1"), __async_client.batch([("getdata", "rid2", None)]))
+        __results = asyncio.run(__async_calls())
+        __async_client.close()
+        if (__results[0][0] != 200) or (__results[1][1]["path"] != "/api/v1/rid1/profile") or (__results[2][1]["path"] != "/api/v1/rid1/memstats") or (__results[3][0][1]["path"] != "/api/v1/rid2/getdata"):
+            __failed.append("asyncio: " + repr(__results))
+    finally:
+        __client.close()
+        __server.shutdown()
+        __server.server_close()
+    if __failed:
+        return (False, "clouclient: " + "; ".join(__failed))
+    return (True, "clouclient: keep-alive, repeat on closed connection, no repeat of cleandata and on timeout, batch, asyncio")
+
+def check_job(client, rid, steps_count, msid, check_timeout):
+    """ Submit job of steps_count steps of msid to reader rid and wait for it, returns tuple (is ok, text) """
+    __status, __reply = client.submitjob(rid, {"queries": [{"msid": msid}] * steps_count})
+    if (__status != 202) or (not isinstance(__reply, dict)) or ("job-id" not in __reply):
+        return (False, "job not submitted, HTTP status " + str(__status) + ": " + repr(__reply))
+    __job_id = __reply["job-id"]
+    __check_start = time()
+    __job = None
+    while time() - __check_start < check_timeout:
+        __status, __reply = client.getjob(rid, __job_id, min(10.0, max(check_timeout - (time() - __check_start), 0.1)))
+        if (__status != 200) or (not isinstance(__reply, dict)) or (not isinstance(__reply.get("result"), dict)):
+            return (False, "job " + __job_id + " status not got, HTTP status " + str(__status) + ": " + repr(__reply))
+        __job = __reply["result"]
+        if __job.get("finished") is not None:
+            break
+    if (__job is None) or (__job.get("finished") is None):
+        return (False, "job " + __job_id + " not finished within " + repr(check_timeout) + " seconds: " + repr(__job))
+    __text = "job " + __job_id + " " + str(__job["state"]) + ", " + str(__job["steps-done"]) + " of " + str(__job["steps-total"]) + " steps done, " + str(__job["steps-failed"]) + " failed, in " + "{0:.1f}".format(__job["finished"] - __job["created"]) + " seconds"
+    return ((__job["state"] == "done") and (__job["steps-done"] == steps_count), __text)
+
+if __name__ == "__main__":
+    check_args = [__arg for __arg in argv[1:] if not __arg.startswith("--")]
+    check_msid = "OP_QUERY_POWER"
+    check_timeout = 120.0
+    for __arg in argv[1:]:
+        if __arg.startswith("--msid="):
+            check_msid = __arg.split("=", 1)[1]
+        elif __arg.startswith("--timeout="):
+            check_timeout = float(__arg.split("=", 1)[1])
+    if check_args[:1] == ["client"]:
+        check_ok, check_text = check_client()
+    elif (len(check_args) >= 3) and (check_args[0] == "job"):
+        check_client = clouclient.ClouClient(check_args[1], timeout_set=check_timeout)
+        check_ok, check_text = check_job(check_client, check_args[2], int(check_args[3]) if len(check_args) > 3 else 12, check_msid, check_timeout)
+        check_client.close()
+    else:
+        print("Usage: clou_check.py client")
+        print("       clou_check.py job BASE_URL RID [STEPS] [--msid=MSID] [--timeout=SECONDS]")
+        exit(1)
+    print(("OK: " if check_ok else "FAILED: ") + check_text)
+    exit(0 if check_ok else 1)
@@ -0,0 +1,116 @@
+"""
+Application clou_replay,
+offline replay of binary captures of reader traffic made by cloucon.py
+with "capture": true for the reader: chunks received from reader are pushed
+through ReceivedRawLine().unpack(), ClouRFIDFrame().decodeFrame() and
+TagData().decodeTag() as fast as possible, or in real time with --realtime,
+to reproduce and profile production incidents and tag floods.
+
+python37 /usr/share/dev/clouweb/clou_replay.py /usr/share/dev/clouweb/capture/capture-msk_cl7206b2-*.cap
+
+options:
+--realtime - keep time gaps between chunks as captured
+--parse-limit=<N> - the same as "parse-limit" of the reader in clou.conf, 500 by default
+--sent - also unpack and decode bytes sent to reader
+"""
+from sys import argv
+from time import perf_counter, sleep
+import clouprotocol
+
+D = clouprotocol.ClouProtocolDefinitions()
+
+class ReplayStats:
+    """ Counters of one replay """
+    def __init__(self):
+        self.chunks = 0
+        self.chunk_bytes = 0
+        self.frames = 0
+        self.frame_errors = 0
+        self.tag_frames = 0
+        self.tag_errors = 0
+        self.unknown_bytes = 0
+        self.epc_set = set()
+        self.mid_counts = dict()    # (message_id, message_type, init_by_reader) -> number of frames
+
+def replay_direction(raw_stream, rfidframe, tagframe, stats):
+    """ Unpack frames from raw_stream collected so far, decode them and count into stats """
+    while True:
+        if raw_stream.unpack() == -1:
+            print("Error from unpack(): " + raw_stream.geterr())
+        for __unknown in raw_stream.get_unknowns():
+            stats.unknown_bytes += len(__unknown)
+        if not raw_stream.frames:
+            return
+        __frames = raw_stream.frames
+        raw_stream.frames = list()
+        for __raw_frame in __frames:
+            rfidframe.clear()
+            rfidframe.frame_raw_line = __raw_frame
+            stats.frames += 1
+            if rfidframe.decodeFrame() != 0:
+                stats.frame_errors += 1
+                continue
+            __frame = (rfidframe.message_id, rfidframe.message_type, rfidframe.init_by_reader)
+            stats.mid_counts[__frame] = stats.mid_counts.get(__frame, 0) + 1
+            if __frame == (D.OP_READER_EPC_DATA_UPLOAD, D.TYPE_CONF_OPERATE, D.INIT_BY_READER):
+                stats.tag_frames += 1
+                tagframe.decodeTag(rfidframe.data_bytes)
+                if tagframe.decode_error:
+                    stats.tag_errors += 1
+                else:
+                    stats.epc_set.add(tagframe.EPC_code)
+
+def replay(capture_files, realtime=False, parse_limit=500, with_sent=False):
+    """ Replay capture files in the given order, returns tuple (stats of received, stats of sent, seconds spent) """
+    __streams = {clouprotocol.RawCapture.DIR_RECV: clouprotocol.ReceivedRawLine(parse_limit), clouprotocol.RawCapture.DIR_SENT: clouprotocol.ReceivedRawLine(parse_limit)}
+    __stats = {clouprotocol.RawCapture.DIR_RECV: ReplayStats(), clouprotocol.RawCapture.DIR_SENT: ReplayStats()}
+    rfidframe = clouprotocol.ClouRFIDFrame()
+    tagframe = clouprotocol.TagData()
+    __first_capture_time = None
+    __time_start = perf_counter()
+    for __capture_file in capture_files:
+        for __time_stamp, __direction, __data_bytes in clouprotocol.RawCapture.read(__capture_file):
+            if realtime:
+                if __first_capture_time is None:
+                    __first_capture_time = __time_stamp
+                __wait = (__time_stamp - __first_capture_time) - (perf_counter() - __time_start)
+                if __wait > 0:
+                    sleep(__wait)
+            __stats[__direction].chunks += 1
+            __stats[__direction].chunk_bytes += len(__data_bytes)
+            if (__direction == clouprotocol.RawCapture.DIR_SENT) and (not with_sent):
+                continue
+            __streams[__direction].add_to_stream(__data_bytes)
+            replay_direction(__streams[__direction], rfidframe, tagframe, __stats[__direction])
+    return (__stats[clouprotocol.RawCapture.DIR_RECV], __stats[clouprotocol.RawCapture.DIR_SENT], perf_counter() - __time_start)
+
+def print_stats(title, stats, time_spent):
+    """ Print counters of replay """
+    print(title + ": " + str(stats.chunks) + " chunks, " + str(stats.chunk_bytes) + " bytes, " + str(stats.frames) + " frames (" + str(stats.frame_errors) + " errors), " + str(stats.tag_frames) + " tag frames (" + str(stats.tag_errors) + " errors), " + str(len(stats.epc_set)) + " unique EPC, " + str(stats.unknown_bytes) + " unknown bytes")
+    if stats.frames and time_spent > 0:
+        print(title + ": " + "{0:.0f}".format(stats.frames / time_spent) + " frames per second, " + "{0:.2f}".format(time_spent * 1000000 / stats.frames) + " us per frame")
+    for __frame, __count in sorted(stats.mid_counts.items(), key=lambda __item: -__item[1]):
+        try:
+            __msid = D.DECODE_MID[__frame[1]][__frame[2]][__frame[0]]
+        except KeyError:
+            __msid = repr(__frame)
+        print("    " + __msid + " " + D.DECODE_PARAM_HEADER_INIT[__frame[2]] + ": " + str(__count))
+
+if __name__ == "__main__":
+    replay_files = [__arg for __arg in argv[1:] if not __arg.startswith("--")]
+    replay_realtime = "--realtime" in argv
+    replay_with_sent = "--sent" in argv
+    replay_parse_limit = 500
+    for __arg in argv[1:]:
+        if __arg.startswith("--parse-limit="):
+            replay_parse_limit = int(__arg.split("=", 1)[1])
+    if not replay_files:
+        print("Usage: clou_replay.py [--realtime] [--sent] [--parse-limit=N] capture files...")
+        exit()
+    stats_recv, stats_sent, replay_time_spent = replay(replay_files, replay_realtime, replay_parse_limit, replay_with_sent)
+    print("Replayed " + str(len(replay_files)) + " files in " + "{0:.3f}".format(replay_time_spent) + " s")
+    print_stats("Received", stats_recv, replay_time_spent)
+    if replay_with_sent:
+        print_stats("Sent", stats_sent, replay_time_spent)
+    else:
+        print("Sent: " + str(stats_sent.chunks) + " chunks, " + str(stats_sent.chunk_bytes) + " bytes")
@@ -0,0 +1,69 @@
+"""
+Application clou_trace,
+latency of stages of web API requests from trace log written by clouweb.py
+with "trace": true and "trace-log-file" set in clou.conf: web enqueue, connector pickup,
+frame encoded, bytes sent, reply frame received, reply written, web pickup;
+time of a stage is from the previous stage, percentiles to attribute tail latency
+
+python37 /usr/share/dev/clouweb/clou_trace.py /usr/share/dev/clouweb/log/trace.log
+
+options:
+--rid=<reader id> - only requests to this reader
+--method=<API method> - only requests of this API method, as query or getstatus
+--slowest=<N> - also print N slowest requests with their stages, 0 by default
+"""
+from sys import argv
+from json import loads
+import clouprotocol
+
+def read_traces(trace_files, rid=None, api_method=None):
+    """ List() of trace records of trace_files, filtered by rid and api_method if given, and number of timed out requests """
+    __records = list()
+    __timeouts = 0
+    for __trace_file_name in trace_files:
+        __trace_file = open(__trace_file_name, "r")
+        for __line in __trace_file:
+            try:
+                __record = loads(__line)
+            except ValueError:
+                continue
+            if ((rid is not None) and (__record.get("rid") != rid)) or ((api_method is not None) and (__record.get("api-method") != api_method)):
+                continue
+            if __record.get("status") == "504":
+                __timeouts += 1
+                continue
+            __records.append(__record)
+        __trace_file.close()
+    return (__records, __timeouts)
+
+def print_stages(title, stages):
+    """ Print seconds of stages as ms """
+    print(title + ", ".join(__stage + " " + "{0:.1f}".format(__seconds * 1000) for __stage, __seconds in stages))
+
+if __name__ == "__main__":
+    trace_files = [__arg for __arg in argv[1:] if not __arg.startswith("--")]
+    trace_rid = None
+    trace_method = None
+    trace_slowest = 0
+    for __arg in argv[1:]:
+        if __arg.startswith("--rid="):
+            trace_rid = __arg.split("=", 1)[1]
+        elif __arg.startswith("--method="):
+            trace_method = __arg.split("=", 1)[1]
+        elif __arg.startswith("--slowest="):
+            trace_slowest = int(__arg.split("=", 1)[1])
+    if not trace_files:
+        print("Usage: clou_trace.py [--rid=RID] [--method=METHOD] [--slowest=N] trace log files...")
+        exit()
+    trace_records, trace_timeouts = read_traces(trace_files, trace_rid, trace_method)
+    request_trace = clouprotocol.RequestTrace(max_samples_set=max(len(trace_records), 1))
+    for trace_record in trace_records:
+        request_trace.add(trace_record["trace"])
+    print(str(len(trace_records)) + " requests traced, " + str(trace_timeouts) + " timed out")
+    print("stage".ljust(18) + "".join(__col.rjust(10) for __col in ["count", "p50 ms", "p90 ms", "p99 ms", "max ms"]))
+    for trace_stage, trace_stats in request_trace.percentiles().items():
+        print(trace_stage.ljust(18) + str(trace_stats["count"]).rjust(10) + "".join("{0:.1f}".format(trace_stats[__col] * 1000).rjust(10) for __col in ["p50", "p90", "p99", "max"]))
+    if trace_slowest > 0:
+        print("Slowest requests:")
+        for trace_record in sorted(trace_records, key=lambda __record: -dict(clouprotocol.RequestTrace.stageTimes(__record["trace"])).get("total", 0.0))[:trace_slowest]:
+            print_stages("    " + trace_record["web-req-id"] + " " + trace_record["rid"] + " " + trace_record["api-method"] + ": ", clouprotocol.RequestTrace.stageTimes(trace_record["trace"]))
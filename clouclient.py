@@ -0,0 +1,289 @@
+"""
+Module clouclient,
+client for the web API of clouweb, to use from Python services
+instead of composing HTTP requests to /api/v1/<rid>/... by hand.
+Keeps HTTP/1.1 keep-alive connections in a pool and reuses them,
+runs calls for many readers in parallel in batches,
+and offers the same methods with asyncio interface.
+
+client = clouclient.ClouClient("http://testapp.viledadev.ru")
+status, reply = client.query("msk_cl7206b2", {"msid": "MAN_QUERY_INFO"})
+replies = client.batch([("getdatacount", "msk_cl7206b2", None), ("getdatacount", "spb_cl7206b2", None)])
+
+Every call returns tuple (HTTP status int(), reply decoded from JSON),
+if the call failed before HTTP status received, status is -1
+and reply is {"Error": "..."} - same as error replies of web API.
+"""
+import asyncio
+from http.client import HTTPConnection, HTTPSConnection, HTTPException, RemoteDisconnected
+from json import loads, dumps
+from threading import Lock
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+class ClouConnectionPool:
+    """ Pool of keep-alive HTTP connections to one web server """
+    def __init__(self, base_url_set, pool_size_set=8, timeout_set=10.0):
+        """
+        base_url_set - str() URL of web server, as "http://host:port"
+        pool_size_set - int() max number of idle connections kept in the pool
+        timeout_set - float() socket timeout of connections, seconds
+        """
+        assert isinstance(base_url_set, str), "base_url_set must be str()"
+        assert isinstance(pool_size_set, int) and (pool_size_set > 0), "pool_size_set must be positive int()"
+        __url = urlsplit(base_url_set)
+        assert __url.scheme in ["http", "https"], "base_url_set must start from http:// or https://"
+        self.__https = (__url.scheme == "https")
+        self.__host = __url.hostname
+        self.__port = __url.port
+        self.__timeout = timeout_set
+        self.__pool_size = pool_size_set
+        self.__idle = list()
+        self.__lock = Lock()
+    def get(self):
+        """ Take idle connection from the pool, or a new one, returns tuple (connection, is reused) """
+        with self.__lock:
+            if self.__idle:
+                return (self.__idle.pop(), True)
+        if self.__https:
+            return (HTTPSConnection(self.__host, self.__port, timeout=self.__timeout), False)
+        return (HTTPConnection(self.__host, self.__port, timeout=self.__timeout), False)
+    def put(self, http_conn):
+        """ Return connection to the pool after the response is fully read """
+        with self.__lock:
+            if len(self.__idle) < self.__pool_size:
+                self.__idle.append(http_conn)
+                return
+        http_conn.close()
+    def close(self):
+        """ Close all idle connections """
+        with self.__lock:
+            __to_close = self.__idle
+            self.__idle = list()
+        for __http_conn in __to_close:
+            __http_conn.close()
+
+class ClouClient:
+    """ Synchronous client of clouweb API """
+    # API methods changing state of connector, never repeated after the request is written
+    NOT_REPEATED = ("cleandata", "cleanstats", "shutdown")
+    def __init__(self, base_url_set, pool_size_set=8, timeout_set=10.0, api_prefix_set="/api/v1"):
+        """
+        base_url_set - str() URL of web server, as "http://host:port"
+        pool_size_set - int() max number of kept connections and of parallel calls in batch()
+        timeout_set - float() socket timeout, seconds; must be longer than reply-from-reader-timeout
+        in clou.conf, and longer than inventory duration for inventory()
+        api_prefix_set - str() path prefix of API
+        """
+        assert isinstance(api_prefix_set, str), "api_prefix_set must be str()"
+        self.__pool = ClouConnectionPool(base_url_set, pool_size_set, timeout_set)
+        self.__pool_size = pool_size_set
+        self.__api_prefix = "/" + api_prefix_set.strip("/")
+        self.__executor = None
+        self.__executor_lock = Lock()
+    def request(self, http_method, rid, api_path, payload=None):
+        """
+        Make one call of API, api_path is the part of path after /api/v1/<rid>/,
+        payload is dict() sent as JSON body, or None.
+        Returns tuple (HTTP status, decoded reply).
+        """
+        __path = self.__api_prefix + "/" + rid + "/" + api_path
+        __body = None
+        __headers = {"Connection": "keep-alive"}
+        if payload is not None:
+            __body = dumps(payload).encode("ascii")
+            __headers["Content-type"] = "application/json"
+        # Connection taken from the pool can be already closed by server after keep-alive
+        # timeout, in this case repeat once with the new connection, only when server
+        # closed it without any byte of response: failed writing the request, or no status
+        # line (RemoteDisconnected); never on timeout, and never for NOT_REPEATED methods
+        __is_repeatable = api_path.split("/", 1)[0].split("?", 1)[0] not in self.NOT_REPEATED
+        for __attempt in range(2):
+            __http_conn, __is_reused = self.__pool.get()
+            __is_written = False
+            try:
+                __http_conn.request(http_method, __path, body=__body, headers=__headers)
+                __is_written = True
+                __resp = __http_conn.getresponse()
+                __resp_data = __resp.read()
+            except (ConnectionError, HTTPException, OSError) as __exc_error_descr:
+                __http_conn.close()
+                if __is_reused and (__attempt == 0) and __is_repeatable and (isinstance(__exc_error_descr, RemoteDisconnected) or ((not __is_written) and isinstance(__exc_error_descr, (ConnectionResetError, BrokenPipeError)))):
+                    continue
+                return (-1, {"Error": "Error calling " + http_method + " " + __path + ": " + repr(__exc_error_descr)})
+            if __resp.will_close:
+                __http_conn.close()
+            else:
+                self.__pool.put(__http_conn)
+            if not __resp_data:
+                return (__resp.status, None)
+            try:
+                return (__resp.status, loads(__resp_data.decode("utf-8")))
+            except ValueError:
+                return (__resp.status, {"Error": "Reply is not JSON: " + repr(__resp_data[:200])})
+        return (-1, {"Error": "Error calling " + http_method + " " + __path})
+    def query(self, rid, query_content):
+        """ Send Clou command query_content = {"msid": ..., "prms": {...}} to reader rid """
+        return self.request("POST", rid, "query", query_content)
+    def getstatus(self, rid):
+        """ Status of connector of reader rid """
+        return self.request("GET", rid, "getstatus")
+    def getdata(self, rid):
+        """ Tags in buffer of connector of reader rid """
+        return self.request("GET", rid, "getdata")
+    def getdatacount(self, rid):
+        """ Number of tags in buffer of connector of reader rid """
+        return self.request("GET", rid, "getdatacount")
+    def cleandata(self, rid):
+        """ Erase tags in buffer of connector of reader rid """
+        return self.request("GET", rid, "cleandata")
+    def getstats(self, rid):
+        """ Aggregate statistics per EPC of reader rid, needs "tag-stats" on for the reader in config """
+        return self.request("GET", rid, "getstats")
+    def cleanstats(self, rid):
+        """ Erase aggregate statistics per EPC of reader rid """
+        return self.request("GET", rid, "cleanstats")
+    def update(self, rid):
+        """ Reload command reference in connector of reader rid """
+        return self.request("GET", rid, "update")
+    def shutdown(self, rid):
+        """ Shut down connector of reader rid """
+        return self.request("GET", rid, "shutdown")
+    def inventory(self, rid, duration, ant, dedupe="epc"):
+        """ Run inventory for duration seconds on antennas mask ant, reply comes after the window is over """
+        return self.request("POST", rid, "inventory", {"duration": duration, "ant": ant, "dedupe": dedupe})
+    def profile(self, rid, mode="stages", duration=10.0, top=30, sort=None, to_file=False):
+        """
+        Profile connector of reader rid for duration seconds, mode is "stages" for wall time
+        of main loop stages, "cprofile" or "sample"; reply comes after profiling is over
+        """
+        __prms = {"mode": mode, "duration": duration, "top": top, "file": to_file}
+        if sort is not None:
+            __prms["sort"] = sort
+        return self.request("POST", rid, "profile", __prms)
+    def memstats(self, rid, tracemalloc=None, top=20, key="lineno", frames=1, rebase=False):
+        """
+        Sizes of structures of connector of reader rid; tracemalloc "start", "snapshot",
+        "diff" (growth since start, with rebase since this diff next time) or "stop"
+        """
+        __prms = dict()
+        if tracemalloc is not None:
+            __prms = {"tracemalloc": tracemalloc, "top": top, "key": key, "frames": frames, "rebase": rebase}
+        return self.request("POST", rid, "memstats", __prms)
+    def submitjob(self, rid, job_content):
+        """ Submit job {"queries": [...]} or {"inventory": {...}}, reply contains "job-id" """
+        return self.request("POST", rid, "jobs", job_content)
+    def getjob(self, rid, job_id, wait=0.0):
+        """
+        State and results of job job_id at once, wait > 0 waits up to wait seconds for the job
+        to finish, capped by job-max-wait of web server; poll again for longer jobs
+        """
+        if wait > 0:
+            return self.request("GET", rid, "jobs/" + job_id + "?wait=" + repr(float(wait)))
+        return self.request("GET", rid, "jobs/" + job_id)
+    def batch(self, calls):
+        """
+        Run many calls in parallel over the pooled connections,
+        calls - list() of tuples (method name, rid, argument or None),
+        for example [("getdata", "rid1", None), ("query", "rid2", {"msid": "OP_STOP"})].
+        Returns list() of results in the same order as calls.
+        """
+        with self.__executor_lock:
+            if self.__executor is None:
+                self.__executor = ThreadPoolExecutor(max_workers=self.__pool_size)
+        __futures = list()
+        for __call in calls:
+            if __call[2] is None:
+                __futures.append(self.__executor.submit(getattr(self, __call[0]), __call[1]))
+            else:
+                __futures.append(self.__executor.submit(getattr(self, __call[0]), __call[1], __call[2]))
+        return [__future.result() for __future in __futures]
+    def batch_readers(self, method_name, rids):
+        """ Call the same method without arguments for each reader in rids, returns dict() rid -> result """
+        return dict(zip(rids, self.batch([(method_name, __rid, None) for __rid in rids])))
+    def close(self):
+        """ Close pooled connections and the batch threads """
+        if self.__executor is not None:
+            self.__executor.shutdown(wait=True)
+            self.__executor = None
+        self.__pool.close()
+
+class AsyncClouClient:
+    """
+    Asyncio interface of ClouClient, calls are run on the pooled
+    connections of ClouClient in its own threads, so the event loop
+    is never blocked while waiting for replies from readers
+    """
+    def __init__(self, base_url_set, pool_size_set=8, timeout_set=10.0, api_prefix_set="/api/v1"):
+        """ Parameters are the same as for ClouClient() """
+        self.__client = ClouClient(base_url_set, pool_size_set, timeout_set, api_prefix_set)
+        self.__executor = ThreadPoolExecutor(max_workers=pool_size_set)
+    async def request(self, http_method, rid, api_path, payload=None):
+        """ Same as ClouClient.request() """
+        return await asyncio.get_running_loop().run_in_executor(self.__executor, self.__client.request, http_method, rid, api_path, payload)
+    async def query(self, rid, query_content):
+        """ Same as ClouClient.query() """
+        return await self.request("POST", rid, "query", query_content)
+    async def getstatus(self, rid):
+        """ Same as ClouClient.getstatus() """
+        return await self.request("GET", rid, "getstatus")
+    async def getdata(self, rid):
+        """ Same as ClouClient.getdata() """
+        return await self.request("GET", rid, "getdata")
+    async def getdatacount(self, rid):
+        """ Same as ClouClient.getdatacount() """
+        return await self.request("GET", rid, "getdatacount")
+    async def cleandata(self, rid):
+        """ Same as ClouClient.cleandata() """
+        return await self.request("GET", rid, "cleandata")
+    async def getstats(self, rid):
+        """ Same as ClouClient.getstats() """
+        return await self.request("GET", rid, "getstats")
+    async def cleanstats(self, rid):
+        """ Same as ClouClient.cleanstats() """
+        return await self.request("GET", rid, "cleanstats")
+    async def update(self, rid):
+        """ Same as ClouClient.update() """
+        return await self.request("GET", rid, "update")
+    async def shutdown(self, rid):
+        """ Same as ClouClient.shutdown() """
+        return await self.request("GET", rid, "shutdown")
+    async def inventory(self, rid, duration, ant, dedupe="epc"):
+        """ Same as ClouClient.inventory() """
+        return await self.request("POST", rid, "inventory", {"duration": duration, "ant": ant, "dedupe": dedupe})
+    async def profile(self, rid, mode="stages", duration=10.0, top=30, sort=None, to_file=False):
+        """ Same as ClouClient.profile() """
+        __prms = {"mode": mode, "duration": duration, "top": top, "file": to_file}
+        if sort is not None:
+            __prms["sort"] = sort
+        return await self.request("POST", rid, "profile", __prms)
+    async def memstats(self, rid, tracemalloc=None, top=20, key="lineno", frames=1, rebase=False):
+        """ Same as ClouClient.memstats() """
+        __prms = dict()
+        if tracemalloc is not None:
+            __prms = {"tracemalloc": tracemalloc, "top": top, "key": key, "frames": frames, "rebase": rebase}
+        return await self.request("POST", rid, "memstats", __prms)
+    async def submitjob(self, rid, job_content):
+        """ Same as ClouClient.submitjob() """
+        return await self.request("POST", rid, "jobs", job_content)
+    async def getjob(self, rid, job_id, wait=0.0):
+        """ Same as ClouClient.getjob() """
+        if wait > 0:
+            return await self.request("GET", rid, "jobs/" + job_id + "?wait=" + repr(float(wait)))
+        return await self.request("GET", rid, "jobs/" + job_id)
+    async def batch(self, calls):
+        """ Same as ClouClient.batch() """
+        __coros = list()
+        for __call in calls:
+            if __call[2] is None:
+                __coros.append(getattr(self, __call[0])(__call[1]))
+            else:
+                __coros.append(getattr(self, __call[0])(__call[1], __call[2]))
+        return list(await asyncio.gather(*__coros))
+    async def batch_readers(self, method_name, rids):
+        """ Same as ClouClient.batch_readers() """
+        return dict(zip(rids, await self.batch([(method_name, __rid, None) for __rid in rids])))
+    def close(self):
+        """ Close pooled connections and threads """
+        self.__executor.shutdown(wait=True)
+        self.__client.close()
@@ -6,22 +6,40 @@ This application is built on the Clou Hopeland
 proprietary reader connection protocol.
 
 python37 /usr/share/dev/clouweb/cloucon.py msk_cl7206b2 /usr/share/dev/clouweb/clou.conf +0300 &
+
+or all readers of readers-list in one process, one asyncio task per reader:
+
+python37 /usr/share/dev/clouweb/cloucon.py --all /usr/share/dev/clouweb/clou.conf +0300 &
+
+with --all nothing blocks the event loop shared by readers: reader sockets are
+non-blocking and written by the loop, fme is scanned and written in worker threads,
+log lines always go by the writer thread and are dropped when its queue is full
 https://stackoverflow.com/questions/4465959/python-errno-98-address-already-in-use
 https://stackoverflow.com/questions/337115/setting-time-wait-tcp
 sudo tcpdump -nn -vv -A "tcp and (not dst port 22) and (not src port 22) and ((src host 178.176.12.1) or (dst host 178.176.12.1))"
 
 """
-from socket import socket, AF_INET, SOCK_STREAM, SHUT_RDWR, SOL_SOCKET, SO_REUSEADDR, timeout, setdefaulttimeout
-from time import time, strftime, gmtime
-from sys import argv
-from json import load
+from socket import socket, socketpair, AF_INET, SOCK_STREAM, SHUT_RDWR, SOL_SOCKET, SO_REUSEADDR, timeout
+from time import time, sleep, strftime, gmtime, perf_counter
+from sys import argv, _current_frames
+from json import load, dumps
 from copy import deepcopy
+from collections import deque
+from threading import Thread, Lock, get_ident
+import heapq
 import os
+import selectors
+import asyncio
+import multiprocessing
+import cProfile
+import gc
+import pstats
 import ntplib
 import clouprotocol
 import fme
 
-# First command line argument is self reader ID = parameter rid in API
+# First command line argument is self reader ID = parameter rid in API,
+# or --all to serve all readers from readers-list in one process
 own_instance_id = str(argv[1])
 
 # Second command line argument is a file name of config file
@@ -63,15 +81,6 @@ except Exception:
     print("Exiting the process")
     exit()
 
-# Create multiple timers dict and register the uptime
-timers_dict = {
-    "process-up-since": time(),
-    "reader-last-act-time": None,
-    "time-since-clock-check": None,
-    "reader-connected-since": None,
-    "reader-disconnected-since": None
-}
-
 # Close config file
 try:
     config_fd.close()
@@ -80,21 +89,57 @@ except Exception:
     print("Exiting the process")
     exit()
 
-# Launch the logging instance
-log = clouprotocol.ClouLogging(cfg["log-dir"], "cloucon-" + own_instance_id, timezone_set=log_time_zone_str, log_stdout_set=False)
+# Readers served by this process
+if own_instance_id == "--all":
+    readers_to_serve = list(cfg["readers-list"])
+    log_instance_name = "cloucon-all"
+else:
+    readers_to_serve = [own_instance_id]
+    log_instance_name = "cloucon-" + own_instance_id
+
+# Worker processes decoding tag data frames of readers with "tag-decode-workers", forked here,
+# before the log writer, clock and reader I/O threads are started, so the workers get no
+# copies of locks held by other threads; forked and not spawned, to not run this config part again
+tag_decode_processes = dict()
+try:
+    for __rid in readers_to_serve:
+        if int(cfg[__rid].get("tag-decode-workers", 0)) > 0:
+            tag_decode_processes[__rid] = multiprocessing.get_context("fork").Pool(int(cfg[__rid]["tag-decode-workers"]))
+except Exception as __exc_error_descr:
+    print("Can't start tag decoding worker processes: " + repr(__exc_error_descr))
+    print("Exiting the process")
+    exit()
+
+# Launch the logging instance, one for all readers served, lines are written
+# by background thread so logging does not stall the main loop; with --all always,
+# and never waiting for the writer, as the event loop is shared by readers
+try:
+    log_queue_size = int(cfg.get("log-queue-size", 10000))
+    log_queue_policy = cfg.get("log-queue-policy", "drop")
+    if own_instance_id == "--all":
+        log_queue_size = log_queue_size if log_queue_size > 0 else 10000
+        log_queue_policy = "drop"
+    log = clouprotocol.ClouLogging(cfg["log-dir"], log_instance_name, timezone_set=log_time_zone_str, log_stdout_set=False, queue_size_set=log_queue_size, queue_policy_set=log_queue_policy)
+    # Levels of categories: frames - frames to / from reader, api - requests from web and replies,
+    # tags - tag data frames, timing - clock checks; objects in messages are repr() with size caps
+    log.set_levels(cfg.get("log-levels", dict()), int(cfg.get("log-repr-max-chars", 2000)), int(cfg.get("log-repr-max-items", 50)))
+except Exception as __exc_error_descr:
+    print("Can't start logging: " + repr(__exc_error_descr))
+    print("Exiting the process")
+    exit()
 log.log("Launched app!")
-log.log("rid = [" + own_instance_id + "]")
+log.log("rid = [" + ", ".join(readers_to_serve) + "]")
 log.log("conf file = " + conf_file_name)
 print("\nLaunched app!\n")
 
-# Check reader ID in config
-if own_instance_id not in cfg["readers-list"]:
-    log.log("rid = [" + own_instance_id + "] not set in config list, exiting the process")
-    log.log("Exiting the process")
-    exit()
-else:
-    if own_instance_id not in cfg.keys():
-        log.log("rid = [" + own_instance_id + "] set in config list, but settings key not found, exiting the process")
+# Check reader IDs in config
+for __rid in readers_to_serve:
+    if __rid not in cfg["readers-list"]:
+        log.log("rid = [" + __rid + "] not set in config list, exiting the process")
+        log.log("Exiting the process")
+        exit()
+    elif __rid not in cfg.keys():
+        log.log("rid = [" + __rid + "] set in config list, but settings key not found, exiting the process")
         log.log("Exiting the process")
         exit()
 
@@ -105,71 +150,60 @@ except Exception:
     log.log("Exiting the process")
     exit()
 
-# Create specific dict() for reader parameters for rid = own_instance_id
-cfgrid = cfg[own_instance_id]
-
-# NTP clock check
+# How long finished jobs results are kept for polling by web API
 try:
-    ntp_check_interval = cfgrid["ntp-check-interval"]
-    ntp_check_log = list()
-    ntp_service = ntplib.NTPClient()
-    ntp_service_response = ntp_service.request(cfg["ntp-service-url"], version=3)
-    if abs(ntp_service_response.offset) > cfg["max-server-time-offset"]:
-        log.log('Server time too far from NTP time at ' + cfg["ntp-service-url"] + ', offset = ' + repr(ntp_service_response.offset))
-        log.log("Exiting the process")
-        exit()
-    timers_dict["time-since-clock-check"] = time()
-    ntp_check_log.append(abs(ntp_service_response.offset))
-except Exception as __exc_error_descr:
-    log.log("Error checking clock via NTP service" + repr(__exc_error_descr))
+    job_result_ttl = float(cfg.get("job-result-ttl", 600.0))
+except Exception:
+    log.log('Can not load ["job-result-ttl"] from config')
     log.log("Exiting the process")
     exit()
 
-# Set basic sockets for server socket
-setdefaulttimeout(cfgrid["sock-timeout"])
-log.log("Expecting that reader is in " + cfgrid["reader-mode"] + " mode")
-if cfgrid["reader-mode"] == "client":
-    srv_basic_sock = socket(AF_INET, SOCK_STREAM)
-    srv_basic_sock.setsockopt(SOL_SOCKET, SO_REUSEADDR, 1)
-    srv_basic_sock.bind((cfgrid["host"], cfgrid["port"]))
-    srv_basic_sock.listen(1)
-    log.log("Listening for incoming connection at " + cfgrid["host"] + ":" + str(cfgrid["port"]))
-elif cfgrid["reader-mode"] == "server":
-    rid_sock = socket(AF_INET, SOCK_STREAM)
-    log.log("Connecting to " + cfgrid["host"] + ":" + str(cfgrid["port"]))
-else:
-    log.log("Unknown reader-mode: " + cfgrid["reader-mode"] + ", exiting the process")
+# Limits of tag buffer of each reader, 0 means no limit, and what to do when reached
+try:
+    tag_buf_max_records = int(cfg.get("tag-buf-max-records", 0))
+    tag_buf_max_bytes = int(cfg.get("tag-buf-max-bytes", 0))
+    tag_buf_overflow_policy = str(cfg.get("tag-buf-overflow-policy", "drop-oldest"))
+    assert (tag_buf_max_records >= 0) and (tag_buf_max_bytes >= 0)
+    assert tag_buf_overflow_policy in clouprotocol.TagBuffer.OVERFLOW_POLICIES
+    tag_stats_max_records = int(cfg.get("tag-stats-max-records", 0))
+    assert tag_stats_max_records >= 0
+except Exception:
+    log.log('Can not load ["tag-buf-max-records"], ["tag-buf-max-bytes"], ["tag-buf-overflow-policy"] or ["tag-stats-max-records"] from config')
+    log.log("Exiting the process")
     exit()
 
-# Create main SessionState instance
-session_state = clouprotocol.SessionState()
-
-# Create raw stream processing instance
-raw_stream = clouprotocol.ReceivedRawLine(cfgrid["parse-limit"])
-
-# Create frame list for priority sending to reader - replying on urgent confirmation requests from reader
-frames_line_to_snd_1st = bytes() # 1st priority
-
-# Create frame list for standard priority sending to reader
-frames_line_to_snd_std = bytes() # 1st priority
+# Metrics of connectors given out to web "/metrics" in Prometheus text format, off by default
+try:
+    metrics_on = bool(cfg.get("metrics", False))
+except Exception:
+    log.log('Can not load ["metrics"] from config')
+    log.log("Exiting the process")
+    exit()
 
-# Create the decoded frames list, this will be a list of dicts containing received
-# and decoded frames but not yet processed and not yet matched as replies from
-# reader on previously sent request frames
-decoded_frames_list_dicts = list()
+# Priority classes of commands set in config over the defaults of CommandScheduler(),
+# class names are checked when the scheduler of reader is created
+try:
+    cmd_priority = dict(cfg.get("cmd-priority", dict()))
+except Exception:
+    log.log('Can not load ["cmd-priority"] from config')
+    log.log("Exiting the process")
+    exit()
 
-# Create list of API requests tuples, first "to send" buffer list, second - "successfully sent"
-# buffer for further processing; in each tuple the info about time, request ID from web,
-# the content of request, etc.; next step - matching incoming frames from reader with the
-# list of "successfully sent" tuples in chrono order - from oldest to latest, by MID and if ERR_WARN
-# as well
-queue_to_send = list()
-queue_sent = list()
+# Sequences of commands run by the connector itself: "on-connect" is dict() rid -> list() of
+# queries {"msid": ..., "prms": {...}} as in CLU requests from web, run as a job in order after
+# every connect to reader; msid are checked when the connector of reader is created
+try:
+    on_connect_sequences = dict()
+    for __sequence in cfg.get("sequences", list()):
+        for __rid, __queries in __sequence.get("on-connect", dict()).items():
+            on_connect_sequences.setdefault(__rid, list()).extend(list(__queries))
+except Exception:
+    log.log('Can not load ["sequences"] from config')
+    log.log("Exiting the process")
+    exit()
 
-# Create lists of frames dicts for further logging
-frames_to_log_list_received = list()    # List of dicts received from reader - further used only for logging
-frames_to_log_list_sent = list()        # List of dicts sent to reader - further used only for logging
-std_frames_to_log_list_sent = list()        # List of dicts sent to reader - further used only for logging
+# Instances below are shared by all readers served, each of them is used
+# within one pass of one reader and cleared before use
 
 # Create ClouRFIDFrame() instance for encoding / decoding frames
 rfidframe = clouprotocol.ClouRFIDFrame()
@@ -181,9 +215,8 @@ tagframe_tolog = clouprotocol.TagData()
 # Create TagData() instance for decoding tag data frames
 tagframe = clouprotocol.TagData()
 
-# Create tag buffer for storing read tags
-tag_buf = list()
-tag_buf_match_duplicates = list()
+# Optional tag parameters not compared when checking tags for duplicates
+tag_dedupe_exclude = frozenset(cfg["tag-param-duplicate-exclude"])
 
 # Create ClouProtocolDefinitions() instance
 D = clouprotocol.ClouProtocolDefinitions()
@@ -206,701 +239,2340 @@ except Exception:
 # Create PackDataToClou() instance
 packframes = clouprotocol.PackDataToClou(cfg["cmds-dir"])
 
-# Create FileMessageExchange() instance
-fme_msg = fme.FileMessageExchange(str(own_instance_id), ("/" + cfg["clou-run"].strip("/") + "/" + str(own_instance_id)), message_types_set=["CLU", "STS"])
+def etag_matches(if_none_match, etag):
+    """ True if If-None-Match header value from web matches etag """
+    if not isinstance(if_none_match, str):
+        return False
+    for __etag_item in if_none_match.split(","):
+        __etag_item = __etag_item.strip()
+        if __etag_item.startswith("W/"):
+            __etag_item = __etag_item[2:]
+        if (__etag_item == "*") or (__etag_item == etag):
+            return True
+    return False
 
-# Create lists for storing received API requests from web API of two types
-# CLU for clou protocol queries, STS for status queries
-fme_CLU_recv_list = list()
-fme_STS_recv_list = list()
+def reply_is_ok(rcv_dict):
+    """ True if unpacked reply from reader is not an error and all result fields have OK values """
+    if rcv_dict.get("msid") == "ERR_MID":
+        return False
+    for __rcv_prm in rcv_dict.get("prms", dict()).values():
+        if __rcv_prm.get("is-res-field") and (__rcv_prm.get("val") != __rcv_prm.get("OK-value")):
+            return False
+    return True
 
-# =================== MAIN LOOP START ===================
-while True:
+class ReaderLog:
+    """ Logging of one reader in the log shared by all readers of the process, messages prefixed with rid """
+    def __init__(self, log_set, rid_set):
+        self.__log = log_set
+        self.__prefix = "[" + rid_set + "] "
+    def log(self, log_text, *args, **kwargs):
+        """ Same as ClouLogging.log() """
+        if log_text:
+            log_text = self.__prefix + log_text
+        return self.__log.log(log_text, *args, **kwargs)
+    def logc(self, category, level, message_format, *format_args, **log_kwargs):
+        """ Same as ClouLogging.logc() """
+        return self.__log.logc(category, level, self.__prefix.replace("%", "%%") + message_format, *format_args, **log_kwargs)
+    def enabled(self, category, level="info"):
+        """ Same as ClouLogging.enabled() """
+        return self.__log.enabled(category, level)
+
+class ClockService:
+    """
+    NTP clock check, one for all readers served by the process;
+    after start() checks run in a background thread, so a slow NTP
+    service never blocks the loop serving readers, which only reads
+    the last offset and healthy()
+    """
+    def __init__(self, ntp_url_set, check_interval_set):
+        """
+        ntp_url_set - str() NTP service host
+        check_interval_set - float() seconds between checks
+        """
+        self.ntp_url = ntp_url_set
+        self.check_interval = float(check_interval_set)
+        self.check_log = list()         # Offsets of last 100 checks
+        self.last_check = None          # Time of last successful check
+        self.last_offset = None         # Offset got by last successful check
+        self.last_error = None          # repr() of error of last check, None if it was successful
+        self.__next_check = time()
+        self.__thread = None
+        self.__ntp_service = ntplib.NTPClient()
+    def request(self):
+        """ Ask NTP service, returns the response, can run in a thread """
+        return self.__ntp_service.request(self.ntp_url, version=3)
+    def record(self, ntp_service_response):
+        """ Store offset from NTP service response and log it """
+        self.check_log.append(abs(ntp_service_response.offset))
+        if len(self.check_log) > 100:
+            self.check_log.pop(0)
+        __ntp_avg = float(sum(self.check_log) / float(len(self.check_log)))
+        __ntp_max = float(max(self.check_log))
+        if abs(ntp_service_response.offset) > cfg["max-server-time-offset"]:
+            log.logc("timing", "warning", "NTP check %s, got offset = %s: WARNING : server time too far from NTP time, max = %s, avg = %s", self.ntp_url, ntp_service_response.offset, __ntp_max, __ntp_avg)
+        else:
+            log.logc("timing", "info", "NTP check %s, got offset = %s: OK, max = %s, avg = %s", self.ntp_url, ntp_service_response.offset, __ntp_max, __ntp_avg)
+        self.last_offset = ntp_service_response.offset
+        self.last_error = None
+        self.last_check = time()
+        self.__next_check = self.last_check + self.check_interval
+    def failed(self, exc_error_descr):
+        """ Log failed check, next try in a minute or check interval if shorter """
+        log.log("Error checking clock via NTP service: " + repr(exc_error_descr))
+        self.last_error = repr(exc_error_descr)
+        self.__next_check = time() + min(60.0, self.check_interval)
+    def check(self):
+        """ Run the check now """
+        try:
+            self.record(self.request())
+        except Exception as __exc_error_descr:
+            self.failed(__exc_error_descr)
+    def next_check(self):
+        """ Time of the next check """
+        return self.__next_check
+    def start(self):
+        """ Run checks in a daemon thread from now on """
+        if self.__thread is None:
+            self.__thread = Thread(target=self.__run, name="clock-service", daemon=True)
+            self.__thread.start()
+    def __run(self):
+        while True:
+            sleep(max(0.0, self.__next_check - time()))
+            self.check()
+    def healthy(self):
+        """ True if the last check was successful, in time and offset is within max-server-time-offset """
+        if (self.last_check is None) or (self.last_offset is None) or (self.last_error is not None):
+            return False
+        if (time() - self.last_check) > (2 * self.check_interval):
+            return False
+        return abs(self.last_offset) <= cfg["max-server-time-offset"]
+    def status(self):
+        """ Dict() of the clock health for getstatus """
+        return {
+            "healthy": self.healthy(),
+            "last-offset": self.last_offset,
+            "last-error": self.last_error,
+            "next-check": self.__next_check,
+            "in-thread": self.__thread is not None
+        }
+
+class SentQueue:
+    """
+    Commands sent to reader and waiting for reply, indexed by the reply expected:
+    tuple (message_id, message_type, init_by_reader) computed once at enqueue,
+    each key has FIFO deque() of commands, so a reply is matched to the oldest
+    command waiting for it in O(1); expiry goes by the heap of deadlines
+    """
+    def __init__(self):
+        self.__pending = dict()     # reply key -> deque() of [fme item, is pending, time sent]
+        self.__deadlines = list()   # heap of (deadline, seq, [fme item, is pending, time sent], reply key)
+        self.__seq = 0
+        self.__len = 0
+        self.__waiting = dict()     # reply key -> number of pending items
+        self.matched_sent_time = None   # time sent of the fme item last taken by match()
+    def __len__(self):
+        return self.__len
+    def waiting(self, reply_key):
+        """ Number of commands waiting for reply_key """
+        return self.__waiting.get(reply_key, 0)
+    def add(self, reply_key, queue_item, deadline, sent_time=None):
+        """ Put fme item queue_item sent at sent_time waiting for reply_key until deadline """
+        __entry = [queue_item, True, sent_time]
+        if reply_key not in self.__pending:
+            self.__pending[reply_key] = deque()
+        self.__pending[reply_key].append(__entry)
+        self.__seq += 1
+        heapq.heappush(self.__deadlines, (deadline, self.__seq, __entry, reply_key))
+        self.__len += 1
+        self.__waiting[reply_key] = self.__waiting.get(reply_key, 0) + 1
+    def match(self, reply_key):
+        """ Take the oldest fme item waiting for reply_key, or None """
+        __queue = self.__pending.get(reply_key)
+        while __queue:
+            __entry = __queue.popleft()
+            if __entry[1]:
+                __entry[1] = False
+                self.__len -= 1
+                self.__release(reply_key)
+                if not __queue:
+                    del self.__pending[reply_key]
+                self.matched_sent_time = __entry[2]
+                return __entry[0]
+        if __queue is not None:
+            del self.__pending[reply_key]
+        return None
+    def expire(self, now):
+        """ Take out all fme items with deadline passed by now, returns list() of them """
+        __expired = list()
+        while self.__deadlines and (self.__deadlines[0][0] <= now):
+            __deadline_item = heapq.heappop(self.__deadlines)
+            __entry = __deadline_item[2]
+            if __entry[1]:
+                # Left in its deque, skipped there by match()
+                __entry[1] = False
+                self.__len -= 1
+                self.__release(__deadline_item[3])
+                __expired.append(__entry[0])
+                # Expired at the head of the deque are taken out now,
+                # as the reply they wait for may never come
+                __queue = self.__pending.get(__deadline_item[3])
+                while __queue and (not __queue[0][1]):
+                    __queue.popleft()
+                if (__queue is not None) and (not __queue):
+                    del self.__pending[__deadline_item[3]]
+        return __expired
+    def __release(self, reply_key):
+        """ One command less waiting for reply_key """
+        self.__waiting[reply_key] -= 1
+        if self.__waiting[reply_key] == 0:
+            del self.__waiting[reply_key]
+    def stats(self):
+        """ Dict() of pending items, reply keys, and entries kept in deques and heap, matched or expired included """
+        return {"pending": self.__len, "reply-keys": len(self.__pending), "deque-entries": sum(len(__queue) for __queue in self.__pending.values()), "heap-entries": len(self.__deadlines)}
+    def next_deadline(self):
+        """ The nearest deadline of pending items, or None """
+        while self.__deadlines and (not self.__deadlines[0][2][1]):
+            heapq.heappop(self.__deadlines)
+        if self.__deadlines:
+            return self.__deadlines[0][0]
+        return None
+
+def reply_match_key(msid):
+    """ Tuple (message_id, message_type, init_by_reader) of reply to command msid by its "rcv" template """
+    __rcv_match = cmd_ref_dict[msid]["rcv"]
+    __message_type = D.PARAM_HEADER_TYPE[__rcv_match["mtyp"]]
+    __init_by_reader = D.PARAM_HEADER_INIT[__rcv_match["init"]]
+    return (D.MID[__message_type][__init_by_reader][__rcv_match["msid"]], __message_type, __init_by_reader)
 
-    # If not connected
-    if not session_state.connected:
-        # Connection procedure
+class CommandScheduler:
+    """
+    Commands from web and jobs waiting to be sent to reader, in priority classes:
+    stop and control first, then configuration, then queries, FIFO within a class.
+    At most window_set commands are in flight (sent or to send, without reply yet),
+    control commands are not held by the window; with serialize_set only one command
+    at a time waits for the same reply key, as replies with the same MID can not be
+    told apart; commands whose web caller timed out are dropped without sending,
+    steps of jobs have no deadline here, as no web caller waits for them
+    """
+    CLASSES = ("control", "config", "query")
+    DEFAULT_CLASSES = {"OP_STOP": "control", "MAN_RESTART": "control", "MAN_CONN_CONFIRM": "control", "MAN_CONF_TIME": "control"}
+    def __init__(self, window_set, serialize_set, priority_map_set):
+        """
+        window_set - int() max commands in flight, 0 means no limit
+        serialize_set - bool() one command in flight per reply key
+        priority_map_set - dict() msid -> class name from CLASSES, over the defaults
+        """
+        self.window = window_set
+        self.serialize = serialize_set
+        for __msid, __class_name in priority_map_set.items():
+            if __class_name not in self.CLASSES:
+                raise ValueError("Unknown priority class " + repr(__class_name) + " of " + repr(__msid) + " in cmd-priority")
+        self.__class_of_msid = dict(self.DEFAULT_CLASSES)
+        self.__class_of_msid.update(priority_map_set)
+        self.__queues = {__class_name: deque() for __class_name in self.CLASSES}   # class -> deque() of (fme item, reply key, deadline)
+        self.dropped = 0
+    def __len__(self):
+        return sum(len(__queue) for __queue in self.__queues.values())
+    def class_of(self, msid):
+        """ Priority class of command msid: set in config or defaults, queries by name, the rest is configuration """
+        if msid in self.__class_of_msid:
+            return self.__class_of_msid[msid]
+        if "_QUERY_" in msid:
+            return "query"
+        return "config"
+    def add(self, fme_item, deadline):
+        """
+        Put fme item of a command to its class with deadline to drop it, None - never dropped;
+        the reply key is computed once here, None for unknown msid, such a command fails
+        later at packing as before
+        """
+        __msid = str(fme_item[0]["query-content"].get("msid", str()))
+        __reply_key = None
+        if __msid in cmd_ref_dict:
+            __reply_key = reply_match_key(__msid)
+        self.__queues[self.class_of(__msid)].append((fme_item, __reply_key, deadline))
+    def take(self, now, in_flight, queue_sent, busy_keys):
+        """
+        Take commands to send now, returns tuple (list() of (fme item, reply key) in order
+        of sending, list() of fme items dropped as web caller timed out)
+        now - current time
+        in_flight - number of commands sent or to send without reply yet
+        queue_sent - SentQueue() of commands waiting for reply
+        busy_keys - set() of reply keys of commands to send not yet in queue_sent
+        """
+        __to_send = list()
+        __dropped = list()
+        __busy_keys = set(busy_keys)
+        for __class_name in self.CLASSES:
+            __queue = self.__queues[__class_name]
+            __left = deque()
+            while __queue:
+                __fme_item, __reply_key, __deadline = __queue.popleft()
+                if (__deadline is not None) and (now >= __deadline):
+                    __dropped.append(__fme_item)
+                    continue
+                if self.__held(__class_name, __reply_key, in_flight, queue_sent, __busy_keys):
+                    __left.append((__fme_item, __reply_key, __deadline))
+                    continue
+                __to_send.append((__fme_item, __reply_key))
+                __busy_keys.add(__reply_key)
+                in_flight += 1
+            self.__queues[__class_name] = __left
+        self.dropped += len(__dropped)
+        return (__to_send, __dropped)
+    def ready(self, now, in_flight, queue_sent, busy_keys):
+        """ True if take() with the same arguments would take or drop anything """
+        for __class_name in self.CLASSES:
+            for __fme_item, __reply_key, __deadline in self.__queues[__class_name]:
+                if ((__deadline is not None) and (now >= __deadline)) or (not self.__held(__class_name, __reply_key, in_flight, queue_sent, busy_keys)):
+                    return True
+        return False
+    def __held(self, class_name, reply_key, in_flight, queue_sent, busy_keys):
+        """ True if command has to wait: no room in the window, or the same reply is awaited """
+        if (class_name != "control") and (self.window > 0) and (in_flight >= self.window):
+            return True
+        return self.serialize and (reply_key is not None) and ((reply_key in busy_keys) or (queue_sent.waiting(reply_key) > 0))
+    def discard_job(self, job_id):
+        """ Take out waiting commands of job job_id, returns list() of their fme items """
+        __discarded = list()
+        for __class_name in self.CLASSES:
+            __left = deque()
+            for __item in self.__queues[__class_name]:
+                if __item[0][0].get("job-id") == job_id:
+                    __discarded.append(__item[0])
+                else:
+                    __left.append(__item)
+            self.__queues[__class_name] = __left
+        return __discarded
+    def next_deadline(self):
+        """ The nearest deadline of waiting commands, or None """
+        __deadlines = [__item[2] for __queue in self.__queues.values() for __item in __queue if __item[2] is not None]
+        if __deadlines:
+            return min(__deadlines)
+        return None
+    def stats(self):
+        """ Dict() of waiting commands per class, window and dropped count """
+        __stats = {__class_name: len(__queue) for __class_name, __queue in self.__queues.items()}
+        __stats["window"] = self.window
+        __stats["serialize"] = self.serialize
+        __stats["dropped"] = self.dropped
+        return __stats
+
+class ReaderIO(Thread):
+    """
+    Thread owning the reading from socket connected to reader, if "io-thread" is on:
+    it frames the stream and answers MAN_READER_CONN_CONFIRM and tag data frames right away
+    from precomputed ReplyTemplate(), so confirmations do not wait for the main loop;
+    all decoded frames as ReceivedFrame() go to the main loop through deque() frames,
+    and the main loop is woken up via wake_sock. Sending is shared with the main loop by send()
+    """
+    def __init__(self, sock_set, raw_stream_set, capture_set, timers_set, log_set):
+        """
+        sock_set - socket connected to reader, with timeout
+        raw_stream_set - ReceivedRawLine() of connector, not used by main loop while the thread runs
+        capture_set - RawCapture() or None
+        timers_set - timers dict() of connector, "reader-last-act-time" is updated here
+        log_set - logging instance with log() method
+        """
+        Thread.__init__(self, daemon=True)
+        self.sock = sock_set
+        self.capture = capture_set
+        self.timers = timers_set
+        self.log = log_set
+        self.frames = deque()       # ReceivedFrame() of all frames received, taken by main loop
+        self.unknowns = deque()     # unknown bytes() received
+        self.conn_confirms_sent = 0 # MAN_CONN_CONFIRM sent
+        self.tag_confirms_sent = 0  # MAN_TAG_DATA_RESPONSE sent
+        self.lost = False           # connection lost, thread is over
+        self.__stop = False
+        self.__send_lock = Lock()
+        self.__raw_stream = raw_stream_set
+        self.__rfidframe = clouprotocol.ClouRFIDFrame()
+        self.__tagframe = clouprotocol.TagData()
+        self.__conn_confirm = clouprotocol.ReplyTemplate(D.MAN_CONN_CONFIRM, D.TYPE_CONF_MANAGE, D.INIT_BY_USER, 4)
+        self.__tag_confirm = clouprotocol.ReplyTemplate(D.MAN_TAG_DATA_RESPONSE, D.TYPE_CONF_MANAGE, D.INIT_BY_USER, 4)
+        self.wake_sock, self.__wake_sock_snd = socketpair()
+        self.wake_sock.setblocking(False)
+        self.__wake_sock_snd.setblocking(False)
+    def send(self, data_bytes):
+        """ Send data_bytes to reader, from this thread or main loop, returns time sent """
+        with self.__send_lock:
+            self.sock.sendall(data_bytes)
+            __sent_time = time()
+            self.__capture_write(clouprotocol.RawCapture.DIR_SENT, data_bytes, __sent_time)
+        return __sent_time
+    def __capture_write(self, direction, data_bytes, time_stamp):
+        """ Put bytes into capture if on, on error capture is off for the thread, connection is not touched """
+        if self.capture is None:
+            return
         try:
-            if cfgrid["reader-mode"] == "client":
-                rid_sock, rid_accepted_addr = srv_basic_sock.accept()
-                log.log('Accepted connection from ' + rid_accepted_addr[0] + ":" + str(rid_accepted_addr[1]) + "!")
-            elif cfgrid["reader-mode"] == "server":
-                rid_sock.connect((cfgrid["host"], cfgrid["port"]))
-                log.log('Connected to reader ' + cfgrid["host"] + ":" + str(cfgrid["port"]) + "!")
-            session_state.connected = True
-            timers_dict["reader-connected-since"] = time()
-            timers_dict["reader-last-act-time"] = time()
-            timers_dict["reader-disconnected-since"] = None
-        except Exception as sock_exception_err:
-            session_state.connected = False
-            if not isinstance(sock_exception_err, timeout):
-                timers_dict["reader-connected-since"] = None
-                timers_dict["reader-disconnected-since"] = None
-                log.log("Error during establishing connection")
-
-    # If connected
-    elif session_state.connected:
-
-        # Reading incoming stream from scanner
-        recv_chunk = bytes()
-        recv_chunk_time_to_log = float()
+            self.capture.write(direction, data_bytes, time_stamp)
+        except Exception as __exc_error_descr:
+            self.capture = None
+            self.log.log("Reader I/O thread: error writing capture, capture is off: " + repr(__exc_error_descr))
+    def wake_drain(self):
+        """ Read out wake-ups sent to main loop """
+        while True:
+            try:
+                self.wake_sock.recv(4096)
+            except OSError:
+                return
+    def __wake(self):
         try:
-            recv_chunk = rid_sock.recv(2**12)   # Recieve data from socket
-            if recv_chunk:
-                recv_chunk_time_to_log = time()
-                timers_dict["reader-last-act-time"] = recv_chunk_time_to_log
-        except Exception as sock_read_err:
-            recv_chunk = bytes()
-            if not isinstance(sock_read_err, timeout):
-                session_state.connected = False
-                timers_dict["reader-connected-since"] = None
-                timers_dict["reader-disconnected-since"] = time()
-                log.log("Lost connection!")
-
-        # If received data not empty, add it to the stream processing instance
+            self.__wake_sock_snd.send(b"W")
+        except OSError:
+            # Main loop has not read out previous wake-ups yet, so it is awake anyway
+            pass
+    def run(self):
+        # Any unexpected error ends the thread as lost connection, main loop is woken up to handle it
         try:
-            if recv_chunk:
-                raw_stream.add_to_stream(recv_chunk)
-        except Exception:
-            log.log("Error adding recv_chunk to ReceivedRawLine() instance")
+            self.__run_loop()
+        except Exception as __exc_error_descr:
+            self.lost = True
+            self.log.log("Reader I/O thread stopped on error: " + repr(__exc_error_descr))
+            self.__wake()
+    def __run_loop(self):
+        while not self.__stop:
+            try:
+                __recv_chunk = self.sock.recv(2**12)
+                if not __recv_chunk:
+                    raise ConnectionError("Connection closed by reader")
+            except timeout:
+                continue
+            except Exception as __exc_error_descr:
+                if not self.__stop:
+                    self.lost = True
+                    self.log.log("Reader I/O thread: " + repr(__exc_error_descr))
+                    self.__wake()
+                return
+            __recv_time = time()
+            self.timers["reader-last-act-time"] = __recv_time
+            self.__capture_write(clouprotocol.RawCapture.DIR_RECV, __recv_chunk, __recv_time)
+            self.__raw_stream.add_to_stream(__recv_chunk)
+            __confirms = list()
+            while True:
+                if self.__raw_stream.unpack() == -1:
+                    self.log.log("Reported error from unpack(): " + self.__raw_stream.geterr())
+                self.unknowns.extend(self.__raw_stream.get_unknowns())
+                if not self.__raw_stream.frames:
+                    break
+                __raw_frames = self.__raw_stream.frames
+                self.__raw_stream.frames = list()
+                for __raw_frame in __raw_frames:
+                    self.__rfidframe.clear()
+                    self.__rfidframe.frame_raw_line = __raw_frame
+                    __fr = clouprotocol.ReceivedFrame(self.__rfidframe.decodeFrame(), (self.__rfidframe.message_id, self.__rfidframe.message_type, self.__rfidframe.init_by_reader), self.__rfidframe.data_bytes, __recv_time)
+                    if __fr.res == 0:
+                        if __fr.frame == (D.MAN_READER_CONN_CONFIRM, D.TYPE_CONF_MANAGE, D.INIT_BY_READER):
+                            if (len(__fr.data) == 6) and (__fr.data[0] == 0x00) and (__fr.data[1] == 0x04):
+                                __confirms.append(self.__conn_confirm.frame(__fr.data[2:6]))
+                                self.conn_confirms_sent += 1
+                        elif __fr.frame == (D.OP_READER_EPC_DATA_UPLOAD, D.TYPE_CONF_OPERATE, D.INIT_BY_READER):
+                            __tag_series_num = self.__tagframe.seriesNum(__fr.data)
+                            if __tag_series_num is not None:
+                                __confirms.append(self.__tag_confirm.frame(__tag_series_num))
+                                self.tag_confirms_sent += 1
+                    self.frames.append(__fr)
+            if __confirms:
+                try:
+                    self.send(b"".join(__confirms))
+                except timeout:
+                    self.log.log("Reader I/O thread: timeout sending confirmations to reader")
+                except Exception as __exc_error_descr:
+                    if not self.__stop:
+                        self.lost = True
+                        self.log.log("Reader I/O thread: " + repr(__exc_error_descr))
+                        self.__wake()
+                    return
+            self.__wake()
+    def stop(self):
+        """ Stop the thread and wait for it, it ends within socket timeout """
+        self.__stop = True
+        if self.is_alive():
+            self.join()
+        self.wake_sock.close()
+        self.__wake_sock_snd.close()
+
+class TagDecodePool:
+    """
+    Worker processes decoding tag data frames in batches with TagData.decodeBatch(),
+    so the main loop keeps only framing, confirmations to reader and socket I/O.
+    Batches are taken back strictly in order of submit, to keep tags in order of arrival;
+    a batch not decoded within batch_timeout_set is counted as failed, so a stuck worker
+    does not stop the main loop. Workers are forked at the start of cloucon.py, before threads
+    """
+    def __init__(self, pool_set, workers_set, batch_size_set, exclude_params_set, batch_timeout_set=5.0):
+        """
+        pool_set - multiprocessing Pool() of workers_set worker processes, closed by close()
+        workers_set - int() number of worker processes
+        batch_size_set - int() max tag frames in one batch
+        exclude_params_set - parameter names not compared by TagData().dedupeKey()
+        batch_timeout_set - float() seconds to wait for decoding of one batch
+        """
+        self.workers = workers_set
+        self.batch_size = batch_size_set
+        self.exclude_params = exclude_params_set
+        self.batch_timeout = batch_timeout_set
+        self.submitted = 0          # tag frames sent to workers
+        self.failed_batches = 0     # batches lost due to error in worker or timeout
+        self.__pool = pool_set
+        self.__pending = deque()    # tuples (submit time, AsyncResult) of batches in order of submit
+    def __len__(self):
+        return len(self.__pending)
+    def submit(self, tag_frames, with_dicts):
+        """ Send list() of tuples (tag data frame bytes(), recv time) to workers in batches """
+        for __batch_start in range(0, len(tag_frames), self.batch_size):
+            self.__pending.append((time(), self.__pool.apply_async(clouprotocol.TagData.decodeBatch, (tag_frames[__batch_start:(__batch_start + self.batch_size)], self.exclude_params, with_dicts))))
+        self.submitted += len(tag_frames)
+    def results(self, wait=False):
+        """ List() of decoded tags of batches ready, in order of submit; with wait all batches submitted """
+        __res_list = list()
+        while self.__pending and (wait or self.__pending[0][1].ready() or (time() >= (self.__pending[0][0] + self.batch_timeout))):
+            __submit_time, __batch = self.__pending.popleft()
+            try:
+                __res_list.extend(__batch.get(max(0.0, __submit_time + self.batch_timeout - time())))
+            except Exception:
+                self.failed_batches += 1
+        return __res_list
+    def stats(self):
+        """ Dict() of workers, batches waiting and counters """
+        return {"workers": self.workers, "batch-size": self.batch_size, "pending-batches": len(self.__pending), "submitted": self.submitted, "failed-batches": self.failed_batches}
+    def close(self):
+        """ Stop worker processes """
+        self.__pool.terminate()
+        self.__pool.join()
+
+class StageTimer:
+    """
+    Wall time of stages of the main loop while profiling: lap(stage) gives to stage
+    the time since the previous lap, carve(stage, seconds) gives to stage the seconds
+    measured inside the next lap instead, as tags dedupe inside decoding
+    """
+    def __init__(self):
+        self.__totals = dict()      # stage -> seconds
+        self.__laps = dict()        # stage -> number of laps
+        self.__carved = 0.0
+        self.__started = perf_counter()
+        self.__last = self.__started
+    def start(self):
+        """ Start of the pass, time since the previous pass is not counted """
+        self.__last = perf_counter()
+        self.__carved = 0.0
+    def lap(self, stage):
+        """ Time since the previous lap goes to stage """
+        __now = perf_counter()
+        self.__totals[stage] = self.__totals.get(stage, 0.0) + (__now - self.__last - self.__carved)
+        self.__laps[stage] = self.__laps.get(stage, 0) + 1
+        self.__carved = 0.0
+        self.__last = __now
+    def carve(self, stage, seconds):
+        """ Seconds measured inside the current lap go to stage """
+        self.__totals[stage] = self.__totals.get(stage, 0.0) + seconds
+        self.__laps[stage] = self.__laps.get(stage, 0) + 1
+        self.__carved += seconds
+    def stats(self):
+        """ Dict() of seconds and laps per stage, and share of the time of all stages """
+        __busy = sum(self.__totals.values())
+        return {
+            "elapsed": perf_counter() - self.__started,
+            "busy": __busy,
+            "stages": {__stage: {"seconds": __seconds, "laps": self.__laps[__stage], "share": (__seconds / __busy) if __busy else None} for __stage, __seconds in sorted(self.__totals.items(), key=lambda __item: -__item[1])}
+        }
+
+class StackSampler(Thread):
+    """
+    Sampling profiler of the thread running the main loop: every interval_set seconds
+    the stack of the thread is taken, a function counts "own" if it is running at the top
+    and "total" if it is anywhere in the stack. The main loop is not slowed down
+    except for the switches to this thread
+    """
+    def __init__(self, thread_ident_set, interval_set=0.005):
+        Thread.__init__(self, daemon=True)
+        self.thread_ident = thread_ident_set
+        self.interval = interval_set
+        self.samples = 0
+        self.__own = dict()         # (file name, first line, function name) -> samples
+        self.__total = dict()
+        self.__stop = False
+    def run(self):
+        while not self.__stop:
+            sleep(self.interval)
+            __frame = _current_frames().get(self.thread_ident)
+            if __frame is None:
+                continue
+            self.samples += 1
+            __code_key = (__frame.f_code.co_filename, __frame.f_code.co_firstlineno, __frame.f_code.co_name)
+            self.__own[__code_key] = self.__own.get(__code_key, 0) + 1
+            __seen = set()
+            while __frame is not None:
+                __code_key = (__frame.f_code.co_filename, __frame.f_code.co_firstlineno, __frame.f_code.co_name)
+                if __code_key not in __seen:
+                    __seen.add(__code_key)
+                    self.__total[__code_key] = self.__total.get(__code_key, 0) + 1
+                __frame = __frame.f_back
+            del __frame
+    def stop(self):
+        """ Stop sampling and wait for the thread """
+        self.__stop = True
+        self.join()
+    def stats(self, top, sort_by):
+        """ List() of top functions by samples "own" or "total" (sort_by) """
+        __counts = self.__own if sort_by == "own" else self.__total
+        __top_keys = sorted(__counts.keys(), key=lambda __key: -__counts[__key])[:top]
+        return [{"func": __key[0] + ":" + str(__key[1]) + "(" + __key[2] + ")", "own": self.__own.get(__key, 0), "total": self.__total.get(__key, 0), "own-share": self.__own.get(__key, 0) / self.samples, "total-share": self.__total.get(__key, 0) / self.samples} for __key in __top_keys]
+
+class DeferredFme:
+    """
+    fme of connector run on the event loop shared by readers: snd() keeps the message
+    and flush() writes the kept ones, run by the asyncio driver in a worker thread;
+    the rest goes to fme as is
+    """
+    def __init__(self, fme_msg_set, log_set):
+        self.fme_msg = fme_msg_set
+        self.log = log_set
+        self.pending = list()     # tuples (to id, message type, message content)
+    def __getattr__(self, name):
+        return getattr(self.fme_msg, name)
+    def snd(self, to_id, msg_type, msg_content):
+        """ Keep the message to write by flush(), returns 0 as fme snd() on success """
+        self.pending.append((to_id, msg_type, msg_content))
+        return 0
+    def flush(self):
+        """ Write the kept messages to fme """
+        __pending = self.pending
+        self.pending = list()
+        for __to_id, __msg_type, __msg_content in __pending:
+            if self.fme_msg.snd(__to_id, __msg_type, __msg_content) != 0:
+                self.log.logc("api", "error", "Error (%s) replying to web API: %s", self.fme_msg.geterr(), __msg_content)
+
+class ClouConnector:
+    """
+    Connector of one reader: connection, raw stream, queues, tag buffer, jobs and inventories
+    of the reader are kept here; run_once() makes one pass of the former main loop, and
+    the driver waits for sel_sources() sockets ready or next_timeout() between the passes
+    """
+    def __init__(self, rid_set, log_set):
+        """
+        rid_set - str() reader ID, key of reader parameters in config
+        log_set - logging instance with log() method
+        """
+        self.rid = rid_set
+        self.log = log_set
+
+        # Create specific dict() for reader parameters for rid
+        self.cfgrid = cfg[rid_set]
+
+        # Create multiple timers dict and register the uptime
+        self.timers_dict = {
+            "process-up-since": time(),
+            "reader-last-act-time": None,
+            "reader-connected-since": None,
+            "reader-disconnected-since": None
+        }
 
-        # Clean up the chunk bytes() instance
-        del recv_chunk
+        # Set basic sockets for server socket
+        self.srv_basic_sock = None
+        self.rid_sock = None
+        self.log.log("Expecting that reader is in " + self.cfgrid["reader-mode"] + " mode")
+        if self.cfgrid["reader-mode"] == "client":
+            self.srv_basic_sock = socket(AF_INET, SOCK_STREAM)
+            self.srv_basic_sock.settimeout(float(self.cfgrid["sock-timeout"]))
+            self.srv_basic_sock.setsockopt(SOL_SOCKET, SO_REUSEADDR, 1)
+            self.srv_basic_sock.bind((self.cfgrid["host"], self.cfgrid["port"]))
+            self.srv_basic_sock.listen(1)
+            self.log.log("Listening for incoming connection at " + self.cfgrid["host"] + ":" + str(self.cfgrid["port"]))
+        elif self.cfgrid["reader-mode"] == "server":
+            self.log.log("Connecting to " + self.cfgrid["host"] + ":" + str(self.cfgrid["port"]))
+        else:
+            raise ValueError("Unknown reader-mode: " + self.cfgrid["reader-mode"])
+        # Next attempt to connect to reader in server mode, and whether run_once() connects
+        # itself with blocking connect(), or the driver connects and calls reader_connected()
+        self.reader_next_connect = time()
+        self.connect_in_run_once = True
 
-        # Unpack received data into frames straight now
+        # Create main SessionState instance
+        self.session_state = clouprotocol.SessionState()
+
+        # Create raw stream processing instance
+        self.raw_stream = clouprotocol.ReceivedRawLine(self.cfgrid["parse-limit"])
+
+        # Metrics of the reader if "metrics" is on, counters of raw stream are taken at render
+        self.metrics = None
+        if metrics_on:
+            self.metrics = clouprotocol.Metrics({"rid": self.rid})
+            self.metrics.counter("clou_reader_bytes_received_total", "Bytes received from reader")
+            self.metrics.counter("clou_reader_frames_received_total", "Frames extracted from stream received from reader")
+            self.metrics.counter("clou_reader_crc_errors_total", "Candidate frames with wrong CRC in stream received from reader")
+            self.metrics.counter("clou_reader_resyncs_total", "Times unknown bytes were skipped to the next frame")
+            self.metrics.counter("clou_reader_unknown_bytes_total", "Unknown bytes skipped in stream received from reader")
+            self.metrics.counter("clou_tag_frames_total", "Tag data frames received from reader")
+            self.metrics.counter("clou_tags_unique_total", "Tags stored in tag buffer, duplicates not counted")
+            self.metrics.counter("clou_tag_rule_reads_total", "Reads of tags matched by rule of tag-rules, by result accepted or dropped", ("rule", "result"))
+            self.metrics.counter("clou_command_timeouts_total", "Commands sent to reader without reply within reply-from-reader-timeout", ("mid",))
+            self.metrics.histogram("clou_command_rtt_seconds", "Time from sending command to reader till its reply", ("mid",))
+            self.metrics.histogram("clou_loop_seconds", "Time of one pass of connector main loop")
+            self.metrics.histogram("clou_fme_scan_seconds", "Time of scan for requests from web")
+            self.metrics.gauge("clou_reader_connected", "1 if connected to reader")
+            self.metrics.gauge("clou_queue_sent", "Commands waiting for reply from reader")
+
+        # Profiling started by STS "profile", dict() with the request, mode, end time and profiler
+        # while running; StageTimer() of the main loop in "stages" mode
+        self.profile_run = None
+        self.stage_timer = None
+
+        # With "io-thread" on, reading from reader and confirmations go in ReaderIO() thread
+        # started on every connect, main loop gets decoded frames from it
+        self.io_thread_on = bool(self.cfgrid.get("io-thread", False))
+        self.reader_io = None
+
+        # Run on the event loop shared by readers, set by serve_reader(): bytes to reader
+        # are kept in send_pending and written by the driver, fme is scanned by the driver
+        self.loop_shared = False
+        self.send_pending = list()
+
+        # Create frame list for priority sending to reader - replying on urgent confirmation requests from reader
+        self.frames_line_to_snd_1st = bytes() # 1st priority
+
+        # Create frame list for standard priority sending to reader
+        self.frames_line_to_snd_std = bytes() # 1st priority
+
+        # Create the decoded frames queue, this will be a deque() of ReceivedFrame() records of received
+        # and decoded frames but not yet processed and not yet matched as replies from
+        # reader on previously sent request frames
+        self.decoded_frames_list_dicts = deque()
+
+        # Create list of API requests tuples, first "to send" buffer list, second - "successfully sent"
+        # buffer for further processing; in each tuple the info about time, request ID from web,
+        # the content of request, etc.; next step - matching incoming frames from reader with the
+        # list of "successfully sent" tuples in chrono order - from oldest to latest, by MID and if ERR_WARN
+        # as well
+        self.queue_to_send = list()     # tuples (fme item, reply key)
+        self.queue_sent = SentQueue()
+
+        # Commands from web and jobs go to reader through the scheduler: by priority class,
+        # within "inflight-window" of commands without reply yet, and one at a time per
+        # reply expected if "serialize-same-reply" is on
+        self.cmd_scheduler = CommandScheduler(int(self.cfgrid.get("inflight-window", 8)), bool(self.cfgrid.get("serialize-same-reply", True)), cmd_priority)
+
+        # Create lists of frames dicts for further logging
+        self.frames_to_log_list_received = list()    # List of ReceivedFrame() received from reader - further used only for logging
+        self.frames_to_log_list_sent = list()        # List of dicts sent to reader - further used only for logging
+        self.std_frames_to_log_list_sent = list()        # List of dicts sent to reader - further used only for logging
+        self.frames_to_log_count_sent_tags = int()       # Tag data frame confirmations sent to reader, only counted in log
+
+        # Create tag buffer for storing read tags, the version of buffer is changed
+        # on every change of the buffer and gives the ETag for getdata and getdatacount
+        self.tag_buf = clouprotocol.TagBuffer(tag_buf_max_records, tag_buf_max_bytes, tag_buf_overflow_policy)
+        self.tag_buf_etag_base = "{0:x}".format(int(self.timers_dict["process-up-since"] * 1000))
+
+        # Binary capture of raw bytes received from and sent to reader, if "capture" is on for the reader,
+        # to replay offline with clou_replay.py
+        self.capture = None
+        if self.cfgrid.get("capture", False):
+            self.capture = clouprotocol.RawCapture(cfg.get("capture-dir", cfg["log-dir"]), "capture-" + rid_set, int(cfg.get("capture-max-bytes", 64*2**20)), int(cfg.get("capture-max-files", 10)))
+
+        # Rules of the reader for reads of tags, checked for every decoded tag before it is stored,
+        # None if no "tag-rules" and all reads are accepted
+        self.tag_rules = None
+        if self.cfgrid.get("tag-rules") or (self.cfgrid.get("tag-rules-default", "accept") != "accept"):
+            self.tag_rules = clouprotocol.TagRules(self.cfgrid.get("tag-rules", list()), self.cfgrid.get("tag-rules-default", "accept"))
+            self.log.log("Tag rules: " + repr(list(self.tag_rules.stats().keys())) + ", default " + self.cfgrid.get("tag-rules-default", "accept"))
+
+        # Aggregate statistics per EPC, kept only if "tag-stats" is on for the reader
+        self.tag_stats = None
+        if self.cfgrid.get("tag-stats", False):
+            self.tag_stats = clouprotocol.TagStats(tag_stats_max_records)
+
+        # Tag data frames are decoded by worker processes if "tag-decode-workers" is set for the reader,
+        # the main loop then only confirms them to reader; otherwise decoded in the main loop
+        self.tag_decode_pool = None
+        if rid_set in tag_decode_processes:
+            self.tag_decode_pool = TagDecodePool(tag_decode_processes[rid_set], int(self.cfgrid["tag-decode-workers"]), int(self.cfgrid.get("tag-decode-batch", 500)), tag_dedupe_exclude, float(self.cfgrid.get("tag-decode-timeout", 5.0)))
+
+        # Create FileMessageExchange() instance
+        self.fme_msg = fme.FileMessageExchange(str(rid_set), ("/" + cfg["clou-run"].strip("/") + "/" + str(rid_set)), message_types_set=["CLU", "STS"])
+
+        # Web wakes up the connector after putting messages to fme,
+        # without wake-up socket fme is scanned every sock-timeout as before
+        self.fme_poll_interval = float(cfg.get("fme-poll-interval", 1.0))
+        self.fme_wake_sock = self.fme_msg.wake_listen()
+        if self.fme_wake_sock is None:
+            self.log.log(self.fme_msg.geterr() + ", scanning fme every " + repr(self.cfgrid["sock-timeout"]) + " seconds")
+            self.fme_poll_interval = float(self.cfgrid["sock-timeout"])
+        self.fme_next_poll = time()
+
+        # Create lists for storing received API requests from web API of two types
+        # CLU for clou protocol queries, STS for status queries
+        self.fme_CLU_recv_list = deque()
+        self.fme_STS_recv_list = deque()
+
+        # Latency of stages of web API requests coming with "trace" stamps from web
+        self.request_trace = clouprotocol.RequestTrace()
+
+        # Jobs submitted from web API, dict() job id -> job dict(), each step of job is
+        # a query going through the same queues as CLU requests, but the reply is stored
+        # in the job instead of sending it back to web; and the list of tuples
+        # (fme STS item, deadline) for job-status requests waiting for the job to finish
+        self.jobs = dict()
+        self.sts_pending_replies = list()
+        # Jobs run in order, dict() job id -> tuple (list() of queries, from id) while the job runs
+        self.job_sequences = dict()
+
+        # Inventories in progress, dict() job id -> dict() with inventory window state
+        # and tags collected in the window; the inventory job has 2 steps, start reading
+        # command and stop command sent by the connector when the window is over
+        self.inventories = dict()
+
+        # Commands sent to reader as a job in order after every connect, and id of the last such job
+        self.on_connect_queries = on_connect_sequences.get(rid_set, list())
+        for __query in self.on_connect_queries:
+            if __query.get("msid") not in cmd_ref_dict:
+                raise ValueError("Unknown msid " + repr(__query.get("msid")) + " in on-connect sequence")
+        self.on_connect_job_id = None
+
+        # Reader clock is set to server time by MAN_CONF_TIME job after connect and every
+        # "time-sync-interval" seconds, 0 - never; skew of TIME of tags to server time
+        # is counted since the last successful set
+        self.time_sync_interval = float(self.cfgrid.get("time-sync-interval", 0.0))
+        self.time_sync_next = None
+        self.time_sync_job_id = None
+        self.clock_skew = clouprotocol.ClockSkew()
+    def job_step_done(self, job_id, job_step, is_ok, step_content):
+        """
+        Store the result of step job_step of job job_id,
+        and finish the job when all steps have their results
+        """
+        if job_id not in self.jobs:
+            return
+        __job = self.jobs[job_id]
+        if __job["results"][job_step] is not None:
+            return
+        __job["results"][job_step] = {"is-ok": is_ok, "reply-content": step_content}
+        if (not is_ok) and (job_id == self.on_connect_job_id) and (job_id in self.job_sequences):
+            self.log.logc("api", "error", "On-connect step %s %s failed, the rest of sequence is not sent: %s", job_step, self.on_connect_queries[job_step]["msid"], step_content)
+        if job_id == self.time_sync_job_id:
+            if is_ok:
+                self.clock_skew.clear()
+                self.log.logc("timing", "info", "Reader clock set to server time by job %s", job_id)
+            else:
+                self.log.logc("timing", "warning", "Reader clock not set by job %s: %s", job_id, step_content)
+        __job["steps-done"] += 1
+        if not is_ok:
+            __job["steps-failed"] += 1
+        __job["state"] = "running"
+        __job["updated"] = time()
+        if __job["steps-done"] >= __job["steps-total"]:
+            if __job["steps-failed"] == 0:
+                __job["state"] = "done"
+            else:
+                __job["state"] = "failed"
+            __job["finished"] = __job["updated"]
+            self.log.log("Job " + job_id + " " + __job["state"] + ", " + str(__job["steps-failed"]) + " of " + str(__job["steps-total"]) + " steps failed")
+        if job_id in self.inventories:
+            __inv = self.inventories[job_id]
+            if (job_step == 0) and (not is_ok):
+                # Reading not started, stop right now to be on the safe side
+                __inv["stop-at"] = time()
+            elif job_step == 1:
+                # Stop replied - the window is closed, give the tags to the job
+                __inv["window-end"] = time()
+                __job["result"] = {
+                    "window-start": __inv["window-start"],
+                    "window-end": __inv["window-end"],
+                    "duration": __inv["duration"],
+                    "ant": __inv["ant"],
+                    "dedupe": __inv["dedupe"],
+                    "tags-count": len(__inv["tags"]),
+                    "tags": list(__inv["tags"].values())
+                }
+                del self.inventories[job_id]
+        # Job run in order gets its next step after the reply, or stops at the failed step
+        if job_id in self.job_sequences:
+            if not is_ok:
+                self.job_sequence_stop(job_id, "Not sent, step " + str(job_step) + " of the sequence failed")
+            elif job_step + 1 < __job["steps-total"]:
+                self.fme_CLU_recv_list.append(({"web-req-id": job_id, "query-content": self.job_sequences[job_id][0][job_step + 1], "job-id": job_id, "job-step": job_step + 1}, time(), self.job_sequences[job_id][1]))
+            else:
+                del self.job_sequences[job_id]
+    def job_sequence_stop(self, job_id, reason):
+        """ Stop job job_id run in order: its command not sent yet is taken out, steps without result fail with reason """
+        if job_id not in self.job_sequences:
+            return
+        del self.job_sequences[job_id]
+        self.cmd_scheduler.discard_job(job_id)
+        self.fme_CLU_recv_list = deque(__item for __item in self.fme_CLU_recv_list if __item[0].get("job-id") != job_id)
+        for __job_step in range(self.jobs[job_id]["steps-total"]):
+            if self.jobs[job_id]["results"][__job_step] is None:
+                self.job_step_done(job_id, __job_step, False, {"Error": reason})
+    def capture_write(self, direction, data_bytes, time_stamp):
+        """ Put bytes received from or sent to reader into capture if on, error of capture does not touch the connection """
+        if self.capture is None:
+            return
+        try:
+            self.capture.write(direction, data_bytes, time_stamp)
+        except Exception as __exc_error_descr:
+            self.capture_off(__exc_error_descr)
+    def capture_off(self, exc_error_descr):
+        """ Turn capture off after its error exc_error_descr """
+        self.log.log("Error writing capture, capture is off: " + repr(exc_error_descr))
+        __capture = self.capture
+        self.capture = None
+        if self.reader_io is not None:
+            self.reader_io.capture = None
         try:
-            if raw_stream.unpack() == -1:
-                log.log("Reported error from unpack(): " + raw_stream.geterr())
+            __capture.close()
         except Exception:
-            log.log("Error in try: except: in cloucon.py while unpacking")
-
-        # Log unknown bytes
-        unpack_unknowns = raw_stream.get_unknowns()
-        for unpack_unknowns_bytes in unpack_unknowns:
-            log.log("Unknown bytes received from reader: [" + " ".join(format(idx_hex_conv, '02X') for idx_hex_conv in unpack_unknowns_bytes) + " ]")
-
-        # Decoding all packets received in raw_stream.frames by types,
-        # and putting them in list of dict() called decoded_frames_list_dicts:
-        frames_to_log_list_received = list()    # logging list
-        for idx_prc_frm in range(len(raw_stream.frames)):
-            rfidframe.clear()
-            rfidframe.frame_raw_line = raw_stream.frames.pop(0)
-            decode_frame_res = rfidframe.decodeFrame()
-            tmp_dict_frame = dict()
-            tmp_dict_frame["res"] = decode_frame_res    # int() result of frame
-            tmp_dict_frame["frame"] = (rfidframe.message_id, rfidframe.message_type, rfidframe.init_by_reader)
-            tmp_dict_frame["data"] = rfidframe.data_bytes   # data_bytes, can contain 2 len bytes or not - depends on MID!
-            tmp_dict_frame["recv-time"] = recv_chunk_time_to_log
-            if tmp_dict_frame["res"] == 0:
-                decoded_frames_list_dicts.append(tmp_dict_frame)
-            frames_to_log_list_received.append(tmp_dict_frame)
-            del tmp_dict_frame
-
-        # raw_stream.frames should be already empty!
-        if raw_stream.frames:
-            log.log("Error: raw_stream.frames not empty after decoding")
-
-        # Now going through decoded_frames_list_dicts first filter out priority
-        # frames and instantly composing bytes line with answer to reader
-        tmp_decoded_frames_list_dicts = list()
-        for idx_prc_frm in range(len(decoded_frames_list_dicts)):
-            fr_dict_prc = decoded_frames_list_dicts.pop(0)
-            # Regular MAN_READER_CONN_CONFIRM 'pings' from Clou reader due to protocol
-            if (fr_dict_prc["frame"] == (D.MAN_READER_CONN_CONFIRM, D.TYPE_CONF_MANAGE, D.INIT_BY_READER)) and (fr_dict_prc["res"] == 0):
-                if (len(fr_dict_prc["data"]) == 6) and (fr_dict_prc["data"][0] == 0x00) and (fr_dict_prc["data"][1] == 0x04):
-                    # Means, we work on reply only if the len of data bytes condition True,
-                    # otherwise just ignore this incoming message from reader
-                    rfidframe.clear()
-                    rfidframe.message_id = D.MAN_CONN_CONFIRM
-                    rfidframe.message_type = D.TYPE_CONF_MANAGE
-                    rfidframe.init_by_reader = D.INIT_BY_USER
-                    rfidframe.data_bytes = fr_dict_prc["data"][2:6]
-                    rfidframe.encodeFrame()
-                    # Here - append frame to the raw lite to send with high priority!
-                    frames_line_to_snd_1st += rfidframe.frame_raw_line
-                    # and here - append frame dict to the list for further logging
-                    # log message to send
-                    frames_to_log_list_sent.append({"frame": (D.MAN_CONN_CONFIRM, D.TYPE_CONF_MANAGE, D.INIT_BY_USER), "data": fr_dict_prc["data"][2:6], "res": 0})
-            # After receiving the tag data frame always need to confirm that to Clou reader due to protocol
-            elif (fr_dict_prc["frame"] == (D.OP_READER_EPC_DATA_UPLOAD, D.TYPE_CONF_OPERATE, D.INIT_BY_READER)) and (fr_dict_prc["res"] == 0):
-                tagframe.decodeTag(fr_dict_prc["data"])
-                if not tagframe.decode_error:
-                    # If tag data decoded correctly, store the unique tag in the tag_buf
-                    __tag_dict_to_buf = dict()
-                    __tag_dict_to_buf_match_duplicates = dict()
-                    try:
-                        __tag_dict_to_buf = tagframe.encodeInDict()
-                        __tag_dict_to_buf_match_duplicates = deepcopy(__tag_dict_to_buf)
-                        __tag_prms_item = str()
-                        for __tag_prms_item in cfg["tag-param-duplicate-exclude"]:
-                            del __tag_dict_to_buf_match_duplicates["params"][__tag_prms_item]
-                        del __tag_prms_item
-                    except Exception:
-                        pass
-                    if __tag_dict_to_buf_match_duplicates not in tag_buf_match_duplicates:
-                        tag_buf.append(__tag_dict_to_buf)
-                        tag_buf_match_duplicates.append(__tag_dict_to_buf_match_duplicates)
-                    del __tag_dict_to_buf, __tag_dict_to_buf_match_duplicates
-                    # If tag data decoded correctly, build the answer to reader
-                    if 0x08 in tagframe.params.keys():
-                        rfidframe.clear()
-                        rfidframe.message_id = D.MAN_TAG_DATA_RESPONSE
-                        rfidframe.message_type = D.TYPE_CONF_MANAGE
-                        rfidframe.init_by_reader = D.INIT_BY_USER
-                        rfidframe.data_bytes = tagframe.params[0x08]
-                        rfidframe.encodeFrame()
-                        frames_line_to_snd_1st += rfidframe.frame_raw_line
-                        # log message to send
-                        frames_to_log_list_sent.append({"frame": (D.MAN_TAG_DATA_RESPONSE, D.TYPE_CONF_MANAGE, D.INIT_BY_USER), "data": tagframe.params[0x08], "res": 0})
+            pass
+    def trace_reply(self, msg_content_to_send, fme_item_content):
+        """ Reply to web API request traced by web gets its trace stamped reply-written, and its stages are counted """
+        if not isinstance(fme_item_content.get("trace"), dict):
+            return
+        msg_content_to_send["trace"] = dict(fme_item_content["trace"], **{"reply-written": time()})
+        self.request_trace.add(msg_content_to_send["trace"])
+    def tag_store(self, tag_data, dedupe_key, seen_time, tag_dict=None):
+        """
+        Store decoded TagData() tag_data with its dedupe_key in the tag buffer, statistics and
+        inventories with the window open at seen_time; tag_dict is tag_data.encodeInDict()
+        if made already, otherwise it is made only if an inventory needs it;
+        tags not accepted by tag-rules of the reader are not stored anywhere
+        """
+        if (self.tag_rules is not None) and (not self.tag_rules.accept(tag_data)):
+            return
+        if self.stage_timer is not None:
+            __dedupe_start = perf_counter()
+            if self.tag_buf.add(dedupe_key, tag_data) and (self.metrics is not None):
+                self.metrics.inc("clou_tags_unique_total")
+            self.stage_timer.carve("dedupe", perf_counter() - __dedupe_start)
+        elif self.tag_buf.add(dedupe_key, tag_data) and (self.metrics is not None):
+            self.metrics.inc("clou_tags_unique_total")
+        if self.tag_stats is not None:
+            self.tag_stats.update(tag_data, seen_time)
+        if 0x07 in tag_data.params:
+            self.clock_skew.update(tag_data.params[0x07], seen_time)
+        # Collect tag to inventories with the window open
+        for __inv in self.inventories.values():
+            if (__inv["window-start"] is not None) and (__inv["window-end"] is None) and (seen_time >= __inv["window-start"]):
+                if __inv["dedupe"] == "epc":
+                    __inv_key = tag_data.EPC_code
+                elif __inv["dedupe"] == "epc-ant":
+                    __inv_key = (tag_data.EPC_code, tag_data.ant_id)
                 else:
-                    # If tag data decoding problem - leave the frame for future analysis
-                    tmp_decoded_frames_list_dicts.append(fr_dict_prc)
+                    __inv_key = len(__inv["tags"])
+                if __inv_key not in __inv["tags"]:
+                    if tag_dict is None:
+                        tag_dict = tag_data.encodeInDict()
+                    __inv["tags"][__inv_key] = tag_dict
+    def tag_decode_results(self, wait=False):
+        """ Store tags decoded by worker processes, with wait all submitted so far """
+        for __tag_res in self.tag_decode_pool.results(wait):
+            if __tag_res[0] is None:
+                self.log.logc("frames", "warning", "Warning: tag data frame from reader not decoded (%s): %s", __tag_res[1], __tag_res[2])
+                continue
+            tagframe.loadRecord(clouprotocol.TagRecord(__tag_res[0], __tag_res[1], __tag_res[2], __tag_res[3]))
+            self.tag_store(tagframe, __tag_res[4], __tag_res[6], __tag_res[5])
+    def job_queue(self, job_id, job_queries, from_id, in_order=False):
+        """
+        Register job job_id and put its queries to the CLU processing list,
+        all steps at once, the scheduler sends them pipelined; with in_order
+        only the first step, the next one goes after the reply to the previous one
+        """
+        __job_time = time()
+        self.jobs[job_id] = {
+            "job-id": job_id,
+            "state": "queued",
+            "created": __job_time,
+            "updated": __job_time,
+            "finished": None,
+            "steps-total": len(job_queries),
+            "steps-done": 0,
+            "steps-failed": 0,
+            "results": [None] * len(job_queries)
+        }
+        if in_order and job_queries:
+            self.job_sequences[job_id] = (job_queries, from_id)
+            self.fme_CLU_recv_list.append(({"web-req-id": job_id, "query-content": job_queries[0], "job-id": job_id, "job-step": 0}, __job_time, from_id))
+        else:
+            for __job_step in range(len(job_queries)):
+                self.fme_CLU_recv_list.append(({"web-req-id": job_id, "query-content": job_queries[__job_step], "job-id": job_id, "job-step": __job_step}, __job_time, from_id))
+        self.log.log("Job " + job_id + " queued with " + str(len(job_queries)) + " steps" + (" run in order" if in_order else str()))
+    def inventory_start(self, job_id, inventory_prms, from_id):
+        """
+        Create inventory job job_id and put its start reading command
+        to the CLU processing list, the stop command is added when the window is over
+        """
+        __job_time = time()
+        self.jobs[job_id] = {
+            "job-id": job_id,
+            "state": "queued",
+            "created": __job_time,
+            "updated": __job_time,
+            "finished": None,
+            "steps-total": 2,
+            "steps-done": 0,
+            "steps-failed": 0,
+            "results": [None, None]
+        }
+        self.inventories[job_id] = {
+            "duration": float(inventory_prms["duration"]),
+            "ant": inventory_prms["ant"],
+            "dedupe": inventory_prms.get("dedupe", "epc"),
+            "window-start": None,
+            "window-end": None,
+            "stop-at": None,
+            "stop-queued": False,
+            "tags": dict(),
+            "from-id": from_id
+        }
+        __read_query = {"msid": "OP_READ_EPC_TAG", "prms": {"ant": {"val": inventory_prms["ant"]}, "iscont": {"val": 1}}}
+        self.fme_CLU_recv_list.append(({"web-req-id": job_id, "query-content": __read_query, "job-id": job_id, "job-step": 0}, __job_time, from_id))
+        self.log.logc("api", "info", "Inventory job %s queued: %s", job_id, inventory_prms)
+    PROFILE_MODES = ("stages", "cprofile", "sample")
+    def profile_start(self, sts_item):
+        """
+        Start profiling asked by STS "profile" item sts_item, prms: "mode" one of PROFILE_MODES,
+        "duration" seconds, "top" functions, "sort" of functions, "file" true to write results
+        to log-dir as well; the reply goes by profile_finish() when the duration is over
+        """
+        __prms = sts_item[0]["query-content"].get("prms", dict())
+        __mode = __prms.get("mode", "stages")
+        if __mode not in self.PROFILE_MODES:
+            raise ValueError("Unknown profile mode " + repr(__mode))
+        self.profile_run = {"sts-item": sts_item, "mode": __mode, "prms": __prms, "started": time(), "until": time() + float(__prms.get("duration", 10.0)), "profiler": None}
+        profile_holder.update(rid=self.rid, mode=__mode)
+        if __mode == "stages":
+            self.stage_timer = StageTimer()
+        elif __mode == "cprofile":
+            self.profile_run["profiler"] = cProfile.Profile()
+            self.profile_run["profiler"].enable()
+        else:
+            self.profile_run["profiler"] = StackSampler(get_ident())
+            self.profile_run["profiler"].start()
+        self.log.log("Profiling in mode " + __mode + " started for " + repr(self.profile_run["until"] - self.profile_run["started"]) + " seconds")
+    def profile_stop(self):
+        """ Stop profiling, returns the result dict() """
+        __run = self.profile_run
+        self.profile_run = None
+        profile_holder.update(rid=None, mode=None)
+        __top = int(__run["prms"].get("top", 30))
+        __result = {"mode": __run["mode"], "started": __run["started"], "duration": time() - __run["started"]}
+        if __run["mode"] == "stages":
+            __result.update(self.stage_timer.stats())
+            self.stage_timer = None
+        elif __run["mode"] == "cprofile":
+            __run["profiler"].disable()
+            __sort = __run["prms"].get("sort", "cumulative")
+            __sort_idx = {"calls": 1, "tottime": 2, "cumulative": 3}.get(__sort, 3)
+            __stats = pstats.Stats(__run["profiler"]).stats
+            __result["functions"] = [{"func": __key[0] + ":" + str(__key[1]) + "(" + __key[2] + ")", "calls": __stats[__key][1], "primitive-calls": __stats[__key][0], "tottime": __stats[__key][2], "cumtime": __stats[__key][3]} for __key in sorted(__stats.keys(), key=lambda __key: -__stats[__key][__sort_idx])[:__top]]
+        else:
+            __run["profiler"].stop()
+            __result["samples"] = __run["profiler"].samples
+            __result["interval"] = __run["profiler"].interval
+            __result["functions"] = __run["profiler"].stats(__top, __run["prms"].get("sort", "own")) if __run["profiler"].samples else list()
+        if __run["prms"].get("file", False):
+            __file_name = os.path.join(cfg["log-dir"], "profile-" + self.rid + "-" + strftime("%Y%m%d-%H%M%S", gmtime(__run["started"])) + "-" + __run["mode"])
+            if __run["mode"] == "cprofile":
+                # Whole stats for pstats or snakeviz
+                __file_name += ".prof"
+                __run["profiler"].dump_stats(__file_name)
             else:
-                tmp_decoded_frames_list_dicts.append(fr_dict_prc)
-
-        # raw_stream.frames should be already empty!
-        if decoded_frames_list_dicts:
-            log.log("Error: decoded_frames_list_dicts not empty after priority frames filtering")
-
-        # Finally substituting list decoded_frames_list_dicts with frames dicts left after filtering
-        # This will be the list of frames to analyze below to search for answers from reader
-        # on previous frames that were sent to reader by this process
-        decoded_frames_list_dicts = list()
-        decoded_frames_list_dicts = deepcopy(tmp_decoded_frames_list_dicts)
-        del tmp_decoded_frames_list_dicts
-
-        # Here send the first priority reply to reader =======
-        sent_all_time_to_log = float()
-        sent_success_flag = False
-        if len(frames_line_to_snd_1st) > 0:
-            try:
-                # Here send!
-                if rid_sock.sendall(frames_line_to_snd_1st) is None:
-                    sent_success_flag = True
-                    sent_all_time_to_log = time()
-                    # If sent successfully - clear buffer
-                    frames_line_to_snd_1st = bytes()
-            except Exception as sock_read_err:
-                if not isinstance(sock_read_err, timeout):
-                    session_state.connected = False
-                    timers_dict["reader-connected-since"] = None
-                    timers_dict["reader-disconnected-since"] = time()
-                    log.log("Lost connection!")
-
-        # And log all received
-        tmp_log_tag_frames_count = int()
-        for idx_prc_frm in range(len(frames_to_log_list_received)):
-            rfidframe_tolog.clear()
-            rfidframe_tolog.message_id = frames_to_log_list_received[idx_prc_frm]["frame"][0]
-            rfidframe_tolog.message_type = frames_to_log_list_received[idx_prc_frm]["frame"][1]
-            rfidframe_tolog.init_by_reader = frames_to_log_list_received[idx_prc_frm]["frame"][2]
-            rfidframe_tolog.data_bytes = frames_to_log_list_received[idx_prc_frm]["data"]
-            if (frames_to_log_list_received[idx_prc_frm]["frame"] == (D.OP_READER_EPC_DATA_UPLOAD, D.TYPE_CONF_OPERATE, D.INIT_BY_READER)) and (frames_to_log_list_received[idx_prc_frm]["res"] == 0):
-                if cfgrid["log-tag-frames"]:
-                    tagframe_tolog.decodeTag(rfidframe_tolog.data_bytes)
-                    log.log("Received from reader", instance_to_log=rfidframe_tolog, explicit_timestamp=recv_chunk_time_to_log, result_resp=frames_to_log_list_received[idx_prc_frm]["res"])
-                    log.log(str(), instance_to_log=tagframe_tolog, put_timestamp=False)
-                else:
-                    tmp_log_tag_frames_count += 1
+                __file_name += ".json"
+                with open(__file_name, "w") as __profile_file:
+                    __profile_file.write(dumps(__result))
+            __result["file"] = __file_name
+        self.log.log("Profiling in mode " + __run["mode"] + " finished")
+        return __result
+    def profile_finish(self):
+        """ Stop profiling and reply to web with the result """
+        __sts_item = self.profile_run["sts-item"]
+        msg_content_to_send = {"web-req-id": __sts_item[0]["web-req-id"]}
+        try:
+            msg_content_to_send["reply-content"] = {"is-ok": True, "result": self.profile_stop()}
+        except Exception as __exc_error_descr:
+            self.profile_run = None
+            self.stage_timer = None
+            msg_content_to_send["reply-content"] = {"is-ok": False, "result": "Error: " + repr(__exc_error_descr)}
+        self.trace_reply(msg_content_to_send, __sts_item[0])
+        if self.fme_msg.snd(__sts_item[2], "STS", msg_content_to_send) != 0:
+            self.log.log("Error (" + repr(self.fme_msg.geterr()) + ") replying to web API on profile")
+    def memstats(self, memstats_prms):
+        """
+        Dict() of items and approximate bytes of structures of the connector, memory of the process,
+        and tracemalloc results if memstats_prms has "tracemalloc": "start", "snapshot", "diff" or "stop",
+        with "top", "key" of MallocTracer.KEY_TYPES, "frames" for start and "rebase" for diff
+        """
+        __approx = clouprotocol.MemAccounting.approxBytes
+        __structs = {
+            "tag-buf": {"items": len(self.tag_buf), "bytes": self.tag_buf.size_bytes},
+            "tag-stats": None if self.tag_stats is None else {"items": len(self.tag_stats), "bytes": __approx(self.tag_stats)},
+            "raw-stream": {"items": len(self.raw_stream.frames), "bytes": self.raw_stream.buffered()},
+            "decoded-frames": {"items": len(self.decoded_frames_list_dicts), "bytes": __approx(self.decoded_frames_list_dicts)},
+            "frames-to-log": {"items": len(self.frames_to_log_list_received) + len(self.frames_to_log_list_sent) + len(self.std_frames_to_log_list_sent), "bytes": __approx(self.frames_to_log_list_received) + __approx(self.frames_to_log_list_sent) + __approx(self.std_frames_to_log_list_sent)},
+            "send-buffers": {"items": 2, "bytes": len(self.frames_line_to_snd_1st) + len(self.frames_line_to_snd_std)},
+            "queue-to-send": {"items": len(self.queue_to_send), "bytes": __approx(self.queue_to_send)},
+            "queue-sent": dict(self.queue_sent.stats(), items=len(self.queue_sent), bytes=__approx(self.queue_sent)),
+            "cmd-scheduler": {"items": sum(self.cmd_scheduler.stats()[__class_name] for __class_name in CommandScheduler.CLASSES), "bytes": __approx(self.cmd_scheduler)},
+            "fme-CLU-recv-list": {"items": len(self.fme_CLU_recv_list), "bytes": __approx(self.fme_CLU_recv_list)},
+            "fme-STS-recv-list": {"items": len(self.fme_STS_recv_list), "bytes": __approx(self.fme_STS_recv_list)},
+            "sts-pending-replies": {"items": len(self.sts_pending_replies), "bytes": __approx(self.sts_pending_replies)},
+            "jobs": {"items": len(self.jobs), "bytes": __approx(self.jobs)},
+            "inventories": {"items": sum(len(__inv["tags"]) for __inv in self.inventories.values()), "bytes": __approx(self.inventories)},
+            "reader-io-frames": None if self.reader_io is None else {"items": len(self.reader_io.frames), "bytes": __approx(self.reader_io.frames)},
+            "tag-decode-pool": None if self.tag_decode_pool is None else {"items": len(self.tag_decode_pool), "bytes": None},
+            "metrics": None if self.metrics is None else {"items": None, "bytes": __approx(self.metrics)},
+            "cmd-ref": {"items": len(cmd_ref_dict), "bytes": __approx(cmd_ref_dict)},
+            "clock-check-log": {"items": len(clock.check_log), "bytes": __approx(clock.check_log)},
+            "log-queue": {"items": log.queue_len(), "bytes": None}
+        }
+        __result = {"structures": __structs, "process": clouprotocol.MemAccounting.processMemory()}
+        __result["process"]["gc-counts"] = gc.get_count()
+        __action = memstats_prms.get("tracemalloc")
+        __top = int(memstats_prms.get("top", 20))
+        __key_type = memstats_prms.get("key", "lineno")
+        if (__action is not None) and (__key_type not in clouprotocol.MallocTracer.KEY_TYPES):
+            raise ValueError("Unknown tracemalloc key " + repr(__key_type))
+        if __action == "start":
+            malloc_tracer.start(int(memstats_prms.get("frames", 1)))
+            self.log.log("tracemalloc started")
+        elif __action == "snapshot":
+            __result["tracemalloc-top"] = malloc_tracer.snapshot(__top, __key_type)
+        elif __action == "diff":
+            __result["tracemalloc-diff"] = malloc_tracer.diff(__top, __key_type, bool(memstats_prms.get("rebase", False)))
+        elif __action == "stop":
+            malloc_tracer.stop()
+            self.log.log("tracemalloc stopped")
+        elif __action is not None:
+            raise ValueError("Unknown tracemalloc action " + repr(__action))
+        __result["tracemalloc"] = malloc_tracer.status()
+        return __result
+    def metrics_families(self):
+        """ Metrics.families() of the reader, counters kept by raw stream and queues taken now """
+        self.metrics.set("clou_reader_bytes_received_total", self.raw_stream.bytes_count)
+        self.metrics.set("clou_reader_frames_received_total", self.raw_stream.frames_count)
+        self.metrics.set("clou_reader_crc_errors_total", self.raw_stream.crc_errors)
+        self.metrics.set("clou_reader_resyncs_total", self.raw_stream.resyncs)
+        self.metrics.set("clou_reader_unknown_bytes_total", self.raw_stream.unknown_bytes_count)
+        self.metrics.set("clou_reader_connected", 1 if self.session_state.connected else 0)
+        self.metrics.set("clou_queue_sent", len(self.queue_sent))
+        if self.tag_rules is not None:
+            for __rule_name, __rule_stats in self.tag_rules.stats().items():
+                self.metrics.set("clou_tag_rule_reads_total", __rule_stats["accepted"], (__rule_name, "accepted"))
+                self.metrics.set("clou_tag_rule_reads_total", __rule_stats["dropped"], (__rule_name, "dropped"))
+        return self.metrics.families()
+    def time_sync(self):
+        """
+        Queue MAN_CONF_TIME job setting reader clock to server time, goes to reader in this same cycle;
+        skipped till the next time while the clock of server is not healthy by NTP check
+        """
+        __now = time()
+        if not clock.healthy():
+            self.time_sync_next = __now + self.time_sync_interval
+            self.log.logc("timing", "warning", "Reader clock not set, clock of server is not healthy: %s", clock.status())
+            return
+        self.time_sync_job_id = "time-sync-" + self.rid + "-" + "{0:x}".format(int(__now * 1000))
+        self.job_queue(self.time_sync_job_id, [{"msid": "MAN_CONF_TIME", "prms": {"sec": {"val": int(__now)}, "usec": {"val": int((__now - int(__now)) * 1000000)}}}], str())
+        self.time_sync_next = __now + self.time_sync_interval
+    def next_timer_deadline(self):
+        """
+        The nearest time when the main loop has work to do without any event
+        from sockets: fme scan, reader connect, reader no life, reply timeouts,
+        commands to drop from scheduler, inventory windows, reader clock set, end of profiling, waiting job-status replies and jobs to erase
+        """
+        __deadlines = [self.fme_next_poll]
+        if self.session_state.connected and (self.timers_dict["reader-last-act-time"] is not None):
+            __deadlines.append(self.timers_dict["reader-last-act-time"] + cfg["reader-no-life-timeout"])
+        if (not self.session_state.connected) and (self.cfgrid["reader-mode"] == "server"):
+            __deadlines.append(self.reader_next_connect)
+        if self.queue_sent:
+            __deadlines.append(self.queue_sent.next_deadline())
+        if self.cmd_scheduler and self.session_state.connected and (self.cmd_scheduler.next_deadline() is not None):
+            __deadlines.append(self.cmd_scheduler.next_deadline())
+        for __inv in self.inventories.values():
+            if (__inv["stop-at"] is not None) and (not __inv["stop-queued"]):
+                __deadlines.append(__inv["stop-at"])
+        if self.session_state.connected and (self.time_sync_next is not None):
+            __deadlines.append(self.time_sync_next)
+        if self.profile_run is not None:
+            __deadlines.append(self.profile_run["until"])
+        for __sts_pending_item in self.sts_pending_replies:
+            __deadlines.append(__sts_pending_item[1])
+        for __job_item in self.jobs.values():
+            if __job_item["finished"] is not None:
+                __deadlines.append(__job_item["finished"] + job_result_ttl)
+        return min(__deadlines)
+    def sel_sources(self):
+        """
+        Dict() of sockets to wait for ready to read, by name: listening socket only while
+        not connected, as the next connection pending in its backlog would make select()
+        return at once, reader socket while connected or wake-up socket of reader I/O thread,
+        and fme wake-up socket
+        """
+        __sources = dict()
+        if self.session_state.connected and (self.reader_io is not None):
+            __sources["reader-io"] = self.reader_io.wake_sock
+        elif self.session_state.connected and (self.rid_sock is not None):
+            __sources["reader"] = self.rid_sock
+        elif (not self.session_state.connected) and (self.srv_basic_sock is not None):
+            __sources["listen"] = self.srv_basic_sock
+        if self.fme_wake_sock is not None:
+            __sources["fme"] = self.fme_wake_sock
+        return __sources
+    def next_timeout(self):
+        """
+        Seconds to wait for sockets before the next run_once(): no wait if requests
+        from web are still to process or the scheduler has commands to send, short wait if frames are still to send
+        to reader or tags are decoded by workers, otherwise till the nearest timer
+        """
+        if self.fme_STS_recv_list or (self.fme_CLU_recv_list and self.session_state.connected):
+            return 0.0
+        if self.session_state.connected and self.cmd_scheduler.ready(time(), len(self.queue_sent) + len(self.queue_to_send), self.queue_sent, {__queue_to_send_item[1] for __queue_to_send_item in self.queue_to_send}):
+            return 0.0
+        if self.frames_line_to_snd_1st or self.frames_line_to_snd_std or self.queue_to_send:
+            return float(self.cfgrid["sock-timeout"])
+        if self.session_state.connected and (self.tag_decode_pool is not None) and self.tag_decode_pool:
+            return float(self.cfgrid["sock-timeout"])
+        return max(0.0, self.next_timer_deadline() - time())
+    def reader_connect_due(self):
+        """ True if it is time to connect to reader in server mode """
+        return (self.cfgrid["reader-mode"] == "server") and (not self.session_state.connected) and (time() >= self.reader_next_connect)
+    def reader_connected(self, rid_sock_set, log_text):
+        """ Start the session on socket connected to reader, and queue the on-connect sequence """
+        self.rid_sock = rid_sock_set
+        if self.loop_shared and (not self.io_thread_on):
+            # Socket is read and written only when ready, never blocks the shared event loop
+            rid_sock_set.setblocking(False)
+        self.log.log(log_text)
+        self.session_state.connected = True
+        if self.io_thread_on:
+            self.reader_io = ReaderIO(rid_sock_set, self.raw_stream, self.capture, self.timers_dict, self.log)
+            self.reader_io.start()
+        self.timers_dict["reader-connected-since"] = time()
+        self.timers_dict["reader-last-act-time"] = time()
+        self.timers_dict["reader-disconnected-since"] = None
+        # Replies to commands sent on the previous connection never come
+        for __queue_sent_item in self.queue_sent.expire(float("inf")):
+            if "job-id" in __queue_sent_item[0]:
+                self.job_step_done(__queue_sent_item[0]["job-id"], __queue_sent_item[0]["job-step"], False, {"Error": "No reply from reader, connection to reader lost"})
+        # On-connect sequence starts in the very first pass, the one of the previous
+        # connection is not continued on this one
+        if self.on_connect_queries:
+            if self.on_connect_job_id is not None:
+                self.job_sequence_stop(self.on_connect_job_id, "Not sent, connection to reader lost")
+            self.on_connect_job_id = "on-connect-" + self.rid + "-" + "{0:x}".format(int(time() * 1000))
+            self.job_queue(self.on_connect_job_id, self.on_connect_queries, str(), True)
+        if self.time_sync_interval > 0:
+            self.time_sync_next = time()
+    def reader_send(self, data_bytes):
+        """
+        Send data_bytes to reader, returns time sent; on the shared event loop
+        the bytes are kept in send_pending and written by the driver after the pass
+        """
+        if self.loop_shared:
+            self.send_pending.append(data_bytes)
+            return time()
+        if self.reader_io is not None:
+            return self.reader_io.send(data_bytes)
+        self.rid_sock.sendall(data_bytes)
+        return time()
+    def reader_connection_lost(self, exc_error_descr):
+        """ Connection to reader is lost on error exc_error_descr out of run_once(), the socket is closed in the next pass """
+        if not self.session_state.connected:
+            return
+        self.session_state.connected = False
+        self.timers_dict["reader-connected-since"] = None
+        self.timers_dict["reader-disconnected-since"] = time()
+        self.log.log("Lost connection! " + repr(exc_error_descr))
+    def reader_connect_failed(self, sock_exception_err):
+        """ Connection attempt failed, timeout is not an error """
+        self.session_state.connected = False
+        if not isinstance(sock_exception_err, timeout):
+            self.timers_dict["reader-connected-since"] = None
+            self.timers_dict["reader-disconnected-since"] = None
+            self.log.log("Error during establishing connection")
+    def fme_scan(self):
+        """ Take requests of CLU and STS type from web out of fme into fme_CLU_recv_list and fme_STS_recv_list """
+        __fme_scan_start = perf_counter()
+        self.fme_msg.wake_drain()
+        self.fme_next_poll = time() + self.fme_poll_interval
+
+        # Getting messages of CLU type from web for sending to reader from fme_msg
+        __tmp_fme_CLU_recv_list = list()
+        __fme_msg_recv_count = int()
+        __fme_msg_recv_time_to_log = float()
+        __fme_msg_recv_list_item = tuple()
+        try:
+            __fme_msg_recv_count = self.fme_msg.rcv("*", "CLU", cutoff_time=self.timers_dict["process-up-since"])
+            __fme_msg_recv_time_to_log = time()
+        except Exception:
+            self.log.log("Error running fme_msg.rcv('*', 'CLU')")
+        if __fme_msg_recv_count < 0:
+            self.log.log("Error receiving fme_msg.rcv('*', 'CLU'): " + self.fme_msg.geterr())
+        elif __fme_msg_recv_count > 0:
+            __tmp_fme_CLU_recv_list = self.fme_msg.getall()
+            for __fme_msg_recv_list_item in __tmp_fme_CLU_recv_list:
+                if isinstance(__fme_msg_recv_list_item[0].get("trace"), dict):
+                    __fme_msg_recv_list_item[0]["trace"]["connector-pickup"] = __fme_msg_recv_time_to_log
+                if __fme_msg_recv_time_to_log:
+                    self.log.logc("api", "info", "Received from web API: %s", __fme_msg_recv_list_item, explicit_timestamp=__fme_msg_recv_time_to_log)
+        # Adding received queries to the global list
+        self.fme_CLU_recv_list += __tmp_fme_CLU_recv_list
+        # Some clean up
+        self.fme_msg.clearall()
+        del __fme_msg_recv_count, __fme_msg_recv_time_to_log, __fme_msg_recv_list_item, __tmp_fme_CLU_recv_list
+
+        # Getting messages of STS type from web for sending to reader from fme_msg
+        __tmp_fme_STS_recv_list = list()
+        __fme_msg_recv_count = int()
+        __fme_msg_recv_time_to_log = float()
+        __fme_msg_recv_list_item = tuple()
+        try:
+            __fme_msg_recv_count = self.fme_msg.rcv("*", "STS", cutoff_time=self.timers_dict["process-up-since"])
+            __fme_msg_recv_time_to_log = time()
+        except Exception:
+            self.log.log("Error running fme_msg.rcv('*', 'STS')")
+        if __fme_msg_recv_count < 0:
+            self.log.log("Error receiving fme_msg.rcv('*', 'STS'): " + self.fme_msg.geterr())
+        elif __fme_msg_recv_count > 0:
+            __tmp_fme_STS_recv_list = self.fme_msg.getall()
+            for __fme_msg_recv_list_item in __tmp_fme_STS_recv_list:
+                if isinstance(__fme_msg_recv_list_item[0].get("trace"), dict):
+                    __fme_msg_recv_list_item[0]["trace"]["connector-pickup"] = __fme_msg_recv_time_to_log
+                if __fme_msg_recv_time_to_log:
+                    self.log.logc("api", "info", "Received from web API: %s", __fme_msg_recv_list_item, explicit_timestamp=__fme_msg_recv_time_to_log)
+        # Adding received queries to the global list
+        self.fme_STS_recv_list += __tmp_fme_STS_recv_list
+        # Some clean up
+        self.fme_msg.clearall()
+        del __fme_msg_recv_count, __fme_msg_recv_time_to_log, __fme_msg_recv_list_item, __tmp_fme_STS_recv_list
+        if self.metrics is not None:
+            self.metrics.observe("clou_fme_scan_seconds", perf_counter() - __fme_scan_start)
+    def run_once(self, sel_events):
+        """
+        One pass of connector: connect, read and process frames from reader,
+        send requests from web, match replies, get and process requests from web.
+        sel_events - list() of names from sel_sources() ready to read.
+        Returns False when the connector is shut down.
+        """
+        if self.stage_timer is not None:
+            self.stage_timer.start()
+        # If not connected
+        if not self.session_state.connected:
+            # Socket of lost connection is closed here, after driver stopped waiting on it,
+            # and after reader I/O thread is over
+            if self.reader_io is not None:
+                self.reader_io.stop()
+                self.reader_io = None
+            if self.rid_sock is not None:
+                try:
+                    self.rid_sock.close()
+                except Exception:
+                    pass
+                self.rid_sock = None
+            # Connection procedure, when listening socket got the connection from reader,
+            # or when it is time for the next attempt to connect to reader
+            if (self.cfgrid["reader-mode"] == "client") and ("listen" in sel_events):
+                try:
+                    __accepted_sock, __accepted_addr = self.srv_basic_sock.accept()
+                    __accepted_sock.settimeout(float(self.cfgrid["sock-timeout"]))
+                    self.reader_connected(__accepted_sock, 'Accepted connection from ' + __accepted_addr[0] + ":" + str(__accepted_addr[1]) + "!")
+                except Exception as sock_exception_err:
+                    self.reader_connect_failed(sock_exception_err)
+            elif self.connect_in_run_once and self.reader_connect_due():
+                self.reader_next_connect = time() + float(self.cfgrid["sock-timeout"])
+                # New socket for every attempt, socket can not connect again after failed connect
+                __connect_sock = socket(AF_INET, SOCK_STREAM)
+                __connect_sock.settimeout(float(self.cfgrid["sock-timeout"]))
+                try:
+                    __connect_sock.connect((self.cfgrid["host"], self.cfgrid["port"]))
+                    self.reader_connected(__connect_sock, 'Connected to reader ' + self.cfgrid["host"] + ":" + str(self.cfgrid["port"]) + "!")
+                except Exception as sock_exception_err:
+                    __connect_sock.close()
+                    self.reader_connect_failed(sock_exception_err)
+            if self.stage_timer is not None:
+                self.stage_timer.lap("connect")
+
+        # If connected
+        elif self.session_state.connected:
+
+            if self.reader_io is None:
+                # Reading incoming stream from scanner
+                recv_chunk = bytes()
+                recv_chunk_time_to_log = float()
+                try:
+                    if "reader" in sel_events:
+                        recv_chunk = self.rid_sock.recv(2**12)   # Recieve data from socket
+                        if not recv_chunk:
+                            # Socket readable but no data means reader closed the connection
+                            raise ConnectionError("Connection closed by reader")
+                        recv_chunk_time_to_log = time()
+                        self.timers_dict["reader-last-act-time"] = recv_chunk_time_to_log
+                except Exception as sock_read_err:
+                    recv_chunk = bytes()
+                    if not isinstance(sock_read_err, (timeout, BlockingIOError)):
+                        self.session_state.connected = False
+                        self.timers_dict["reader-connected-since"] = None
+                        self.timers_dict["reader-disconnected-since"] = time()
+                        self.log.log("Lost connection!")
+                if recv_chunk:
+                    self.capture_write(clouprotocol.RawCapture.DIR_RECV, recv_chunk, recv_chunk_time_to_log)
+
+                # If received data not empty, add it to the stream processing instance
+                try:
+                    if recv_chunk:
+                        self.raw_stream.add_to_stream(recv_chunk)
+                except Exception:
+                    self.log.log("Error adding recv_chunk to ReceivedRawLine() instance")
+
+                # Clean up the chunk bytes() instance
+                del recv_chunk
+
+                # Unpack received data into frames straight now
+                try:
+                    if self.raw_stream.unpack() == -1:
+                        self.log.log("Reported error from unpack(): " + self.raw_stream.geterr())
+                except Exception:
+                    self.log.log("Error in try: except: in cloucon.py while unpacking")
+
+                # Log unknown bytes
+                unpack_unknowns = self.raw_stream.get_unknowns()
+                for unpack_unknowns_bytes in unpack_unknowns:
+                    self.log.log("Unknown bytes received from reader: [" + " ".join(format(idx_hex_conv, '02X') for idx_hex_conv in unpack_unknowns_bytes) + " ]")
             else:
-                log.log("Received from reader", instance_to_log=rfidframe_tolog, explicit_timestamp=recv_chunk_time_to_log, result_resp=frames_to_log_list_received[idx_prc_frm]["res"])
-        if tmp_log_tag_frames_count > 0:
-            log.log("Received from reader " + str(tmp_log_tag_frames_count) + " tag data frames", explicit_timestamp=recv_chunk_time_to_log)
-        frames_to_log_list_received = list()
-        del tmp_log_tag_frames_count
-
-        # and log urgent sent messages
-        if sent_success_flag:
+                # Frames were read from reader and confirmations sent by the I/O thread,
+                # here they are only taken from it
+                if "reader-io" in sel_events:
+                    self.reader_io.wake_drain()
+                __raw_frames = list()
+                while self.reader_io.frames:
+                    __raw_frames.append(self.reader_io.frames.popleft())
+                recv_chunk_time_to_log = __raw_frames[-1].recv_time if __raw_frames else float()
+                while self.reader_io.unknowns:
+                    unpack_unknowns_bytes = self.reader_io.unknowns.popleft()
+                    self.log.log("Unknown bytes received from reader: [" + " ".join(format(idx_hex_conv, '02X') for idx_hex_conv in unpack_unknowns_bytes) + " ]")
+                if self.reader_io.lost:
+                    self.session_state.connected = False
+                    self.timers_dict["reader-connected-since"] = None
+                    self.timers_dict["reader-disconnected-since"] = time()
+                    self.log.log("Lost connection!")
+
+            if self.stage_timer is not None:
+                self.stage_timer.lap("framing")
+
+            # Decoding all packets received in raw_stream.frames into ReceivedFrame() records,
+            # each frame is handled once: priority frames are answered instantly composing
+            # bytes line with answer to reader, the rest go to decoded_frames_list_dicts
+            # to search for answers from reader on frames sent by this process;
+            # with I/O thread the frames are decoded and answered already
+            if self.reader_io is None:
+                __raw_frames = self.raw_stream.frames
+                self.raw_stream.frames = list()
             tmp_log_tag_frames_count = int()
-            for idx_prc_frm in range(len(frames_to_log_list_sent)):
-                rfidframe_tolog.clear()
-                rfidframe_tolog.message_id = frames_to_log_list_sent[idx_prc_frm]["frame"][0]
-                rfidframe_tolog.message_type = frames_to_log_list_sent[idx_prc_frm]["frame"][1]
-                rfidframe_tolog.init_by_reader = frames_to_log_list_sent[idx_prc_frm]["frame"][2]
-                rfidframe_tolog.data_bytes = frames_to_log_list_sent[idx_prc_frm]["data"]
-                if frames_to_log_list_sent[idx_prc_frm]["frame"] == (D.MAN_TAG_DATA_RESPONSE, D.TYPE_CONF_MANAGE, D.INIT_BY_USER):
-                    if cfgrid["log-tag-frames"]:
-                        log.log("Sent to reader", instance_to_log=rfidframe_tolog, explicit_timestamp=sent_all_time_to_log)
+            __log_frames = self.log.enabled("frames", "debug")
+            __log_tag_frames = self.cfgrid["log-tag-frames"] and self.log.enabled("tags", "debug")
+            __tag_frames_to_decode = list()
+            __tag_frames_seen_time = recv_chunk_time_to_log or time()
+            for __raw_frame in __raw_frames:
+                if self.reader_io is None:
+                    rfidframe.clear()
+                    rfidframe.frame_raw_line = __raw_frame
+                    fr_prc = clouprotocol.ReceivedFrame(rfidframe.decodeFrame(), (rfidframe.message_id, rfidframe.message_type, rfidframe.init_by_reader), rfidframe.data_bytes, recv_chunk_time_to_log)
+                else:
+                    fr_prc = __raw_frame
+                # Tag frames are only counted in log, unless "log-tag-frames" is on and "tags" log level is debug,
+                # other frames are logged if "frames" log level is debug
+                if (fr_prc.frame == (D.OP_READER_EPC_DATA_UPLOAD, D.TYPE_CONF_OPERATE, D.INIT_BY_READER)) and (fr_prc.res == 0):
+                    if __log_tag_frames:
+                        self.frames_to_log_list_received.append(fr_prc)
                     else:
                         tmp_log_tag_frames_count += 1
+                elif __log_frames:
+                    self.frames_to_log_list_received.append(fr_prc)
+                if fr_prc.res != 0:
+                    continue
+                # Regular MAN_READER_CONN_CONFIRM 'pings' from Clou reader due to protocol
+                if fr_prc.frame == (D.MAN_READER_CONN_CONFIRM, D.TYPE_CONF_MANAGE, D.INIT_BY_READER):
+                    if (len(fr_prc.data) == 6) and (fr_prc.data[0] == 0x00) and (fr_prc.data[1] == 0x04):
+                        # Means, we work on reply only if the len of data bytes condition True,
+                        # otherwise just ignore this incoming message from reader
+                        if self.reader_io is None:
+                            rfidframe.clear()
+                            rfidframe.message_id = D.MAN_CONN_CONFIRM
+                            rfidframe.message_type = D.TYPE_CONF_MANAGE
+                            rfidframe.init_by_reader = D.INIT_BY_USER
+                            rfidframe.data_bytes = fr_prc.data[2:6]
+                            rfidframe.encodeFrame()
+                            # Here - append frame to the raw lite to send with high priority!
+                            self.frames_line_to_snd_1st += rfidframe.frame_raw_line
+                        # and here - append frame dict to the list for further logging
+                        # log message to send
+                        if __log_frames:
+                            self.frames_to_log_list_sent.append({"frame": (D.MAN_CONN_CONFIRM, D.TYPE_CONF_MANAGE, D.INIT_BY_USER), "data": fr_prc.data[2:6], "res": 0})
+                # After receiving the tag data frame always need to confirm that to Clou reader due to protocol
+                elif fr_prc.frame == (D.OP_READER_EPC_DATA_UPLOAD, D.TYPE_CONF_OPERATE, D.INIT_BY_READER):
+                    __tag_series_num = None
+                    if self.metrics is not None:
+                        self.metrics.inc("clou_tag_frames_total")
+                    if self.tag_decode_pool is not None:
+                        # Tag goes to worker processes, here only the series number for the answer
+                        __tag_frames_to_decode.append((fr_prc.data, __tag_frames_seen_time))
+                        __tag_series_num = tagframe.seriesNum(fr_prc.data)
+                    else:
+                        tagframe.decodeTag(fr_prc.data)
+                        if not tagframe.decode_error:
+                            # If tag data decoded correctly, store the unique tag in the tag_buf
+                            self.tag_store(tagframe, tagframe.dedupeKey(tag_dedupe_exclude), __tag_frames_seen_time)
+                            __tag_series_num = tagframe.params.get(0x08)
+                        else:
+                            # If tag data decoding problem - leave the frame for future analysis
+                            self.decoded_frames_list_dicts.append(fr_prc)
+                    # If tag data has the series number, build the answer to reader
+                    if __tag_series_num is not None:
+                        if self.reader_io is None:
+                            rfidframe.clear()
+                            rfidframe.message_id = D.MAN_TAG_DATA_RESPONSE
+                            rfidframe.message_type = D.TYPE_CONF_MANAGE
+                            rfidframe.init_by_reader = D.INIT_BY_USER
+                            rfidframe.data_bytes = __tag_series_num
+                            rfidframe.encodeFrame()
+                            self.frames_line_to_snd_1st += rfidframe.frame_raw_line
+                        # log message to send, or only count it
+                        if __log_tag_frames:
+                            self.frames_to_log_list_sent.append({"frame": (D.MAN_TAG_DATA_RESPONSE, D.TYPE_CONF_MANAGE, D.INIT_BY_USER), "data": __tag_series_num, "res": 0})
+                        else:
+                            self.frames_to_log_count_sent_tags += 1
+                    del __tag_series_num
                 else:
-                    log.log("Sent to reader", instance_to_log=rfidframe_tolog, explicit_timestamp=sent_all_time_to_log)
+                    self.decoded_frames_list_dicts.append(fr_prc)
+
+            # Tag frames of the pass go to worker processes, encoded in dict() there if an inventory is open
+            if __tag_frames_to_decode:
+                self.tag_decode_pool.submit(__tag_frames_to_decode, any((__inv["window-start"] is not None) and (__inv["window-end"] is None) for __inv in self.inventories.values()))
+            del __raw_frames, __log_frames, __log_tag_frames, __tag_frames_to_decode, __tag_frames_seen_time
+
+            if self.stage_timer is not None:
+                self.stage_timer.lap("decode")
+
+            # Here send the first priority reply to reader =======
+            sent_all_time_to_log = float()
+            sent_success_flag = False
+            if self.reader_io is not None:
+                # Answers were sent by the I/O thread already, here only logged
+                sent_success_flag = True
+                sent_all_time_to_log = recv_chunk_time_to_log
+            elif len(self.frames_line_to_snd_1st) > 0:
+                try:
+                    # Here send!
+                    sent_all_time_to_log = self.reader_send(self.frames_line_to_snd_1st)
+                    sent_success_flag = True
+                except Exception as sock_read_err:
+                    if not isinstance(sock_read_err, timeout):
+                        self.session_state.connected = False
+                        self.timers_dict["reader-connected-since"] = None
+                        self.timers_dict["reader-disconnected-since"] = time()
+                        self.log.log("Lost connection!")
+                if sent_success_flag:
+                    self.capture_write(clouprotocol.RawCapture.DIR_SENT, self.frames_line_to_snd_1st, sent_all_time_to_log)
+                    # If sent successfully - clear buffer
+                    self.frames_line_to_snd_1st = bytes()
+
+            if self.stage_timer is not None:
+                self.stage_timer.lap("send")
+
+            # And log all received, tag frames were counted while decoding
+            for fr_prc in self.frames_to_log_list_received:
+                rfidframe_tolog.clear()
+                rfidframe_tolog.message_id = fr_prc.frame[0]
+                rfidframe_tolog.message_type = fr_prc.frame[1]
+                rfidframe_tolog.init_by_reader = fr_prc.frame[2]
+                rfidframe_tolog.data_bytes = fr_prc.data
+                self.log.log("Received from reader", instance_to_log=rfidframe_tolog, explicit_timestamp=recv_chunk_time_to_log, result_resp=fr_prc.res)
+                if (fr_prc.frame == (D.OP_READER_EPC_DATA_UPLOAD, D.TYPE_CONF_OPERATE, D.INIT_BY_READER)) and (fr_prc.res == 0):
+                    tagframe_tolog.decodeTag(fr_prc.data)
+                    self.log.log(str(), instance_to_log=tagframe_tolog, put_timestamp=False)
             if tmp_log_tag_frames_count > 0:
-                log.log("Sent to reader " + str(tmp_log_tag_frames_count) + " tag data frame confirmations", explicit_timestamp=sent_all_time_to_log)
-            frames_to_log_list_sent = list()
+                self.log.logc("tags", "info", "Received from reader %s tag data frames", str(tmp_log_tag_frames_count), explicit_timestamp=recv_chunk_time_to_log)
+            self.frames_to_log_list_received = list()
             del tmp_log_tag_frames_count
 
-        # Cleanup
-        del sent_all_time_to_log, sent_success_flag
+            # and log urgent sent messages
+            if sent_success_flag:
+                for idx_prc_frm in range(len(self.frames_to_log_list_sent)):
+                    rfidframe_tolog.clear()
+                    rfidframe_tolog.message_id = self.frames_to_log_list_sent[idx_prc_frm]["frame"][0]
+                    rfidframe_tolog.message_type = self.frames_to_log_list_sent[idx_prc_frm]["frame"][1]
+                    rfidframe_tolog.init_by_reader = self.frames_to_log_list_sent[idx_prc_frm]["frame"][2]
+                    rfidframe_tolog.data_bytes = self.frames_to_log_list_sent[idx_prc_frm]["data"]
+                    self.log.log("Sent to reader", instance_to_log=rfidframe_tolog, explicit_timestamp=sent_all_time_to_log)
+                if self.frames_to_log_count_sent_tags > 0:
+                    self.log.logc("tags", "info", "Sent to reader %s tag data frame confirmations", str(self.frames_to_log_count_sent_tags), explicit_timestamp=sent_all_time_to_log)
+                self.frames_to_log_list_sent = list()
+                self.frames_to_log_count_sent_tags = int()
 
-        # Here we process clou type of web requests
-        # First assure having the chronological order
-        try:
-            __tmp_fme_recv_list = list()
-            __tmp_fme_recv_list = sorted(fme_CLU_recv_list, key=lambda __key: __key[1])
-            fme_CLU_recv_list = list()
-            fme_CLU_recv_list = deepcopy(__tmp_fme_recv_list)
-            del __tmp_fme_recv_list
-        except Exception:
-            log.log("Error sorting fme_CLU_recv_list list")
-        # Then here processing of incoming API requests for CLU type
-        fme_CLU_recv_list_item = tuple()
-        fme_CLU_recv_list_len = len(fme_CLU_recv_list)
-        # Progress counter for logging sensitive parsing possible break point
-        __progress_snd_CLU = int()
-        for __tmp_idx_fme in range(fme_CLU_recv_list_len):
+            # Cleanup
+            del sent_all_time_to_log, sent_success_flag
+
+            if self.stage_timer is not None:
+                self.stage_timer.lap("logging")
+
+            # Inventories with the window over get the stop command,
+            # it goes to reader in this same cycle
+            for __inv_job_id in self.inventories.keys():
+                if (self.inventories[__inv_job_id]["stop-at"] is not None) and (not self.inventories[__inv_job_id]["stop-queued"]) and (time() >= self.inventories[__inv_job_id]["stop-at"]):
+                    self.inventories[__inv_job_id]["stop-queued"] = True
+                    self.fme_CLU_recv_list.append(({"web-req-id": __inv_job_id, "query-content": {"msid": "OP_STOP", "prms": {}}, "job-id": __inv_job_id, "job-step": 1}, time(), self.inventories[__inv_job_id]["from-id"]))
+
+            # Reader clock set to server time, when due
+            if (self.time_sync_next is not None) and (time() >= self.time_sync_next):
+                self.time_sync()
+
+            # Here we process clou type of web requests
+            # First assure having the chronological order
+            # (sorting is linear for the list already in order), items are moved by reference
             try:
-                __progress_snd_CLU = 1
-                fme_CLU_recv_list_item = fme_CLU_recv_list.pop(0)
-                __progress_snd_CLU = 2
-                __snd_val_dict = fme_CLU_recv_list_item[0]["query-content"]
-                __progress_snd_CLU = 3
-                __snd_to_snd_dict = cmd_ref_dict[__snd_val_dict["msid"]]["snd"]
-                __progress_snd_CLU = 4
-                __copy_tmp_dict = deepcopy(__snd_to_snd_dict["prms"])
-                for __prms_item_key in __copy_tmp_dict.keys():
-                    __progress_snd_CLU = 5
-                    if __prms_item_key in __snd_val_dict["prms"].keys():
-                        __progress_snd_CLU = 6
-                        __snd_to_snd_dict["prms"][__prms_item_key]["val"] = __snd_val_dict["prms"][__prms_item_key]["val"]
-                    else:
-                        if __snd_to_snd_dict["prms"][__prms_item_key]["pid"] != "M":
-                            # Remove whole key for optional parameter not present in __snd_val_dict
-                            # if this parameter is not mandatory
-                            __progress_snd_CLU = 7
-                            del __snd_to_snd_dict["prms"][__prms_item_key]
+                self.fme_CLU_recv_list = deque(sorted(self.fme_CLU_recv_list, key=lambda __key: __key[1]))
+            except Exception:
+                self.log.log("Error sorting fme_CLU_recv_list list")
+            # Then all of them go to the scheduler, waiting there for their turn
+            # and the room in the in-flight window, until the web caller times out;
+            # steps of jobs wait as long as it takes, no web caller waits for them
+            fme_CLU_recv_list_item = tuple()
+            while self.fme_CLU_recv_list:
+                fme_CLU_recv_list_item = self.fme_CLU_recv_list.popleft()
+                try:
+                    self.cmd_scheduler.add(fme_CLU_recv_list_item, None if "job-id" in fme_CLU_recv_list_item[0] else fme_CLU_recv_list_item[1] + reply_from_reader_timeout)
+                except Exception as __exc_error_descr:
+                    self.log.logc("api", "error", "Error '%s' scheduling API command from web: %s", __exc_error_descr, fme_CLU_recv_list_item)
+                    if "job-id" in fme_CLU_recv_list_item[0]:
+                        self.job_step_done(fme_CLU_recv_list_item[0]["job-id"], fme_CLU_recv_list_item[0]["job-step"], False, {"Error": "Error scheduling command: " + repr(__exc_error_descr)})
+            __cmds_to_send, __cmds_dropped = self.cmd_scheduler.take(time(), len(self.queue_sent) + len(self.queue_to_send), self.queue_sent, {__queue_to_send_item[1] for __queue_to_send_item in self.queue_to_send})
+            for fme_CLU_recv_list_item in __cmds_dropped:
+                self.log.logc("api", "warning", "Command dropped not sent, web API request timed out waiting in scheduler: %s", fme_CLU_recv_list_item)
+                if "job-id" in fme_CLU_recv_list_item[0]:
+                    self.job_step_done(fme_CLU_recv_list_item[0]["job-id"], fme_CLU_recv_list_item[0]["job-step"], False, {"Error": "Command not sent within reply-from-reader-timeout"})
+            # Then here processing of incoming API requests for CLU type taken by the scheduler to send now
+            # Progress counter for logging sensitive parsing possible break point
+            __progress_snd_CLU = int()
+            for fme_CLU_recv_list_item, __reply_key in __cmds_to_send:
+                try:
+                    __progress_snd_CLU = 2
+                    __snd_val_dict = fme_CLU_recv_list_item[0]["query-content"]
+                    __progress_snd_CLU = 3
+                    __snd_to_snd_dict = deepcopy(cmd_ref_dict[__snd_val_dict["msid"]]["snd"])
+                    __progress_snd_CLU = 4
+                    __copy_tmp_dict = deepcopy(__snd_to_snd_dict["prms"])
+                    for __prms_item_key in __copy_tmp_dict.keys():
+                        __progress_snd_CLU = 5
+                        if __prms_item_key in __snd_val_dict.get("prms", dict()).keys():
+                            __progress_snd_CLU = 6
+                            __snd_to_snd_dict["prms"][__prms_item_key]["val"] = __snd_val_dict["prms"][__prms_item_key]["val"]
                         else:
-                            # And if the parameter was mandatory going for exception
-                            __progress_snd_CLU = 1001
-                            raise Exception
-                del __copy_tmp_dict
-                rfidframe.clear()
-                __progress_snd_CLU = 8
-                rfidframe.message_type = D.PARAM_HEADER_TYPE[__snd_to_snd_dict["mtyp"]]
-                __progress_snd_CLU = 9
-                rfidframe.init_by_reader = D.PARAM_HEADER_INIT[__snd_to_snd_dict["init"]]
-                __progress_snd_CLU = 10
-                rfidframe.message_id = D.MID[rfidframe.message_type][rfidframe.init_by_reader][__snd_to_snd_dict["msid"]]
-                __progress_snd_CLU = 11
-                rfidframe.data_bytes = packframes.packFromSndDict(__snd_to_snd_dict)
-                __progress_snd_CLU = 12
-                if packframes.decode_error:
-                    # In case of packing error we just log it, skip and forget this message received from API
-                    __progress_snd_CLU = 13
-                    log.log("Error packframes.packFromSndDict() " + packframes.decode_error_text + ": " + repr(__snd_to_snd_dict))
+                            if __snd_to_snd_dict["prms"][__prms_item_key]["pid"] != "M":
+                                # Remove whole key for optional parameter not present in __snd_val_dict
+                                # if this parameter is not mandatory
+                                __progress_snd_CLU = 7
+                                del __snd_to_snd_dict["prms"][__prms_item_key]
+                            else:
+                                # And if the parameter was mandatory going for exception
+                                __progress_snd_CLU = 1001
+                                raise Exception
+                    del __copy_tmp_dict
                     rfidframe.clear()
-                else:
-                    __progress_snd_CLU = 14
-                    rfidframe.encodeFrame()
-                    frames_line_to_snd_std += rfidframe.frame_raw_line
-                    # Add the message planned to send to main queue == reader <-> this app == exchange
-                    queue_to_send.append(fme_CLU_recv_list_item)
-                    # And log message to send
-                    __progress_snd_CLU = 15
-                    std_frames_to_log_list_sent.append({"frame": (rfidframe.message_id, rfidframe.message_type, rfidframe.init_by_reader), "data": rfidframe.data_bytes, "res": 0})
-            except Exception as __exc_error_descr:
-                log.log("Error '" + repr(__exc_error_descr) + "' processing API command from web at __progress_snd_CLU = " + repr(__progress_snd_CLU) + ": " + repr(fme_CLU_recv_list_item))
-        # Some cleanup
-        del fme_CLU_recv_list_item, fme_CLU_recv_list_len, __progress_snd_CLU
+                    __progress_snd_CLU = 8
+                    rfidframe.message_type = D.PARAM_HEADER_TYPE[__snd_to_snd_dict["mtyp"]]
+                    __progress_snd_CLU = 9
+                    rfidframe.init_by_reader = D.PARAM_HEADER_INIT[__snd_to_snd_dict["init"]]
+                    __progress_snd_CLU = 10
+                    rfidframe.message_id = D.MID[rfidframe.message_type][rfidframe.init_by_reader][__snd_to_snd_dict["msid"]]
+                    __progress_snd_CLU = 11
+                    rfidframe.data_bytes = packframes.packFromSndDict(__snd_to_snd_dict)
+                    __progress_snd_CLU = 12
+                    if packframes.decode_error:
+                        # In case of packing error we just log it, skip and forget this message received from API
+                        __progress_snd_CLU = 13
+                        self.log.logc("api", "error", "Error packframes.packFromSndDict() %s: %s", packframes.decode_error_text, __snd_to_snd_dict)
+                        rfidframe.clear()
+                        if "job-id" in fme_CLU_recv_list_item[0]:
+                            self.job_step_done(fme_CLU_recv_list_item[0]["job-id"], fme_CLU_recv_list_item[0]["job-step"], False, {"Error": "Error packing command: " + packframes.decode_error_text})
+                    else:
+                        __progress_snd_CLU = 14
+                        rfidframe.encodeFrame()
+                        if "trace" in fme_CLU_recv_list_item[0]:
+                            fme_CLU_recv_list_item[0]["trace"]["frame-encoded"] = time()
+                        self.frames_line_to_snd_std += rfidframe.frame_raw_line
+                        # Add the message planned to send to main queue == reader <-> this app == exchange,
+                        # with the key of reply expected for matching
+                        self.queue_to_send.append((fme_CLU_recv_list_item, __reply_key))
+                        # And log message to send
+                        __progress_snd_CLU = 15
+                        self.std_frames_to_log_list_sent.append({"frame": (rfidframe.message_id, rfidframe.message_type, rfidframe.init_by_reader), "data": rfidframe.data_bytes, "res": 0})
+                except Exception as __exc_error_descr:
+                    self.log.logc("api", "error", "Error '%s' processing API command from web at __progress_snd_CLU = %s: %s", __exc_error_descr, __progress_snd_CLU, fme_CLU_recv_list_item)
+                    if fme_CLU_recv_list_item and ("job-id" in fme_CLU_recv_list_item[0]):
+                        self.job_step_done(fme_CLU_recv_list_item[0]["job-id"], fme_CLU_recv_list_item[0]["job-step"], False, {"Error": "Error processing command: " + repr(__exc_error_descr)})
+            # Some cleanup
+            del fme_CLU_recv_list_item, __progress_snd_CLU, __cmds_to_send, __cmds_dropped
 
-        # Here send the regular priority requests to reader =======
-        std_sent_success_flag = False
-        std_sent_all_time_to_log = float()
-        if len(frames_line_to_snd_std) > 0:
-            try:
-                # Here send!
-                if rid_sock.sendall(frames_line_to_snd_std) is None:
+            if self.stage_timer is not None:
+                self.stage_timer.lap("commands")
+
+            # Here send the regular priority requests to reader =======
+            std_sent_success_flag = False
+            std_sent_all_time_to_log = float()
+            if len(self.frames_line_to_snd_std) > 0:
+                try:
+                    # Here send!
+                    std_sent_all_time_to_log = self.reader_send(self.frames_line_to_snd_std)
                     std_sent_success_flag = True
-                    std_sent_all_time_to_log = time()
+                    if self.reader_io is not None:
+                        # Captured by reader I/O thread
+                        self.frames_line_to_snd_std = bytes()
+                except Exception as sock_read_err:
+                    if not isinstance(sock_read_err, timeout):
+                        self.session_state.connected = False
+                        self.timers_dict["reader-connected-since"] = None
+                        self.timers_dict["reader-disconnected-since"] = time()
+                        self.log.log("Lost connection!")
+                if std_sent_success_flag and self.frames_line_to_snd_std:
+                    self.capture_write(clouprotocol.RawCapture.DIR_SENT, self.frames_line_to_snd_std, std_sent_all_time_to_log)
                     # If sent successfully - clear buffer
-                    frames_line_to_snd_std = bytes()
-            except Exception as sock_read_err:
-                if not isinstance(sock_read_err, timeout):
-                    session_state.connected = False
-                    timers_dict["reader-connected-since"] = None
-                    timers_dict["reader-disconnected-since"] = time()
-                    log.log("Lost connection!")
-        # And log it - and add to queue_sent!
-        if std_sent_success_flag:
-            for idx_prc_frm in range(len(std_frames_to_log_list_sent)):
-                rfidframe_tolog.clear()
-                rfidframe_tolog.message_id = std_frames_to_log_list_sent[idx_prc_frm]["frame"][0]
-                rfidframe_tolog.message_type = std_frames_to_log_list_sent[idx_prc_frm]["frame"][1]
-                rfidframe_tolog.init_by_reader = std_frames_to_log_list_sent[idx_prc_frm]["frame"][2]
-                rfidframe_tolog.data_bytes = std_frames_to_log_list_sent[idx_prc_frm]["data"]
-                log.log("Sent to reader", instance_to_log=rfidframe_tolog, explicit_timestamp=std_sent_all_time_to_log)
-            std_frames_to_log_list_sent = list()
-            # Adding sent requests to uqeue_sent list for further matching!
-            __queue_to_send_item = tuple()
-            for __queue_to_send_item in queue_to_send:
-                queue_sent.append(__queue_to_send_item)
-            queue_to_send = list()
-            del __queue_to_send_item
-        # Cleanup of temporary objects
-        del std_sent_all_time_to_log, std_sent_success_flag
-
-        # Before matching need to erase outdated commands sent to reader in queue_sent,
-        # because no sense to match them as web API request already timed out
-        queue_sent_item = tuple()
-        __tmp_queue_sent = list()
-        queue_sent_len = len(queue_sent)
-        for __queue_sent_idx in range(queue_sent_len):
-            queue_sent_item = queue_sent.pop(0)
-            if (time() - queue_sent_item[1]) < reply_from_reader_timeout:
-                __tmp_queue_sent.append(queue_sent_item)
-        queue_sent = list()
-        if __tmp_queue_sent:
-            queue_sent = deepcopy(__tmp_queue_sent)
-        del queue_sent_item, __tmp_queue_sent, queue_sent_len
-
-        # Here we finally iterate through frames (in decoded_frames_list_dicts) received in
-        # this cycle and remaining after extracting urgent messages from them, (and remaining
-        # from the previous cycles as well!) and try to match these
-        # frames with frames that we sent to the reader earlier - to find replies from reader.
-        # We match in chronological order, match by MID, type and receive,
-        # also we match error messages from reader that contain MID and length
-        # indication. For more information look Clou protocol specification.
-        #
-        # Also we erase commands received from API and sent to reader (in queue_sent) that are
-        # too old, older than "reply-from-reader-timeout" setting in clou.conf,
-        # and we log frames received from reader (in decoded_frames_list_dicts) on this cycle
-        # that were not matched. Means, that no frame in decoded_frames_list_dicts will go to the next
-        # cycle.
-        #
-        # First assure having the chronological order
-        try:
-            __tmp_frames_list = list()
-            __tmp_frames_list = sorted(decoded_frames_list_dicts, key=lambda __key: __key["recv-time"])
-            decoded_frames_list_dicts = list()
-            decoded_frames_list_dicts = deepcopy(__tmp_frames_list)
-            del __tmp_frames_list
-        except Exception:
-            log.log("Error sorting decoded_frames_list_dicts list")
-        # Here the iteration cycle to match, those not matched just skipped and forgot
-        frames_item = dict()
-        __unpack_dict = dict()
-        __tmp_idx_frames_list = int()
-        __match_tuple = tuple()
-        decoded_frames_list_dicts_len = len(decoded_frames_list_dicts)
-        for __tmp_idx_frames_list in range(decoded_frames_list_dicts_len):
-            # Pop the first element from the list of frames received from reader
-            frames_item = decoded_frames_list_dicts.pop(0)
-            # Unpack this frame to template "rcv" formatted dict()
-            __unpack_dict = packframes.unpackToRcvDict(frames_item)
-            if packframes.decode_error:
-                log.log("packframes.unpackToRcvDict(frames_item): " + packframes.decode_error_text)
-            else:
-                # Here we first extract the matching tuple from the item of decoded_frames_list_dicts
-                # to match item of decoded_frames_list_dicts with items in queue_sent
-                __match_tuple = tuple()
-                __rcv_match_tuple = tuple()
-                if __unpack_dict["msid"] == "ERR_MID":
-                    # If reader replied with error
-                    try:
-                        rfidframe.clear()
-                        rfidframe.frame_raw_line = __unpack_dict["prms"]["ctrlword"]["val"].to_bytes(2, 'big')
-                        __ctrl_word_res = rfidframe.decodeCtrlWord()
-                        if __ctrl_word_res != 0:
-                            raise Exception
-                        __match_tuple = (rfidframe.message_id, rfidframe.message_type, rfidframe.init_by_reader)
-                        rfidframe.clear()
-                    except Exception as __exc_error_descr:
-                        log.log("Error unpacking control word of ERR_WARN message from reader: " + repr(__exc_error_descr))
+                    self.frames_line_to_snd_std = bytes()
+            if self.stage_timer is not None:
+                self.stage_timer.lap("send")
+            # And log it - and add to queue_sent!
+            if std_sent_success_flag:
+                if not self.log.enabled("frames", "debug"):
+                    self.std_frames_to_log_list_sent = list()
+                for idx_prc_frm in range(len(self.std_frames_to_log_list_sent)):
+                    rfidframe_tolog.clear()
+                    rfidframe_tolog.message_id = self.std_frames_to_log_list_sent[idx_prc_frm]["frame"][0]
+                    rfidframe_tolog.message_type = self.std_frames_to_log_list_sent[idx_prc_frm]["frame"][1]
+                    rfidframe_tolog.init_by_reader = self.std_frames_to_log_list_sent[idx_prc_frm]["frame"][2]
+                    rfidframe_tolog.data_bytes = self.std_frames_to_log_list_sent[idx_prc_frm]["data"]
+                    self.log.log("Sent to reader", instance_to_log=rfidframe_tolog, explicit_timestamp=std_sent_all_time_to_log)
+                self.std_frames_to_log_list_sent = list()
+                # Adding sent requests to uqeue_sent for further matching!
+                __queue_to_send_item = tuple()
+                __reply_key = tuple()
+                for __queue_to_send_item, __reply_key in self.queue_to_send:
+                    self.queue_sent.add(__reply_key, __queue_to_send_item, std_sent_all_time_to_log + reply_from_reader_timeout, std_sent_all_time_to_log)
+                    if "trace" in __queue_to_send_item[0]:
+                        __queue_to_send_item[0]["trace"]["bytes-sent"] = std_sent_all_time_to_log
+                    # Inventory window opens when the start reading command is sent
+                    if ("job-id" in __queue_to_send_item[0]) and (__queue_to_send_item[0]["job-step"] == 0) and (__queue_to_send_item[0]["job-id"] in self.inventories):
+                        self.inventories[__queue_to_send_item[0]["job-id"]]["window-start"] = std_sent_all_time_to_log
+                        self.inventories[__queue_to_send_item[0]["job-id"]]["stop-at"] = std_sent_all_time_to_log + self.inventories[__queue_to_send_item[0]["job-id"]]["duration"]
+                self.queue_to_send = list()
+                del __queue_to_send_item, __reply_key
+            # Cleanup of temporary objects
+            del std_sent_all_time_to_log, std_sent_success_flag
+
+            if self.stage_timer is not None:
+                self.stage_timer.lap("logging")
+
+            # Tags decoded by worker processes are stored before matching, all of them
+            # if stop of an inventory may be replied, for the inventory to get its tags
+            if self.tag_decode_pool is not None:
+                self.tag_decode_results(any(__inv["stop-queued"] for __inv in self.inventories.values()))
+
+            if self.stage_timer is not None:
+                self.stage_timer.lap("decode")
+
+            # Before matching need to erase outdated commands sent to reader in queue_sent,
+            # waiting for reply longer than reply-from-reader-timeout since sent
+            for queue_sent_item in self.queue_sent.expire(time()):
+                if self.metrics is not None:
+                    self.metrics.inc("clou_command_timeouts_total", 1, (queue_sent_item[0]["query-content"].get("msid"),))
+                if "job-id" in queue_sent_item[0]:
+                    self.job_step_done(queue_sent_item[0]["job-id"], queue_sent_item[0]["job-step"], False, {"Error": "No reply from reader within reply-from-reader-timeout"})
+
+            # Here we finally iterate through frames (in decoded_frames_list_dicts) received in
+            # this cycle and remaining after extracting urgent messages from them, (and remaining
+            # from the previous cycles as well!) and try to match these
+            # frames with frames that we sent to the reader earlier - to find replies from reader.
+            # We match in chronological order, match by MID, type and receive,
+            # also we match error messages from reader that contain MID and length
+            # indication. For more information look Clou protocol specification.
+            #
+            # Also we erase commands received from API and sent to reader (in queue_sent) that are
+            # too old, older than "reply-from-reader-timeout" setting in clou.conf,
+            # and we log frames received from reader (in decoded_frames_list_dicts) on this cycle
+            # that were not matched. Means, that no frame in decoded_frames_list_dicts will go to the next
+            # cycle.
+            #
+            # Frames are in decoded_frames_list_dicts in order of receiving already.
+            # Here the iteration cycle to match, those not matched just skipped and forgot
+            frames_item = None
+            __unpack_dict = dict()
+            __match_tuple = tuple()
+            while self.decoded_frames_list_dicts:
+                # Take the first element from the queue of frames received from reader
+                frames_item = self.decoded_frames_list_dicts.popleft()
+                # Unpack this frame to template "rcv" formatted dict()
+                __unpack_dict = packframes.unpackToRcvDict({"frame": frames_item.frame, "data": frames_item.data})
+                if packframes.decode_error:
+                    self.log.log("packframes.unpackToRcvDict(frames_item): " + packframes.decode_error_text)
                 else:
-                    # Use rfidframe only as temporary storage of parameters
-                    rfidframe.clear()
-                    rfidframe.message_type = D.PARAM_HEADER_TYPE[__unpack_dict["mtyp"]]
-                    rfidframe.init_by_reader = D.PARAM_HEADER_INIT[__unpack_dict["init"]]
-                    rfidframe.message_id = D.MID[rfidframe.message_type][rfidframe.init_by_reader][__unpack_dict["msid"]]
-                    __match_tuple = (rfidframe.message_id, rfidframe.message_type, rfidframe.init_by_reader)
-                    rfidframe.clear()
-                # Now in __match_tuple we have the pattern of the frame frames_item received from reader
-                # And below we search through queue_sent to get the first match
-                __matched_flag = False
-                queue_sent_item = tuple()
-                __tmp_queue_sent = list()
-                queue_sent_len = len(queue_sent)
-                try:
-                    for __queue_sent_idx in range(queue_sent_len):
-                        queue_sent_item = queue_sent.pop(0)
-                        # ! Here is the important trick: we take from template reference cmd_ref_dict
-                        # the ["rcv"] key of template - BUT from the template corresponding to the
-                        # ["msid"] key of queue_sent_item, means the MID of the item from queue_sent
-                        # to match below:
-                        __rcv_match = cmd_ref_dict[queue_sent_item[0]["query-content"]["msid"]]["rcv"]
-                        # Use rfidframe only as temporary storage of parameters
-                        rfidframe.clear()
-                        rfidframe.message_type = D.PARAM_HEADER_TYPE[__rcv_match["mtyp"]]
-                        rfidframe.init_by_reader = D.PARAM_HEADER_INIT[__rcv_match["init"]]
-                        rfidframe.message_id = D.MID[rfidframe.message_type][rfidframe.init_by_reader][__rcv_match["msid"]]
-                        __rcv_match_tuple = (rfidframe.message_id, rfidframe.message_type, rfidframe.init_by_reader)
-                        rfidframe.clear()
-                        # AND HERE FINALLY MATCH
-                        if __rcv_match_tuple == __match_tuple:
+                    # Here we first extract the matching tuple from the item of decoded_frames_list_dicts
+                    # to match item of decoded_frames_list_dicts with items in queue_sent
+                    __match_tuple = tuple()
+                    if __unpack_dict["msid"] == "ERR_MID":
+                        # If reader replied with error
+                        try:
+                            rfidframe.clear()
+                            rfidframe.frame_raw_line = __unpack_dict["prms"]["ctrlword"]["val"].to_bytes(2, 'big')
+                            __ctrl_word_res = rfidframe.decodeCtrlWord()
+                            if __ctrl_word_res != 0:
+                                raise Exception
+                            __match_tuple = (rfidframe.message_id, rfidframe.message_type, rfidframe.init_by_reader)
+                            rfidframe.clear()
+                        except Exception as __exc_error_descr:
+                            self.log.log("Error unpacking control word of ERR_WARN message from reader: " + repr(__exc_error_descr))
+                    else:
+                        # Frame tuple is (message_id, message_type, init_by_reader) already
+                        __match_tuple = frames_item.frame
+                    # Now in __match_tuple we have the pattern of the frame frames_item received from reader,
+                    # and queue_sent gives the oldest command waiting for this reply - its key was taken
+                    # at enqueue from ["rcv"] of the command template in cmd_ref_dict
+                    __matched_flag = False
+                    queue_sent_item = tuple()
+                    try:
+                        queue_sent_item = self.queue_sent.match(__match_tuple)
+                        if queue_sent_item is not None:
                             # If matched - send the reply to API!
                             __matched_flag = True
+                            if (self.metrics is not None) and (self.queue_sent.matched_sent_time is not None):
+                                self.metrics.observe("clou_command_rtt_seconds", (frames_item.recv_time or time()) - self.queue_sent.matched_sent_time, (queue_sent_item[0]["query-content"].get("msid"),))
+                            if "job-id" in queue_sent_item[0]:
+                                # Step of a job - store reply in the job
+                                self.job_step_done(queue_sent_item[0]["job-id"], queue_sent_item[0]["job-step"], reply_is_ok(__unpack_dict), __unpack_dict)
+                            else:
+                                msg_content_to_send = dict()
+                                msg_content_to_send["web-req-id"] = queue_sent_item[0]["web-req-id"]
+                                msg_content_to_send["reply-content"] = __unpack_dict
+                                if "trace" in queue_sent_item[0]:
+                                    queue_sent_item[0]["trace"]["reply-received"] = frames_item.recv_time or time()
+                                self.trace_reply(msg_content_to_send, queue_sent_item[0])
+                                if self.fme_msg.snd(queue_sent_item[2], "CLU", msg_content_to_send) == 0:
+                                    self.log.logc("api", "info", "Replied to web API: %s", __unpack_dict)
+                                else:
+                                    self.log.logc("api", "error", "Error (%s) replying to web API: %s", self.fme_msg.geterr(), msg_content_to_send)
+                                del msg_content_to_send
+                    except Exception as __exc_error_descr:
+                        try:
+                            if "job-id" in queue_sent_item[0]:
+                                self.job_step_done(queue_sent_item[0]["job-id"], queue_sent_item[0]["job-step"], False, {"Error": "Error (" + repr(__exc_error_descr) + ") processing reply"})
+                                raise Exception
                             msg_content_to_send = dict()
                             msg_content_to_send["web-req-id"] = queue_sent_item[0]["web-req-id"]
-                            msg_content_to_send["reply-content"] = __unpack_dict
-                            if fme_msg.snd(queue_sent_item[2], "CLU", msg_content_to_send) == 0:
-                                log.log("Replied to web API: " + repr(__unpack_dict))
+                            msg_content_to_send["reply-content"] = {"Error": "Error (" + repr(__exc_error_descr) + ") processing queue_sent item: " + repr(queue_sent_item)}
+                            self.trace_reply(msg_content_to_send, queue_sent_item[0])
+                            if self.fme_msg.snd(queue_sent_item[2], "CLU", msg_content_to_send) == 0:
+                                self.log.log("Replied error to web API")
                             else:
-                                log.log("Error (" + repr(fme_msg.geterr()) + ") replying to web API: " + repr(msg_content_to_send))
+                                self.log.log("Error (" + repr(self.fme_msg.geterr()) + ") replying error to web API")
                             del msg_content_to_send
+                        except Exception:
+                            pass
+                        self.log.logc("api", "error", "Error (%s) processing queue_sent item: %s", __exc_error_descr, queue_sent_item)
+                    # Here we skip and forget unmatched frame frames_item
+                    # extracted from decoded_frames_list_dicts
+                    if not __matched_flag:
+                        if (__unpack_dict['msid'] == 'MAN_CONN_CONFIRM') and (__unpack_dict['mtyp'] == 'TYPE_CONF_MANAGE') and (__unpack_dict['init'] == 'INIT_BY_USER'):
+                            # Not logging empty confirms on our MAN_CONN_CONFIRM confirms to reader
+                            pass
                         else:
-                            __tmp_queue_sent.append(queue_sent_item)
-                    queue_sent = list()
-                    if __tmp_queue_sent:
-                        queue_sent = deepcopy(__tmp_queue_sent)
-                except Exception as __exc_error_descr:
+                            self.log.logc("frames", "warning", "Warning: unmatched frame from reader skipped: %s", __unpack_dict)
+                    # Cleanup
+                    del __matched_flag, __match_tuple, queue_sent_item
+            # Cleanup
+            del frames_item, __unpack_dict
+
+            if self.stage_timer is not None:
+                self.stage_timer.lap("matching")
+
+            # Here we check if reader is still alive, look "reader-no-life-timeout" setting in the clou.conf,
+            # and if no data got from reader for more than "reader-no-life-timeout" - then close the connection manually
+            if (not (self.timers_dict["reader-last-act-time"] is None)) and self.session_state.connected:
+                __tmp_no_life_time = float(time() - self.timers_dict["reader-last-act-time"])
+                if  __tmp_no_life_time > cfg["reader-no-life-timeout"]:
                     try:
-                        msg_content_to_send = dict()
-                        msg_content_to_send["web-req-id"] = queue_sent_item[0]["web-req-id"]
-                        msg_content_to_send["reply-content"] = {"Error": "Error (" + repr(__exc_error_descr) + ") processing queue_sent item: " + repr(queue_sent_item)}
-                        if fme_msg.snd(queue_sent_item[2], "CLU", msg_content_to_send) == 0:
-                            log.log("Replied error to web API")
-                        else:
-                            log.log("Error (" + repr(fme_msg.geterr()) + ") replying error to web API")
-                        del msg_content_to_send
+                        self.rid_sock.shutdown(SHUT_RDWR)
+                        self.rid_sock.close()
+                        self.session_state.connected = False
+                        self.timers_dict["reader-connected-since"] = None
+                        self.timers_dict["reader-disconnected-since"] = time()
+                        self.log.log("Forced connection close due to timeout, check reader-no-life-timeout in config, reader not sending data for > " + repr(__tmp_no_life_time) + " seconds")
                     except Exception:
-                        pass
-                    log.log("Error (" + repr(__exc_error_descr) + ") processing queue_sent item: " + repr(queue_sent_item))
-                # Here we skip and forget unmatched frame frames_item
-                # extracted from decoded_frames_list_dicts
-                if not __matched_flag:
-                    if (__unpack_dict['msid'] == 'MAN_CONN_CONFIRM') and (__unpack_dict['mtyp'] == 'TYPE_CONF_MANAGE') and (__unpack_dict['init'] == 'INIT_BY_USER'):
-                        # Not logging empty confirms on our MAN_CONN_CONFIRM confirms to reader
-                        pass
+                        self.log.log("Error forced connection close attempted due to timeout")
+                del __tmp_no_life_time
+
+        # Scanning fme only when woken up by web, or every fme-poll-interval
+        # in case wake-up was lost; on the shared event loop fme is scanned by the driver
+        if (not self.loop_shared) and (("fme" in sel_events) or (time() >= self.fme_next_poll)):
+            self.fme_scan()
+
+        if self.stage_timer is not None:
+            self.stage_timer.lap("fme")
+
+        # Here we process status request types
+        # First assure having the chronological order
+        try:
+            self.fme_STS_recv_list = deque(sorted(self.fme_STS_recv_list, key=lambda __key: __key[1]))
+        except Exception:
+            self.log.log("Error sorting fme_STS_recv_list list")
+
+        fme_STS_recv_list_item = tuple()
+        while self.fme_STS_recv_list:
+            __json_file_name = str()
+            try:
+                fme_STS_recv_list_item = self.fme_STS_recv_list.popleft()
+                # Preparing message to send back
+                msg_content_to_send = dict()
+                msg_content_to_send["web-req-id"] = fme_STS_recv_list_item[0]["web-req-id"]
+                # Search through commands
+                if fme_STS_recv_list_item[0]["query-content"]["api-method"] == "update":
+                # === update === For method update - import command JSONs from commands dir into command reference
+                    __count_upd_files = int()
+                    __count_upd_files_list = list()
+                    try:
+                        for __tmp_root, __tmp_dirs, __tmp_files in os.walk("/" + cfg["cmds-dir"].strip("/")):
+                            for __tmp_name_walk_f in __tmp_files:
+                                if (__tmp_name_walk_f[:-5] in D.FULL_MID_LIST) and (__tmp_name_walk_f[-5:] == ".json"):
+                                    __json_file_name = os.path.join(__tmp_root, __tmp_name_walk_f)
+                                    __json_file = open(__json_file_name, "r")
+                                    cmd_ref_dict[__tmp_name_walk_f[:-5]] = load(__json_file)
+                                    __json_file.close()
+                                    __count_upd_files += 1
+                                    __count_upd_files_list.append(__tmp_name_walk_f)
+                        self.log.log("Successfully updated command reference " + str(__count_upd_files) + " files: " + repr(__count_upd_files_list))
+                        msg_content_to_send["reply-content"] = {"is-ok": True, "result": ("Successfully updated command reference " + str(__count_upd_files) + " files: " + repr(__count_upd_files_list))}
+                    except Exception as __exc_error_descr:
+                        self.log.log("Error updating command reference: " + repr(__exc_error_descr))
+                        msg_content_to_send["reply-content"] = {"is-ok": False, "result": ("Error updating command reference: " + repr(__exc_error_descr))}
+                    del __count_upd_files, __count_upd_files_list
+                # === shutdown === Safe process shutdown if received shutdown method
+                elif fme_STS_recv_list_item[0]["query-content"]["api-method"] == "shutdown":
+                    self.session_state.global_shutdown_flag = True
+                    msg_content_to_send["reply-content"] = {"is-ok": True, "result": "Successfully shutting down the process"}
+                # === getstatus === Reply to web API with status JSON
+                elif fme_STS_recv_list_item[0]["query-content"]["api-method"] == "getstatus":
+                    msg_content_to_send["reply-content"] = dict()
+                    msg_content_to_send["reply-content"]["is-ok"] = True
+                    __status_dict = dict()
+                    # Is reader now connected
+                    __status_dict["reader-connected"] = self.session_state.connected
+                    # Time since the connection of reader, not empty if connected
+                    if self.timers_dict["reader-connected-since"] is None:
+                        __status_dict["reader-connected-since"] = None
+                    else:
+                        __status_dict["reader-connected-since"] = strftime("%d.%m.%Y %H:%M:%S" + log_time_zone_str, gmtime(self.timers_dict["reader-connected-since"] + (log_time_zone * 3600)))
+                    # Time since the disconnection of reader, not empty if now disconnected
+                    if self.timers_dict["reader-disconnected-since"] is None:
+                        __status_dict["reader-disconnected-since"] = None
+                    else:
+                        __status_dict["reader-disconnected-since"] = strftime("%d.%m.%Y %H:%M:%S" + log_time_zone_str, gmtime(self.timers_dict["reader-disconnected-since"] + (log_time_zone * 3600)))
+                    # Time since last time frames received from the reader, and how many seconds ago it happened
+                    if self.timers_dict["reader-last-act-time"] is None:
+                        __status_dict["reader-last-act-time"] = None
+                        __status_dict["time-since-reader-last-act"] = None
+                    else:
+                        __status_dict["reader-last-act-time"] = strftime("%d.%m.%Y %H:%M:%S" + log_time_zone_str, gmtime(self.timers_dict["reader-last-act-time"] + (log_time_zone * 3600)))
+                        __status_dict["time-since-reader-last-act"] = float(time() - self.timers_dict["reader-last-act-time"])
+                    __status_dict["process-up-since"] = strftime("%d.%m.%Y %H:%M:%S" + log_time_zone_str, gmtime(self.timers_dict["process-up-since"] + (log_time_zone * 3600)))
+                    # Time since NTP clock check
+                    if clock.last_check is None:
+                        __status_dict["time-since-clock-check"] = None
+                    else:
+                        __status_dict["time-since-clock-check"] = strftime("%d.%m.%Y %H:%M:%S" + log_time_zone_str, gmtime(clock.last_check + (log_time_zone * 3600)))
+                    # Average and max time offsets for last 100 checks
+                    __ntp_avg = None
+                    __ntp_max = None
+                    __check_log = list(clock.check_log)
+                    if len(__check_log) > 0:
+                        __ntp_avg = float(sum(__check_log) / float(len(__check_log)))
+                        __ntp_max = float(max(__check_log))
+                        __status_dict["ntp-avg"] = __ntp_avg
+                        __status_dict["ntp-max"] = __ntp_max
+                        del __ntp_avg, __ntp_max
+                    del __check_log
+                    __status_dict["clock"] = clock.status()
+                    # Queues length
+                    __status_dict["queue-to-send-len"] = len(self.queue_to_send)
+                    __status_dict["queue-sent-len"] = len(self.queue_sent)
+                    __status_dict["decoded-frames-list-dicts-len"] = len(self.decoded_frames_list_dicts)
+                    __status_dict["fme-CLU-recv-list-len"] = len(self.fme_CLU_recv_list)
+                    __status_dict["cmd-scheduler"] = self.cmd_scheduler.stats()
+                    __status_dict["on-connect-job"] = self.jobs.get(self.on_connect_job_id)
+                    __status_dict["fme-STS-recv-list-len"] = len(self.fme_STS_recv_list)
+                    __status_dict["jobs-len"] = len(self.jobs)
+                    __status_dict["jobs-waiting-replies-len"] = len(self.sts_pending_replies)
+                    __status_dict["inventories-len"] = len(self.inventories)
+                    __status_dict["tag-buf"] = self.tag_buf.stats()
+                    __status_dict["tag-rules"] = None if self.tag_rules is None else self.tag_rules.stats()
+                    if self.reader_io is None:
+                        __status_dict["io-thread"] = None
+                    else:
+                        __status_dict["io-thread"] = {"conn-confirms-sent": self.reader_io.conn_confirms_sent, "tag-confirms-sent": self.reader_io.tag_confirms_sent, "frames-to-process": len(self.reader_io.frames)}
+                    if self.tag_decode_pool is None:
+                        __status_dict["tag-decode-pool"] = None
+                    else:
+                        __status_dict["tag-decode-pool"] = self.tag_decode_pool.stats()
+                    __status_dict["log-queue-len"] = log.queue_len()
+                    __status_dict["log-dropped"] = log.dropped
+                    if self.tag_stats is None:
+                        __status_dict["tag-stats"] = None
+                    else:
+                        __status_dict["tag-stats"] = self.tag_stats.stats()
+                    __status_dict["clock-skew"] = self.clock_skew.stats()
+                    __status_dict["request-trace"] = {"traces-count": self.request_trace.traces_count, "stages": self.request_trace.percentiles()}
+                    __status_dict["profile-mode"] = None if self.profile_run is None else self.profile_run["mode"]
+                    __status_dict["time-sync-job"] = self.jobs.get(self.time_sync_job_id)
+                    # Current config
+                    __status_dict["config"] = cfg
+                    # Command template reference
+                    __status_dict["cmd-template-reference-list"] = list(cmd_ref_dict.keys())
+                    # Here we're writing status to message back to API; status has no ETag,
+                    # queues, counters and clocks in it change on every pass of an active reader
+                    msg_content_to_send["reply-content"]["result"] = __status_dict
+                # === cleandata === clean the tag_buf
+                elif fme_STS_recv_list_item[0]["query-content"]["api-method"] == "cleandata":
+                    __tag_buf_len = self.tag_buf.clear()
+                    msg_content_to_send["reply-content"] = {"is-ok": True, "result": "Successfully erased " + repr(__tag_buf_len) + " RFID tag records in tag buffer"}
+                    self.log.log("Successfully erased " + repr(__tag_buf_len) + " RFID tag records in tag buffer")
+                # === getdatacount === reply with the length of the tag_buf
+                elif fme_STS_recv_list_item[0]["query-content"]["api-method"] == "getdatacount":
+                    msg_content_to_send["reply-content"] = {"is-ok": True, "etag": '"' + self.tag_buf_etag_base + "-" + str(self.tag_buf.version) + '"'}
+                    if etag_matches(fme_STS_recv_list_item[0]["query-content"].get("if-none-match"), msg_content_to_send["reply-content"]["etag"]):
+                        msg_content_to_send["reply-content"]["not-modified"] = True
+                    else:
+                        msg_content_to_send["reply-content"]["result"] = len(self.tag_buf)
+                # === getdata === reply with the contents of tag_buf - give all tags to API
+                elif fme_STS_recv_list_item[0]["query-content"]["api-method"] == "getdata":
+                    msg_content_to_send["reply-content"] = {"is-ok": True, "etag": '"' + self.tag_buf_etag_base + "-" + str(self.tag_buf.version) + '"'}
+                    if etag_matches(fme_STS_recv_list_item[0]["query-content"].get("if-none-match"), msg_content_to_send["reply-content"]["etag"]):
+                        msg_content_to_send["reply-content"]["not-modified"] = True
+                    else:
+                        msg_content_to_send["reply-content"]["result"] = self.tag_buf.encodeInDicts(tagframe)
+                # === getstats === reply with aggregate statistics per EPC
+                elif fme_STS_recv_list_item[0]["query-content"]["api-method"] == "getstats":
+                    if self.tag_stats is None:
+                        msg_content_to_send["reply-content"] = {"is-ok": False, "result": '"tag-stats" is not enabled in config for reader ' + self.rid}
+                    else:
+                        msg_content_to_send["reply-content"] = {"is-ok": True, "etag": '"' + self.tag_buf_etag_base + "-s" + str(self.tag_stats.version) + '"'}
+                        if etag_matches(fme_STS_recv_list_item[0]["query-content"].get("if-none-match"), msg_content_to_send["reply-content"]["etag"]):
+                            msg_content_to_send["reply-content"]["not-modified"] = True
+                        else:
+                            msg_content_to_send["reply-content"]["result"] = self.tag_stats.encodeInDicts()
+                # === cleanstats === erase aggregate statistics per EPC
+                elif fme_STS_recv_list_item[0]["query-content"]["api-method"] == "cleanstats":
+                    if self.tag_stats is None:
+                        msg_content_to_send["reply-content"] = {"is-ok": False, "result": '"tag-stats" is not enabled in config for reader ' + self.rid}
+                    else:
+                        __tag_stats_len = self.tag_stats.clear()
+                        msg_content_to_send["reply-content"] = {"is-ok": True, "result": "Successfully erased statistics of " + repr(__tag_stats_len) + " EPC"}
+                        self.log.log("Successfully erased statistics of " + repr(__tag_stats_len) + " EPC")
+                # === memstats === sizes of structures, and tracemalloc snapshots if asked
+                elif fme_STS_recv_list_item[0]["query-content"]["api-method"] == "memstats":
+                    msg_content_to_send["reply-content"] = {"is-ok": True, "result": self.memstats(fme_STS_recv_list_item[0]["query-content"].get("prms", dict()))}
+                # === profile === profile the main loop for the duration asked, reply when it is over
+                elif fme_STS_recv_list_item[0]["query-content"]["api-method"] == "profile":
+                    if profile_holder["rid"] is not None:
+                        msg_content_to_send["reply-content"] = {"is-ok": False, "result": "Profiling of reader " + profile_holder["rid"] + " in mode " + profile_holder["mode"] + " is running already"}
+                    else:
+                        self.profile_start(fme_STS_recv_list_item)
+                        msg_content_to_send["reply-content"] = None
+                # === metrics === metrics of the reader, merged with other readers by web "/metrics"
+                elif fme_STS_recv_list_item[0]["query-content"]["api-method"] == "metrics":
+                    if self.metrics is None:
+                        msg_content_to_send["reply-content"] = {"is-ok": False, "result": '"metrics" is not enabled in config'}
+                    else:
+                        msg_content_to_send["reply-content"] = {"is-ok": True, "result": self.metrics_families()}
+                # === job-submit === register the job and put its queries in the CLU processing list,
+                # web API does not wait for reply on this method
+                elif fme_STS_recv_list_item[0]["query-content"]["api-method"] == "job-submit":
+                    __job_id = fme_STS_recv_list_item[0]["query-content"]["job-id"]
+                    if "inventory" in fme_STS_recv_list_item[0]["query-content"]["prms"]:
+                        __job_queries = list()
+                        self.inventory_start(__job_id, fme_STS_recv_list_item[0]["query-content"]["prms"]["inventory"], fme_STS_recv_list_item[2])
                     else:
-                        log.log("Warning: unmatched frame from reader skipped: " + repr(__unpack_dict))
-                # Cleanup
-                del __matched_flag, __match_tuple, __rcv_match_tuple, queue_sent_item, __tmp_queue_sent, queue_sent_len
-        # Cleanup
-        del frames_item, __tmp_idx_frames_list, decoded_frames_list_dicts_len, __unpack_dict
-
-        # Here we check if reader is still alive, look "reader-no-life-timeout" setting in the clou.conf,
-        # and if no data got from reader for more than "reader-no-life-timeout" - then close the connection manually
-        if (not (timers_dict["reader-last-act-time"] is None)) and session_state.connected:
-            __tmp_no_life_time = float(time() - timers_dict["reader-last-act-time"])
-            if  __tmp_no_life_time > cfg["reader-no-life-timeout"]:
+                        __job_queries = fme_STS_recv_list_item[0]["query-content"]["prms"]["queries"]
+                    if __job_queries:
+                        self.job_queue(__job_id, __job_queries, fme_STS_recv_list_item[2])
+                    msg_content_to_send["reply-content"] = None
+                    del __job_id, __job_queries
+                # === job-status === reply with the job, or wait for the job to finish if asked to
+                elif fme_STS_recv_list_item[0]["query-content"]["api-method"] == "job-status":
+                    __job_id = fme_STS_recv_list_item[0]["query-content"]["job-id"]
+                    if __job_id not in self.jobs:
+                        msg_content_to_send["reply-content"] = {"is-ok": False, "result": "Unknown job-id " + __job_id + ", or job result expired"}
+                    elif (self.jobs[__job_id]["finished"] is None) and (fme_STS_recv_list_item[0]["query-content"].get("wait", 0.0) > 0.0):
+                        self.sts_pending_replies.append((fme_STS_recv_list_item, time() + fme_STS_recv_list_item[0]["query-content"]["wait"]))
+                        msg_content_to_send["reply-content"] = None
+                    else:
+                        msg_content_to_send["reply-content"] = {"is-ok": True, "result": self.jobs[__job_id]}
+                    del __job_id
+                # === inventory === run inventory job and reply when it is finished
+                elif fme_STS_recv_list_item[0]["query-content"]["api-method"] == "inventory":
+                    self.inventory_start(fme_STS_recv_list_item[0]["query-content"]["job-id"], fme_STS_recv_list_item[0]["query-content"]["prms"]["inventory"], fme_STS_recv_list_item[2])
+                    self.sts_pending_replies.append((fme_STS_recv_list_item, time() + float(fme_STS_recv_list_item[0]["query-content"]["prms"]["inventory"]["duration"]) + (3 * reply_from_reader_timeout)))
+                    msg_content_to_send["reply-content"] = None
+                # === job-list === reply with short states of all jobs kept
+                elif fme_STS_recv_list_item[0]["query-content"]["api-method"] == "job-list":
+                    msg_content_to_send["reply-content"] = {"is-ok": True, "result": [{"job-id": __job_item["job-id"], "state": __job_item["state"], "created": __job_item["created"], "finished": __job_item["finished"]} for __job_item in self.jobs.values()]}
+                # No reply now for submitted jobs and waiting job-status requests
+                if msg_content_to_send["reply-content"] is None:
+                    del msg_content_to_send
+                    continue
+                # Here sending the reply to web API
+                self.trace_reply(msg_content_to_send, fme_STS_recv_list_item[0])
+                if self.fme_msg.snd(fme_STS_recv_list_item[2], "STS", msg_content_to_send) == 0:
+                    self.log.logc("api", "info", "Replied to web API: %s", msg_content_to_send["reply-content"])
+                else:
+                    self.log.logc("api", "error", "Error (%s) replying to web API: %s", self.fme_msg.geterr(), msg_content_to_send)
+                # And cleanup
+                del msg_content_to_send
+            except Exception as __exc_error_descr_1:
+                self.log.logc("api", "error", "Error (%s) processing API command from web: %s", __exc_error_descr_1, fme_STS_recv_list_item)
+                # Here as well sending the error reply to web API
+                msg_content_to_send["reply-content"] = dict()
+                msg_content_to_send["reply-content"]["is-ok"] = False
+                msg_content_to_send["reply-content"]["result"] = {"result": "Error: " + repr(__exc_error_descr_1)}
+                self.trace_reply(msg_content_to_send, fme_STS_recv_list_item[0])
+                if self.fme_msg.snd(fme_STS_recv_list_item[2], "STS", msg_content_to_send) == 0:
+                    self.log.logc("api", "info", "Replied to web API: %s", msg_content_to_send["reply-content"])
+                else:
+                    self.log.logc("api", "error", "Error (%s) replying with error to web API: %s", self.fme_msg.geterr(), msg_content_to_send)
+        # Some cleanup
+        del fme_STS_recv_list_item
+
+        # Reply to job-status requests waiting for their jobs, when job finished or wait time is over
+        if self.sts_pending_replies:
+            __tmp_sts_pending_replies = list()
+            for __sts_pending_item in self.sts_pending_replies:
+                __job_id = __sts_pending_item[0][0]["query-content"]["job-id"]
+                if (__job_id in self.jobs) and (self.jobs[__job_id]["finished"] is None) and (time() < __sts_pending_item[1]):
+                    __tmp_sts_pending_replies.append(__sts_pending_item)
+                    continue
+                msg_content_to_send = dict()
+                msg_content_to_send["web-req-id"] = __sts_pending_item[0][0]["web-req-id"]
+                if (__job_id in self.jobs) and (__sts_pending_item[0][0]["query-content"]["api-method"] == "inventory"):
+                    msg_content_to_send["reply-content"] = {"is-ok": self.jobs[__job_id]["state"] == "done", "result": self.jobs[__job_id]}
+                elif __job_id in self.jobs:
+                    msg_content_to_send["reply-content"] = {"is-ok": True, "result": self.jobs[__job_id]}
+                else:
+                    msg_content_to_send["reply-content"] = {"is-ok": False, "result": "Unknown job-id " + __job_id + ", or job result expired"}
+                self.trace_reply(msg_content_to_send, __sts_pending_item[0][0])
+                if self.fme_msg.snd(__sts_pending_item[0][2], "STS", msg_content_to_send) != 0:
+                    self.log.log("Error (" + repr(self.fme_msg.geterr()) + ") replying to web API on job-status: " + __job_id)
+                del msg_content_to_send
+            self.sts_pending_replies = __tmp_sts_pending_replies
+            del __tmp_sts_pending_replies
+
+        if self.stage_timer is not None:
+            self.stage_timer.lap("status")
+
+        # Profiling is over - reply with the result
+        if (self.profile_run is not None) and (time() >= self.profile_run["until"]):
+            self.profile_finish()
+
+        # Erase finished jobs kept longer than job-result-ttl
+        for __job_id in [__job_item["job-id"] for __job_item in self.jobs.values() if (__job_item["finished"] is not None) and ((time() - __job_item["finished"]) > job_result_ttl)]:
+            del self.jobs[__job_id]
+
+        # Captured bytes of the pass go to the file
+        if self.capture is not None:
+            try:
+                self.capture.flush()
+            except Exception as __exc_error_descr:
+                self.capture_off(__exc_error_descr)
+
+        # Here is place to shutdown the reader connector if got the flag - in the far end of the cycle
+        if self.session_state.global_shutdown_flag:
+            if self.fme_STS_recv_list:
+                self.log.logc("api", "warning", "Due to shutdown received skipped API requests: %s", self.fme_STS_recv_list)
+            self.log.log("Safely shutting down the reader connector...")
+            return False
+        return True
+    def close(self):
+        """ Close sockets of the reader and fme wake-up socket, capture file, tag decoding workers, reader I/O thread and profiler """
+        if self.reader_io is not None:
+            self.reader_io.stop()
+            self.reader_io = None
+        if self.profile_run is not None:
+            self.profile_stop()
+        for __sock in [self.rid_sock, self.srv_basic_sock]:
+            if __sock is not None:
                 try:
-                    rid_sock.shutdown(SHUT_RDWR)
-                    rid_sock.close()
-                    session_state.connected = False
-                    timers_dict["reader-connected-since"] = None
-                    timers_dict["reader-disconnected-since"] = time()
-                    log.log("Forced connection close due to timeout, check reader-no-life-timeout in config, reader not sending data for > " + repr(__tmp_no_life_time) + " seconds")
+                    __sock.shutdown(SHUT_RDWR)
                 except Exception:
-                    log.log("Error forced connection close attempted due to timeout")
-            del __tmp_no_life_time
-
-    # Getting messages of CLU type from web for sending to reader from fme_msg
-    __tmp_fme_CLU_recv_list = list()
-    __fme_msg_recv_count = int()
-    __fme_msg_recv_time_to_log = float()
-    __fme_msg_recv_list_item = tuple()
-    try:
-        __fme_msg_recv_count = fme_msg.rcv("*", "CLU", cutoff_time=timers_dict["process-up-since"])
-        __fme_msg_recv_time_to_log = time()
-    except Exception:
-        log.log("Error running fme_msg.rcv('*', 'CLU')")
-    if __fme_msg_recv_count < 0:
-        log.log("Error receiving fme_msg.rcv('*', 'CLU'): " + fme_msg.geterr())
-    elif __fme_msg_recv_count > 0:
-        __tmp_fme_CLU_recv_list = fme_msg.getall()
-        for __fme_msg_recv_list_item in __tmp_fme_CLU_recv_list:
-            if __fme_msg_recv_time_to_log:
-                log.log("Received from web API: " + repr(__fme_msg_recv_list_item), explicit_timestamp=__fme_msg_recv_time_to_log)
-    # Adding received queries to the global list
-    fme_CLU_recv_list += __tmp_fme_CLU_recv_list
-    # Some clean up
-    fme_msg.clearall()
-    del __fme_msg_recv_count, __fme_msg_recv_time_to_log, __fme_msg_recv_list_item, __tmp_fme_CLU_recv_list
-
-    # Getting messages of STS type from web for sending to reader from fme_msg
-    __tmp_fme_STS_recv_list = list()
-    __fme_msg_recv_count = int()
-    __fme_msg_recv_time_to_log = float()
-    __fme_msg_recv_list_item = tuple()
-    try:
-        __fme_msg_recv_count = fme_msg.rcv("*", "STS", cutoff_time=timers_dict["process-up-since"])
-        __fme_msg_recv_time_to_log = time()
-    except Exception:
-        log.log("Error running fme_msg.rcv('*', 'STS')")
-    if __fme_msg_recv_count < 0:
-        log.log("Error receiving fme_msg.rcv('*', 'STS'): " + fme_msg.geterr())
-    elif __fme_msg_recv_count > 0:
-        __tmp_fme_STS_recv_list = fme_msg.getall()
-        for __fme_msg_recv_list_item in __tmp_fme_STS_recv_list:
-            if __fme_msg_recv_time_to_log:
-                log.log("Received from web API: " + repr(__fme_msg_recv_list_item), explicit_timestamp=__fme_msg_recv_time_to_log)
-    # Adding received queries to the global list
-    fme_STS_recv_list += __tmp_fme_STS_recv_list
-    # Some clean up
-    fme_msg.clearall()
-    del __fme_msg_recv_count, __fme_msg_recv_time_to_log, __fme_msg_recv_list_item, __tmp_fme_STS_recv_list
-
-    # Here we process status request types
-    # First assure having the chronological order
-    try:
-        __tmp_fme_recv_list = list()
-        __tmp_fme_recv_list = sorted(fme_STS_recv_list, key=lambda __key: __key[1])
-        fme_STS_recv_list = list()
-        fme_STS_recv_list = __tmp_fme_recv_list
-        del __tmp_fme_recv_list
-    except Exception:
-        log.log("Error sorting fme_STS_recv_list list")
-
-    fme_STS_recv_list_item = tuple()
-    fme_STS_recv_list_len = len(fme_STS_recv_list)
-    for __tmp_idx_fme in range(fme_STS_recv_list_len):
-        __json_file_name = str()
+                    pass
+                __sock.close()
+        self.rid_sock = None
+        self.srv_basic_sock = None
+        self.fme_msg.wake_close()
+        if self.capture is not None:
+            self.capture.close()
+        if self.tag_decode_pool is not None:
+            self.tag_decode_pool.close()
+
+def run_selectors(connector):
+    """ Run one reader connector, the process sleeps in select() between the passes """
+    __sel = selectors.DefaultSelector()
+    __registered = dict()
+    while True:
+        # Keep in selector only the sockets connector waits for now
+        __sources = connector.sel_sources()
+        for __data in list(__registered.keys()):
+            if __sources.get(__data) is not __registered[__data]:
+                try:
+                    __sel.unregister(__registered[__data])
+                except Exception:
+                    pass
+                del __registered[__data]
+        for __data in __sources.keys():
+            if __data not in __registered:
+                __sel.register(__sources[__data], selectors.EVENT_READ, __data)
+                __registered[__data] = __sources[__data]
+        __sel_timeout = connector.next_timeout()
         try:
-            fme_STS_recv_list_item = fme_STS_recv_list.pop(0)
-            # Preparing message to send back
-            msg_content_to_send = dict()
-            msg_content_to_send["web-req-id"] = fme_STS_recv_list_item[0]["web-req-id"]
-            # Search through commands
-            if fme_STS_recv_list_item[0]["query-content"]["api-method"] == "update":
-            # === update === For method update - import command JSONs from commands dir into command reference
-                __count_upd_files = int()
-                __count_upd_files_list = list()
+            __sel_events = [__sel_key.data for __sel_key, __sel_mask in __sel.select(__sel_timeout)]
+        except Exception as __exc_error_descr:
+            log.log("Error in select(): " + repr(__exc_error_descr))
+            __sel_events = list()
+        __loop_start = perf_counter()
+        if not connector.run_once(__sel_events):
+            break
+        if connector.metrics is not None:
+            connector.metrics.observe("clou_loop_seconds", perf_counter() - __loop_start)
+    __sel.close()
+    connector.close()
+
+async def serve_reader(connector):
+    """
+    Task running one reader connector in asyncio event loop shared by all readers;
+    run_once() does no blocking I/O here: fme is scanned and written in worker threads,
+    bytes to reader are written by the loop on non-blocking socket, or by worker thread
+    to reader I/O thread socket
+    """
+    __loop = asyncio.get_running_loop()
+    __wake_event = asyncio.Event()
+    __ready = set()
+    __registered = dict()
+    def __on_ready(__data):
+        __ready.add(__data)
+        __wake_event.set()
+    # Connection to reader in server mode is made here without blocking other readers
+    connector.connect_in_run_once = False
+    connector.loop_shared = True
+    connector.fme_msg = DeferredFme(connector.fme_msg, connector.log)
+    while True:
+        __sources = connector.sel_sources()
+        for __data in list(__registered.keys()):
+            if __sources.get(__data) is not __registered[__data][0]:
+                __loop.remove_reader(__registered[__data][1])
+                del __registered[__data]
+        for __data in __sources.keys():
+            if __data not in __registered:
+                __loop.add_reader(__sources[__data].fileno(), __on_ready, __data)
+                __registered[__data] = (__sources[__data], __sources[__data].fileno())
+        if connector.reader_connect_due():
+            connector.reader_next_connect = time() + float(connector.cfgrid["sock-timeout"])
+            __connect_sock = socket(AF_INET, SOCK_STREAM)
+            __connect_sock.setblocking(False)
+            try:
+                await asyncio.wait_for(__loop.sock_connect(__connect_sock, (connector.cfgrid["host"], connector.cfgrid["port"])), float(connector.cfgrid["sock-timeout"]))
+                if connector.io_thread_on:
+                    __connect_sock.settimeout(float(connector.cfgrid["sock-timeout"]))
+                connector.reader_connected(__connect_sock, 'Connected to reader ' + connector.cfgrid["host"] + ":" + str(connector.cfgrid["port"]) + "!")
+                continue
+            except asyncio.TimeoutError:
+                __connect_sock.close()
+                connector.reader_connect_failed(timeout())
+            except Exception as sock_exception_err:
+                __connect_sock.close()
+                connector.reader_connect_failed(sock_exception_err)
+        try:
+            await asyncio.wait_for(__wake_event.wait(), connector.next_timeout())
+        except asyncio.TimeoutError:
+            pass
+        __wake_event.clear()
+        __sel_events = list(__ready)
+        __ready.clear()
+        if ("fme" in __sel_events) or (time() >= connector.fme_next_poll):
+            await __loop.run_in_executor(None, connector.fme_scan)
+        __loop_start = perf_counter()
+        __is_running = connector.run_once(__sel_events)
+        if connector.metrics is not None:
+            connector.metrics.observe("clou_loop_seconds", perf_counter() - __loop_start)
+        # Bytes to reader and replies to web of the pass, the shutdown reply as well
+        if connector.send_pending:
+            __send_bytes = b"".join(connector.send_pending)
+            connector.send_pending = list()
+            if connector.session_state.connected:
                 try:
-                    for __tmp_root, __tmp_dirs, __tmp_files in os.walk("/" + cfg["cmds-dir"].strip("/")):
-                        for __tmp_name_walk_f in __tmp_files:
-                            if (__tmp_name_walk_f[:-5] in D.FULL_MID_LIST) and (__tmp_name_walk_f[-5:] == ".json"):
-                                __json_file_name = os.path.join(__tmp_root, __tmp_name_walk_f)
-                                __json_file = open(__json_file_name, "r")
-                                cmd_ref_dict[__tmp_name_walk_f[:-5]] = load(__json_file)
-                                __json_file.close()
-                                __count_upd_files += 1
-                                __count_upd_files_list.append(__tmp_name_walk_f)
-                    log.log("Successfully updated command reference " + str(__count_upd_files) + " files: " + repr(__count_upd_files_list))
-                    msg_content_to_send["reply-content"] = {"is-ok": True, "result": ("Successfully updated command reference " + str(__count_upd_files) + " files: " + repr(__count_upd_files_list))}
+                    if connector.reader_io is not None:
+                        await __loop.run_in_executor(None, connector.reader_io.send, __send_bytes)
+                    else:
+                        await asyncio.wait_for(__loop.sock_sendall(connector.rid_sock, __send_bytes), reply_from_reader_timeout)
                 except Exception as __exc_error_descr:
-                    log.log("Error updating command reference: " + repr(__exc_error_descr))
-                    msg_content_to_send["reply-content"] = {"is-ok": False, "result": ("Error updating command reference: " + repr(__exc_error_descr))}
-                del __count_upd_files, __count_upd_files_list
-            # === shutdown === Safe process shutdown if received shutdown method
-            elif fme_STS_recv_list_item[0]["query-content"]["api-method"] == "shutdown":
-                session_state.global_shutdown_flag = True
-                msg_content_to_send["reply-content"] = {"is-ok": True, "result": "Successfully shutting down the process"}
-            # === getstatus === Reply to web API with status JSON
-            elif fme_STS_recv_list_item[0]["query-content"]["api-method"] == "getstatus":
-                msg_content_to_send["reply-content"] = dict()
-                msg_content_to_send["reply-content"]["is-ok"] = True
-                __status_dict = dict()
-                # Is reader now connected
-                __status_dict["reader-connected"] = session_state.connected
-                # Time since the connection of reader, not empty if connected
-                if timers_dict["reader-connected-since"] is None:
-                    __status_dict["reader-connected-since"] = None
-                else:
-                    __status_dict["reader-connected-since"] = strftime("%d.%m.%Y %H:%M:%S" + log_time_zone_str, gmtime(timers_dict["reader-connected-since"] + (log_time_zone * 3600)))
-                # Time since the disconnection of reader, not empty if now disconnected
-                if timers_dict["reader-disconnected-since"] is None:
-                    __status_dict["reader-disconnected-since"] = None
-                else:
-                    __status_dict["reader-disconnected-since"] = strftime("%d.%m.%Y %H:%M:%S" + log_time_zone_str, gmtime(timers_dict["reader-disconnected-since"] + (log_time_zone * 3600)))
-                # Time since last time frames received from the reader, and how many seconds ago it happened
-                if timers_dict["reader-last-act-time"] is None:
-                    __status_dict["reader-last-act-time"] = None
-                    __status_dict["time-since-reader-last-act"] = None
-                else:
-                    __status_dict["reader-last-act-time"] = strftime("%d.%m.%Y %H:%M:%S" + log_time_zone_str, gmtime(timers_dict["reader-last-act-time"] + (log_time_zone * 3600)))
-                    __status_dict["time-since-reader-last-act"] = float(time() - timers_dict["reader-last-act-time"])
-                __status_dict["process-up-since"] = strftime("%d.%m.%Y %H:%M:%S" + log_time_zone_str, gmtime(timers_dict["process-up-since"] + (log_time_zone * 3600)))
-                # Time since NTP clock check
-                if timers_dict["time-since-clock-check"] is None:
-                    __status_dict["time-since-clock-check"] = None
-                else:
-                    __status_dict["time-since-clock-check"] = strftime("%d.%m.%Y %H:%M:%S" + log_time_zone_str, gmtime(timers_dict["time-since-clock-check"] + (log_time_zone * 3600)))
-                # Average and max time offsets for last 100 checks
-                __ntp_avg = None
-                __ntp_max = None
-                if len(ntp_check_log) > 0:
-                    __ntp_avg = float(sum(ntp_check_log) / float(len(ntp_check_log)))
-                    __ntp_max = float(max(ntp_check_log))
-                    __status_dict["ntp-avg"] = __ntp_avg
-                    __status_dict["ntp-max"] = __ntp_max
-                    del __ntp_avg, __ntp_max
-                # Queues length
-                __status_dict["queue-to-send-len"] = len(queue_to_send)
-                __status_dict["queue-sent-len"] = len(queue_sent)
-                __status_dict["decoded-frames-list-dicts-len"] = len(decoded_frames_list_dicts)
-                __status_dict["fme-CLU-recv-list-len"] = len(fme_CLU_recv_list)
-                __status_dict["fme-STS-recv-list-len"] = len(fme_STS_recv_list)
-                # Current config
-                __status_dict["config"] = cfg
-                # Command template reference
-                __status_dict["cmd-template-reference-list"] = list(cmd_ref_dict.keys())
-                # Here we're writing status to message back to API
-                msg_content_to_send["reply-content"]["result"] = __status_dict
-            # === cleandata === clean the tag_buf
-            elif fme_STS_recv_list_item[0]["query-content"]["api-method"] == "cleandata":
-                __tag_buf_len = len(tag_buf)
-                tag_buf = list()
-                msg_content_to_send["reply-content"] = {"is-ok": True, "result": "Successfully erased " + repr(__tag_buf_len) + " RFID tag records in tag buffer"}
-                log.log("Successfully erased " + repr(__tag_buf_len) + " RFID tag records in tag buffer")
-            # === getdatacount === reply with the length of the tag_buf
-            elif fme_STS_recv_list_item[0]["query-content"]["api-method"] == "getdatacount":
-                msg_content_to_send["reply-content"] = {"is-ok": True, "result": len(tag_buf)}
-            # === getdata === reply with the contents of tag_buf - give all tags to API
-            elif fme_STS_recv_list_item[0]["query-content"]["api-method"] == "getdata":
-                msg_content_to_send["reply-content"] = {"is-ok": True, "result": tag_buf}
-            # Here sending the reply to web API
-            if fme_msg.snd(fme_STS_recv_list_item[2], "STS", msg_content_to_send) == 0:
-                log.log("Replied to web API: " + repr(msg_content_to_send["reply-content"]))
-            else:
-                log.log("Error (" + repr(fme_msg.geterr()) + ") replying to web API: " + repr(msg_content_to_send))
-            # And cleanup
-            del msg_content_to_send
-        except Exception as __exc_error_descr_1:
-            log.log("Error (" + repr(__exc_error_descr_1) + ") processing API command from web: " + repr(fme_STS_recv_list_item))
-            # Here as well sending the error reply to web API
-            msg_content_to_send["reply-content"] = dict()
-            msg_content_to_send["reply-content"]["is-ok"] = False
-            msg_content_to_send["reply-content"]["result"] = {"result": "Error: " + repr(__exc_error_descr_1)}
-            if fme_msg.snd(fme_STS_recv_list_item[2], "STS", msg_content_to_send) == 0:
-                log.log("Replied to web API: " + repr(msg_content_to_send["reply-content"]))
-            else:
-                log.log("Error (" + repr(fme_msg.geterr()) + ") replying with error to web API: " + repr(msg_content_to_send))
-    # Some cleanup
-    del fme_STS_recv_list_item, fme_STS_recv_list_len
+                    connector.reader_connection_lost(__exc_error_descr)
+        if connector.fme_msg.pending:
+            await __loop.run_in_executor(None, connector.fme_msg.flush)
+        if not __is_running:
+            break
+    for __data in __registered.keys():
+        __loop.remove_reader(__registered[__data][1])
+    connector.close()
+
+async def run_asyncio(connectors):
+    """ Run all reader connectors in one event loop, one task per reader """
+    await asyncio.gather(*[serve_reader(__connector) for __connector in connectors])
+
+# NTP clock check, with the shortest ntp-check-interval of readers served
+try:
+    clock = ClockService(cfg["ntp-service-url"], min(float(cfg[__rid]["ntp-check-interval"]) for __rid in readers_to_serve))
+    ntp_service_response = clock.request()
+    if abs(ntp_service_response.offset) > cfg["max-server-time-offset"]:
+        log.log('Server time too far from NTP time at ' + cfg["ntp-service-url"] + ', offset = ' + repr(ntp_service_response.offset))
+        log.log("Exiting the process")
+        exit()
+    clock.record(ntp_service_response)
+    del ntp_service_response
+    # Further checks with interval between checks = ntp-check-interval seconds run in background
+    clock.start()
+except Exception as __exc_error_descr:
+    log.log("Error checking clock via NTP service" + repr(__exc_error_descr))
+    log.log("Exiting the process")
+    exit()
+
+# Snapshots of tracemalloc asked by memstats, one for the process
+malloc_tracer = clouprotocol.MallocTracer()
 
-    # Here we run an NTP check with interval between checks = ntp_check_interval seconds
+# Profiling running in the process, one at a time for all connectors: cProfile and
+# the stack sampler hook the thread, which connectors share in --all mode
+profile_holder = {"rid": None, "mode": None}
+
+# Create connectors of readers, in --all mode a reader failed to start
+# is skipped and the others are served
+connectors = list()
+for __rid in readers_to_serve:
     try:
-        if (time() - timers_dict["time-since-clock-check"]) >= ntp_check_interval:
-            ntp_service_response = ntp_service.request(cfg["ntp-service-url"], version=3)
-            ntp_check_log.append(abs(ntp_service_response.offset))
-            __ntp_avg = None
-            __ntp_max = None
-            if len(ntp_check_log) > 0:
-                __ntp_avg = float(sum(ntp_check_log) / float(len(ntp_check_log)))
-                __ntp_max = float(max(ntp_check_log))
-            if abs(ntp_service_response.offset) > cfg["max-server-time-offset"]:
-                log.log('NTP check ' + cfg["ntp-service-url"] + ', got offset = ' + repr(ntp_service_response.offset) + ': WARNING : server time too far from NTP time, max = ' + repr(__ntp_max) + ', avg = ' + repr(__ntp_avg))
-            else:
-                log.log('NTP check ' + cfg["ntp-service-url"] + ', got offset = ' + repr(ntp_service_response.offset) + ': OK, max = ' + repr(__ntp_max) + ', avg = ' + repr(__ntp_avg))
-            del __ntp_avg, __ntp_max
-            timers_dict["time-since-clock-check"] = time()
-            if len(ntp_check_log) >= 100:
-                ntp_check_log.pop(0)
+        if own_instance_id == "--all":
+            connectors.append(ClouConnector(__rid, ReaderLog(log, __rid)))
+        else:
+            connectors.append(ClouConnector(__rid, log))
     except Exception as __exc_error_descr:
-        log.log("Error checking clock via NTP service: " + repr(__exc_error_descr))
+        log.log("Error starting connector of rid = [" + __rid + "]: " + repr(__exc_error_descr))
+        if __rid in tag_decode_processes:
+            tag_decode_processes.pop(__rid).terminate()
+if not connectors:
+    log.log("No readers to serve, exiting the process")
+    exit()
 
-    # Here is place to shutdown the process if got the flag - in the far end of the cycle
-    if session_state.global_shutdown_flag:
-        if fme_STS_recv_list:
-            log.log("Due to shutdown received skipped API requests: " + repr(fme_STS_recv_list))
-            try:
-                srv_basic_sock.shutdown(SHUT_RDWR)
-                srv_basic_sock.close()
-                del srv_basic_sock
-                rid_sock.shutdown(SHUT_RDWR)
-                rid_sock.close()
-                del rid_sock
-            except Exception:
-                pass
-        log.log("Safely shutting down the process...")
-        exit()
+# =================== MAIN LOOP START ===================
+if own_instance_id == "--all":
+    asyncio.run(run_asyncio(connectors))
+else:
+    run_selectors(connectors[0])
+log.log("Safely shutting down the process...")
+exit()
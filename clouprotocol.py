@@ -6,9 +6,23 @@ Consists of classes, needed data and constants to work with Clou protocol.
 """
 from os import access as os_access
 from os import F_OK as os_F_OK
+from os import listdir as os_listdir
+from os import remove as os_remove
+from struct import Struct
 from re import findall as re_findall
 from json import load
 from time import strftime, gmtime, time
+from sys import getsizeof
+from collections import OrderedDict, deque
+from itertools import islice
+from bisect import bisect_left, bisect_right
+from math import ceil
+from random import random
+from threading import Thread, Lock
+from queue import Queue, Full as QueueFull
+import atexit
+import tracemalloc
+import reprlib
 
 # --- Frame ---
 # |0xAA|control word|Serial device address|Data length|Data|Calibration code|
@@ -339,9 +353,12 @@ class Crc16Ibm:
                 else:
                     __rg = __rg << 1
             self.__crc_table.append(__rg)
-    def crc16sum(self, in_data):
-        """ Calculating CRC32 IBM from in_data, expected bytes() """
-        __crc16reg = 0x0000
+    def crc16sum(self, in_data, crc16_start=0x0000):
+        """
+        Calculating CRC32 IBM from in_data, expected bytes(),
+        crc16_start - CRC of the bytes before in_data, to continue calculating
+        """
+        __crc16reg = crc16_start
         if not isinstance(in_data, bytes):
             return -1
         for __idx in range(len(in_data)):
@@ -396,6 +413,74 @@ class TagData:
             6: "Other tag error",
             7: "Other reader error"
         }
+    def dedupeKey(self, exclude_params=()):
+        """
+        Hashable key of the decoded tag for duplicates check, equal for tags
+        giving equal encodeInDict() without exclude_params,
+        exclude_params - names of optional parameters not compared, as "TIME"
+        """
+        return (self.EPC_code, self.ant_id, self.PC_value, tuple(sorted((__prm_id, __prm_val) for __prm_id, __prm_val in self.params.items() if self.__DECODE_TAG_DATA[__prm_id] not in exclude_params)))
+    def seriesNum(self, received_frame_bytes):
+        """
+        Only the tag response package series number (optional parameter 0x08) of tag data frame
+        in raw bytes(), for the confirmation to reader without decoding the whole tag,
+        returns bytes() or None if not found
+        """
+        try:
+            line_index = 4 + (256 * received_frame_bytes[2]) + received_frame_bytes[3] + 3    # EPC len, EPC code, PC value, antenna ID
+            while line_index < len(received_frame_bytes):
+                tmp_opt_param = received_frame_bytes[line_index]
+                line_index += 1
+                if tmp_opt_param == 0x08:
+                    if line_index + 4 > len(received_frame_bytes):
+                        return None
+                    return received_frame_bytes[line_index:(line_index+4)]
+                elif (tmp_opt_param == 0x01) or (tmp_opt_param == 0x02):
+                    line_index += 1
+                elif (tmp_opt_param == 0x03) or (tmp_opt_param == 0x04) or (tmp_opt_param == 0x05) or (tmp_opt_param == 0x0C):
+                    line_index += 2 + (256 * received_frame_bytes[line_index]) + received_frame_bytes[line_index+1]
+                elif tmp_opt_param == 0x07:
+                    line_index += 8
+                else:
+                    return None
+        except Exception:
+            pass
+        return None
+    @staticmethod
+    def decodeBatch(tag_frames_batch, exclude_params=(), with_dicts=False):
+        """
+        Decode list() of tag data frames, to be run in worker process, returns list() of tuples
+        (EPC_code, PC_value, ant_id, params tuple() of pairs, dedupeKey(exclude_params), encodeInDict() if with_dicts else None, recv time),
+        or for frame not decoded (None, decode_error_text, frame bytes(), recv time), in the same order
+        tag_frames_batch - list() of tuples (tag data frame bytes() as for decodeTag(), recv time)
+        """
+        __tag_data = TagData()
+        __res_list = list()
+        for __tag_frame_bytes, __recv_time in tag_frames_batch:
+            __tag_data.decodeTag(__tag_frame_bytes)
+            if __tag_data.decode_error:
+                __res_list.append((None, __tag_data.decode_error_text, __tag_frame_bytes, __recv_time))
+                continue
+            __res_list.append((__tag_data.EPC_code, __tag_data.PC_value, __tag_data.ant_id, tuple(__tag_data.params.items()), __tag_data.dedupeKey(exclude_params), __tag_data.encodeInDict() if with_dicts else None, __recv_time))
+        return __res_list
+    def loadRecord(self, tag_record):
+        """
+        Restore instance properties from TagRecord() stored in TagBuffer(),
+        to get the same encodeInDict() as of the decoded tag
+        """
+        self.EPC_code = tag_record.EPC_code
+        self.PC_value = tag_record.PC_value
+        self.ant_id = tag_record.ant_id
+        self.params = dict(tag_record.params)
+        self.decode_error = False
+        self.decode_error_text = str()
+        tmp_PC_val = tag_record.PC_value // 256
+        (tmp_PC_val, self.num_sys_id_toggle) = divmod(tmp_PC_val, 2**1)
+        (tmp_PC_val, self.XPC_indicator) = divmod(tmp_PC_val, 2**1)
+        (tmp_PC_val, self.UMI) = divmod(tmp_PC_val, 2**1)
+        (tmp_PC_val, self.EPC_len) = divmod(tmp_PC_val, 2**5)
+        del tmp_PC_val
+        self.RFU = tag_record.PC_value % 256
     def encodeInDict(self):
         """
         Method to encode instance properties into dict()
@@ -662,13 +747,26 @@ class ClouRFIDFrame(ClouProtocolDefinitions, Crc16Ibm):        # Clou RFID reade
         self.start_data_with_len = True
 
 class ClouLogging(ClouRFIDFrame, TagData):
-    """ Main and the only class in the module """
-    def __init__(self, log_dir_path_set, logfile_head_str_set, timezone_set="+0000", log_stdout_set=False):
+    """
+    Main and the only class in the module.
+    Current hourly log file is kept open, timestamps are formatted from per-second cache.
+    With queue_size_set > 0 lines are written by background thread, handed over through
+    the queue of queue_size_set records, and when the queue is full queue_policy_set
+    "drop" drops the record (counted in dropped), "block" waits for the writer.
+    Messages of logc() have category and level, and are formatted only if
+    the level is enabled for the category by set_levels().
+    """
+    HEX_BYTES = ["{0:02X} ".format(__byte) for __byte in range(256)]  # byte -> "XX "
+    QUEUE_POLICIES = ("drop", "block")
+    LEVELS = {"debug": 10, "info": 20, "warning": 30, "error": 40, "off": 100}
+    def __init__(self, log_dir_path_set, logfile_head_str_set, timezone_set="+0000", log_stdout_set=False, queue_size_set=0, queue_policy_set="drop"):
         """
         log_dir_path_set - dir to put logfiles
         logfile_head_str_set - header string for log file name
         timezone_set - 5 symbol str() in format '+HHMM' or '-HHMM' meaning timezone shift
         log_stdout_set - bool(), if True then duplicate logging on standard output
+        queue_size_set - int(), 0 means writing in the calling thread, otherwise size of queue to writer thread
+        queue_policy_set - "drop" or "block", what to do with record when the queue is full
         """
         ClouRFIDFrame.__init__(self)
         TagData.__init__(self)
@@ -681,6 +779,8 @@ class ClouLogging(ClouRFIDFrame, TagData):
         assert len(timezone_set) == 5, "timezone_set must be 5 symbols length"
         assert (timezone_set[0] == "-") or (timezone_set[0] == "+"), "timezone_set must start from - or +"
         assert isinstance(log_stdout_set, bool), "log_stdout_set must be bool()"
+        assert isinstance(queue_size_set, int) and (queue_size_set >= 0), "queue_size_set must be int() >= 0"
+        assert queue_policy_set in self.QUEUE_POLICIES, "queue_policy_set must be one of " + repr(self.QUEUE_POLICIES)
         self.__log_dir_path = "/" + log_dir_path_set.strip("/")
         self.__logfile_head = logfile_head_str_set
         self.__timezone_str = timezone_set
@@ -696,6 +796,113 @@ class ClouLogging(ClouRFIDFrame, TagData):
             __tz = float()
         self.__timezone = float(__tz)
         self.__log_stdout = log_stdout_set
+        self.__ts_second = None         # second of the cached timestamp
+        self.__ts_prefix = str()        # "[ dd.mm.YYYY HH:MM:SS." of the second
+        self.__ts_file_name = str()     # log file name of the second
+        self.__log_file = None          # open log file, written by writer thread, or under __lock
+        self.__lock = Lock()            # log() is called from several threads: timestamp cache and direct writing
+        self.__log_file_name = str()
+        self.dropped = 0                # records dropped due to full queue
+        self.__queue = None
+        self.__queue_block = (queue_policy_set == "block")
+        self.__writer = None
+        self.__levels = dict()          # category -> int() min level logged
+        self.__default_level = self.LEVELS["debug"]
+        self.__repr = reprlib.Repr()
+        self.__repr_max_chars = 0
+        if queue_size_set > 0:
+            self.__queue = Queue(maxsize=queue_size_set)
+            self.__writer = Thread(target=self.__write_loop, name="log-writer-" + logfile_head_str_set, daemon=True)
+            self.__writer.start()
+            atexit.register(self.close)
+    def __write(self, log_file_name, log_text_out):
+        """ Write lines to log file, the file is reopened only when the hour changed """
+        if log_file_name != self.__log_file_name:
+            if self.__log_file is not None:
+                self.__log_file.close()
+            self.__log_file = open(self.__log_dir_path + "/" + log_file_name, "a")
+            self.__log_file_name = log_file_name
+        for __line in log_text_out:
+            if self.__log_stdout:
+                print(__line)
+            self.__log_file.write(__line.replace("\r", str()) + "\n")
+    def __write_loop(self):
+        """ Writer thread, flushes the file when the queue is empty, None in the queue stops it """
+        while True:
+            __record = self.__queue.get()
+            if __record is None:
+                break
+            try:
+                self.__write(__record[0], __record[1])
+                if self.__queue.empty():
+                    self.__log_file.flush()
+            except Exception:
+                pass
+        if self.__log_file is not None:
+            self.__log_file.close()
+            self.__log_file = None
+            self.__log_file_name = str()
+    def set_levels(self, levels_dict, repr_max_chars=0, repr_max_items=0):
+        """
+        levels_dict - dict() category -> level name of LEVELS, messages of logc() below the level
+        of their category are skipped, "default" key sets level of categories not in levels_dict
+        repr_max_chars - int() max length of repr() of objects in logc() messages, 0 means no limit
+        repr_max_items - int() max items shown of lists, dicts etc. in logc() messages, 0 means no limit
+        """
+        assert isinstance(levels_dict, dict), "levels_dict must be dict()"
+        assert all((__level in self.LEVELS) for __level in levels_dict.values()), "levels must be one of " + repr(list(self.LEVELS.keys()))
+        assert isinstance(repr_max_chars, int) and (repr_max_chars >= 0), "repr_max_chars must be int() >= 0"
+        assert isinstance(repr_max_items, int) and (repr_max_items >= 0), "repr_max_items must be int() >= 0"
+        self.__levels = {__category: self.LEVELS[__level] for __category, __level in levels_dict.items() if __category != "default"}
+        self.__default_level = self.LEVELS[levels_dict.get("default", "debug")]
+        self.__repr_max_chars = repr_max_chars
+        self.__repr = reprlib.Repr()
+        self.__repr.maxlevel = 8
+        if repr_max_items:
+            self.__repr.maxtuple = self.__repr.maxlist = self.__repr.maxarray = repr_max_items
+            self.__repr.maxdict = self.__repr.maxset = self.__repr.maxfrozenset = self.__repr.maxdeque = repr_max_items
+        else:
+            self.__repr.maxtuple = self.__repr.maxlist = self.__repr.maxarray = 10**9
+            self.__repr.maxdict = self.__repr.maxset = self.__repr.maxfrozenset = self.__repr.maxdeque = 10**9
+        self.__repr.maxstring = self.__repr.maxlong = self.__repr.maxother = (repr_max_chars or 10**9)
+    def enabled(self, category, level="info"):
+        """ True if messages of category at level are logged """
+        return self.LEVELS[level] >= self.__levels.get(category, self.__default_level)
+    def capped_repr(self, obj):
+        """ repr() of obj limited by repr_max_items and repr_max_chars of set_levels() """
+        __res = self.__repr.repr(obj)
+        if self.__repr_max_chars and (len(__res) > self.__repr_max_chars):
+            __res = __res[:self.__repr_max_chars] + "...(" + str(len(__res)) + " chars)"
+        return __res
+    def logc(self, category, level, message_format, *format_args, **log_kwargs):
+        """
+        Lazy log(): if level is enabled for category, message_format is formatted
+        with format_args by % operator, args not str() are put as capped_repr(),
+        log_kwargs are passed to log()
+        """
+        if self.LEVELS[level] < self.__levels.get(category, self.__default_level):
+            return
+        if format_args:
+            message_format = message_format % tuple((__arg if isinstance(__arg, str) else self.capped_repr(__arg)) for __arg in format_args)
+        self.log(message_format, **log_kwargs)
+    def queue_len(self):
+        """ Number of records waiting for the writer thread """
+        if self.__queue is None:
+            return 0
+        return self.__queue.qsize()
+    def close(self):
+        """ Write all queued records and close the log file, log() after close() writes in the calling thread """
+        if self.__writer is not None:
+            self.__queue.put(None)
+            self.__writer.join()
+            self.__writer = None
+            self.__queue = None
+        else:
+            with self.__lock:
+                if self.__log_file is not None:
+                    self.__log_file.close()
+                    self.__log_file = None
+                    self.__log_file_name = str()
     def log(self, message_text, instance_to_log=0, result_resp=0, explicit_timestamp=None, put_timestamp=True):
         """
         Method to log the message and detailed data
@@ -711,9 +918,18 @@ class ClouLogging(ClouRFIDFrame, TagData):
             time_stamp_to_log = time() + (self.__timezone * 3600)
         else:
             time_stamp_to_log = explicit_timestamp + (self.__timezone * 3600)
-        gmtime_stamp_to_log = gmtime(time_stamp_to_log)
+        __ts_second = int(time_stamp_to_log)
+        with self.__lock:
+            if __ts_second != self.__ts_second:
+                gmtime_stamp_to_log = gmtime(__ts_second)
+                self.__ts_prefix = strftime("[ %d.%m.%Y %H:%M:%S.", gmtime_stamp_to_log)
+                self.__ts_file_name = self.__logfile_head + strftime("-%Y-%m-%d-%H" + self.__timezone_str + ".log", gmtime_stamp_to_log)
+                self.__ts_second = __ts_second
+                del gmtime_stamp_to_log
+            __ts_prefix = self.__ts_prefix
+            __ts_file_name = self.__ts_file_name
         if put_timestamp:
-            s_tmp = strftime("[ %d.%m.%Y %H:%M:%S." + str(time_stamp_to_log - int(time_stamp_to_log))[2:8] + self.__timezone_str + " ] > ", gmtime_stamp_to_log) + str(message_text)
+            s_tmp = __ts_prefix + "{0:06d}".format(int((time_stamp_to_log - __ts_second) * 1000000)) + self.__timezone_str + " ] > " + str(message_text)
         else:
             s_tmp = str(message_text)
         if isinstance(instance_to_log, ClouRFIDFrame):
@@ -723,15 +939,11 @@ class ClouLogging(ClouRFIDFrame, TagData):
             s_tmp = s_tmp + "[ " + self.DECODE_PARAM_HEADER_RS485[instance_to_log.rs485_mark] + " ] "
             s_tmp = s_tmp + "[ " + self.DECODE_PARAM_HEADER_TYPE[instance_to_log.message_type] + " ] "
             s_tmp = s_tmp + "[ DATA LEN = " + "{0:02X}".format(len(instance_to_log.data_bytes)) + " ]"
-            s_tmp = s_tmp + " [ "
-            j = 0
-            for j in range(len(instance_to_log.data_bytes)):
-                s_tmp = s_tmp + "{0:02X}".format(instance_to_log.data_bytes[j]) + " "
-            s_tmp = s_tmp + "]"
+            s_tmp = s_tmp + " [ " + str().join([self.HEX_BYTES[__byte] for __byte in instance_to_log.data_bytes]) + "]"
         if s_tmp:
             log_text_out.append(s_tmp)
         if isinstance(instance_to_log, TagData):
-            log_text_out.append("Tag EPC code       = " + str().join(format(idx_hex_conv, '02X') for idx_hex_conv in instance_to_log.EPC_code))
+            log_text_out.append("Tag EPC code       = " + instance_to_log.EPC_code.hex().upper())
             log_text_out.append("Tag EPC len        = " + str(instance_to_log.EPC_len * 16) + " bits")
             log_text_out.append("Tag UMI            = " + str(instance_to_log.UMI))
             log_text_out.append("Tag XPC indicator  = " + str(instance_to_log.XPC_indicator))
@@ -746,15 +958,618 @@ class ClouLogging(ClouRFIDFrame, TagData):
                 elif op_keys == self.TAG_DATA['TIME']:  # In timezone set in Clou scanner settings
                     log_text_out.append("Time when scanned  = " + strftime("%d.%m.%Y %H:%M:%S", gmtime(instance_to_log.params[op_keys])))
                 elif op_keys == self.TAG_DATA['SERIES_NUM']:
-                    log_text_out.append("Frame serial num   = " + str().join(format(idx_hex_conv, '02X') for idx_hex_conv in instance_to_log.params[0x08]))
-        log_file = open(self.__log_dir_path + "/" + self.__logfile_head + strftime("-%Y-%m-%d-%H" + self.__timezone_str + ".log", gmtime_stamp_to_log), "a")
-        del time_stamp_to_log, gmtime_stamp_to_log
-        for j in range(len(log_text_out)):
-            if self.__log_stdout:
-                print(log_text_out[j])
-            log_file.write(log_text_out[j].replace("\r", str()) + "\n")
-        log_file.close()
-        del j, log_text_out
+                    log_text_out.append("Frame serial num   = " + instance_to_log.params[0x08].hex().upper())
+        del time_stamp_to_log, __ts_second
+        if self.__queue is None:
+            with self.__lock:
+                self.__write(__ts_file_name, log_text_out)
+                self.__log_file.flush()
+        elif self.__queue_block:
+            self.__queue.put((__ts_file_name, log_text_out))
+        else:
+            try:
+                self.__queue.put_nowait((__ts_file_name, log_text_out))
+            except QueueFull:
+                self.dropped += 1
+        del log_text_out
+
+class ReplyTemplate(ClouRFIDFrame):
+    """
+    Precomputed frame of reply to reader with fixed data length, as confirmations
+    MAN_CONN_CONFIRM and MAN_TAG_DATA_RESPONSE: header and its CRC are computed once,
+    frame() adds only data bytes and the CRC over them, the same bytes as encodeFrame() gives
+    """
+    def __init__(self, message_id_set, message_type_set, init_by_reader_set, data_len_set):
+        ClouRFIDFrame.__init__(self, message_id_set, message_type_set, init_by_reader_set)
+        self.data_len = data_len_set
+        self.__head = bytes([self.frame_head, self.message_type + (self.init_by_reader << 4), self.message_id, data_len_set // 256, data_len_set % 256])
+        self.__head_crc16 = self.crc16sum(self.__head[1:])
+    def frame(self, data_bytes):
+        """ Raw frame bytes() with data_bytes of data_len_set length """
+        __crc16_value = self.crc16sum(data_bytes, self.__head_crc16)
+        return self.__head + data_bytes + bytes([__crc16_value // 256, __crc16_value % 256])
+
+class TagRecord:
+    """ Compact record of one unique tag stored in TagBuffer() """
+    __slots__ = ("EPC_code", "PC_value", "ant_id", "params", "size")
+    def __init__(self, EPC_code, PC_value, ant_id, params, size=0):
+        self.EPC_code = EPC_code    # bytes(), interned by TagBuffer()
+        self.PC_value = PC_value
+        self.ant_id = ant_id
+        self.params = params        # tuple() of (param id, value) pairs as in TagData().params
+        self.size = size            # estimated bytes taken by the record
+
+class TagBuffer:
+    """
+    Memory-bounded buffer of unique tags received from Clou scanner,
+    kept in order of arrival and keyed by TagData().dedupeKey(),
+    so the buffer itself is the store for the duplicates check.
+    EPC codes are interned, tags with equal EPC share one bytes() object.
+    When max_records_set or max_bytes_set (0 means no limit) is reached,
+    policy_set "drop-oldest" evicts the oldest tags for the new one,
+    "drop-new" drops the new tag; both are counted in stats().
+    """
+    OVERFLOW_POLICIES = ("drop-oldest", "drop-new")
+    def __init__(self, max_records_set=0, max_bytes_set=0, policy_set="drop-oldest"):
+        assert isinstance(max_records_set, int) and (max_records_set >= 0), "max_records_set must be int() >= 0"
+        assert isinstance(max_bytes_set, int) and (max_bytes_set >= 0), "max_bytes_set must be int() >= 0"
+        assert policy_set in self.OVERFLOW_POLICIES, "policy_set must be one of " + repr(self.OVERFLOW_POLICIES)
+        self.max_records = max_records_set
+        self.max_bytes = max_bytes_set
+        self.policy = policy_set
+        self.size_bytes = 0         # estimated bytes taken by all records
+        self.version = 0            # changed on every change of the buffer
+        self.dropped_new = 0        # tags not stored due to overflow with "drop-new"
+        self.evicted_oldest = 0     # tags evicted due to overflow with "drop-oldest"
+        self.__records = OrderedDict()  # TagData().dedupeKey() -> TagRecord()
+        self.__epc_refs = dict()        # EPC bytes() -> [interned EPC bytes(), number of records using it]
+    def __len__(self):
+        return len(self.__records)
+    def __contains__(self, dedupe_key):
+        return dedupe_key in self.__records
+    def __release_epc(self, EPC_code):
+        __ref = self.__epc_refs[EPC_code]
+        __ref[1] -= 1
+        if __ref[1] == 0:
+            del self.__epc_refs[EPC_code]
+    def __overflow(self, record_size):
+        if self.max_records and (len(self.__records) >= self.max_records):
+            return True
+        if self.max_bytes and (self.size_bytes + record_size > self.max_bytes):
+            return True
+        return False
+    def add(self, dedupe_key, tag_data):
+        """
+        Store decoded TagData() tag_data with its dedupe_key = tag_data.dedupeKey(),
+        returns True if stored, False if the tag is a duplicate or dropped due to overflow
+        """
+        if dedupe_key in self.__records:
+            return False
+        __ref = self.__epc_refs.get(tag_data.EPC_code)
+        if __ref is None:
+            __ref = [tag_data.EPC_code, 0]
+            self.__epc_refs[tag_data.EPC_code] = __ref
+            __epc_size = getsizeof(tag_data.EPC_code)
+        else:
+            __epc_size = 0
+        __ref[1] += 1
+        __params = tuple(tag_data.params.items())
+        __record = TagRecord(__ref[0], tag_data.PC_value, tag_data.ant_id, __params)
+        # dedupe_key starts from EPC code, keep the interned one there as well
+        dedupe_key = (__ref[0],) + dedupe_key[1:]
+        __record.size = getsizeof(__record) + getsizeof(__params) + getsizeof(dedupe_key) + getsizeof(dedupe_key[3]) + __epc_size
+        for __prm_id, __prm_val in __params:
+            __record.size += getsizeof(__prm_val)
+        while self.__overflow(__record.size) and self.__records:
+            if self.policy == "drop-new":
+                self.dropped_new += 1
+                self.__release_epc(tag_data.EPC_code)
+                return False
+            __old_key, __old_record = self.__records.popitem(last=False)
+            self.size_bytes -= __old_record.size
+            self.__release_epc(__old_record.EPC_code)
+            self.evicted_oldest += 1
+        self.__records[dedupe_key] = __record
+        self.size_bytes += __record.size
+        self.version += 1
+        return True
+    def encodeInDicts(self, tag_data):
+        """
+        List of dict() of all stored tags, the same as TagData().encodeInDict() of them,
+        tag_data - TagData() instance used for encoding, its properties are overwritten
+        """
+        __res_list = list()
+        for __record in self.__records.values():
+            tag_data.loadRecord(__record)
+            __res_list.append(tag_data.encodeInDict())
+        return __res_list
+    def clear(self):
+        """
+        Erase all tags together with the duplicates check, returns number of erased tags
+        """
+        __erased = len(self.__records)
+        self.__records = OrderedDict()
+        self.__epc_refs = dict()
+        self.size_bytes = 0
+        self.version += 1
+        return __erased
+    def stats(self):
+        """ dict() with size, limits and overflow counters of the buffer """
+        return {
+            "records": len(self.__records),
+            "unique-epc": len(self.__epc_refs),
+            "size-bytes": self.size_bytes,
+            "max-records": self.max_records,
+            "max-bytes": self.max_bytes,
+            "overflow-policy": self.policy,
+            "dropped-new": self.dropped_new,
+            "evicted-oldest": self.evicted_oldest
+        }
+
+class TagStatsRecord:
+    """ Aggregate of all reads of one EPC stored in TagStats() """
+    __slots__ = ("first_seen", "last_seen", "reads", "best_rssi", "ants")
+    def __init__(self, seen_time):
+        self.first_seen = seen_time
+        self.last_seen = seen_time
+        self.reads = 0
+        self.best_rssi = None
+        self.ants = dict()      # antenna id -> [reads, best RSSI, last seen]
+
+class TagStats:
+    """
+    Per-EPC aggregate statistics of tags received from Clou scanner:
+    first and last seen time, number of reads, best RSSI, and the same per antenna.
+    Record of EPC is updated in place on each read, so memory depends on
+    number of unique EPC only, not on the read rate.
+    When max_records_set (0 means no limit) is reached, EPC not seen for the longest time is evicted.
+    """
+    def __init__(self, max_records_set=0):
+        assert isinstance(max_records_set, int) and (max_records_set >= 0), "max_records_set must be int() >= 0"
+        self.max_records = max_records_set
+        self.version = 0            # changed on every change of the statistics
+        self.evicted = 0            # EPC evicted due to max_records
+        self.__records = OrderedDict()  # EPC bytes() -> TagStatsRecord(), from least to most recently seen
+    def __len__(self):
+        return len(self.__records)
+    def update(self, tag_data, seen_time):
+        """
+        Count read of decoded TagData() tag_data at seen_time - float() timestamp
+        """
+        __record = self.__records.get(tag_data.EPC_code)
+        if __record is None:
+            if self.max_records and (len(self.__records) >= self.max_records):
+                self.__records.popitem(last=False)
+                self.evicted += 1
+            __record = TagStatsRecord(seen_time)
+            self.__records[tag_data.EPC_code] = __record
+        else:
+            self.__records.move_to_end(tag_data.EPC_code)
+        __rssi = tag_data.params.get(0x01)
+        __ant = __record.ants.get(tag_data.ant_id)
+        if __ant is None:
+            __ant = [0, None, seen_time]
+            __record.ants[tag_data.ant_id] = __ant
+        __record.reads += 1
+        __record.last_seen = seen_time
+        __ant[0] += 1
+        __ant[2] = seen_time
+        if __rssi is not None:
+            if (__record.best_rssi is None) or (__rssi > __record.best_rssi):
+                __record.best_rssi = __rssi
+            if (__ant[1] is None) or (__rssi > __ant[1]):
+                __ant[1] = __rssi
+        self.version += 1
+    def encodeInDicts(self):
+        """ List of dict() of statistics of all EPC, from least to most recently seen """
+        __res_list = list()
+        for __EPC_code, __record in self.__records.items():
+            __res_list.append({
+                "EPC_code": __EPC_code.hex().upper(),
+                "first-seen": __record.first_seen,
+                "last-seen": __record.last_seen,
+                "reads": __record.reads,
+                "best-RSSI": __record.best_rssi,
+                "ants": {str(__ant_id): {"reads": __ant[0], "best-RSSI": __ant[1], "last-seen": __ant[2]} for __ant_id, __ant in __record.ants.items()}
+                })
+        return __res_list
+    def clear(self):
+        """ Erase all statistics, returns number of erased EPC """
+        __erased = len(self.__records)
+        self.__records = OrderedDict()
+        self.version += 1
+        return __erased
+    def stats(self):
+        """ dict() with size, limit and eviction counter """
+        return {
+            "records": len(self.__records),
+            "max-records": self.max_records,
+            "evicted": self.evicted
+        }
+
+class TagRules:
+    """
+    Rules for reads of tags received from Clou scanner, checked in order for each decoded tag
+    before it is stored: the first rule with all its conditions met decides by its "action",
+    "accept", "drop", or "sample" - keep one of "every" reads matched, or random "rate" share
+    of them; reads matched by no rule get default_action_set, "accept" or "drop".
+    Conditions of rule dict(), all optional, rule without conditions matches all reads:
+    "rssi-min", "rssi-max" - RSSI within, reads without RSSI parameter do not match;
+    "ant-mask" - antenna mask 1-255, bit 0 for antenna 1;
+    "epc-prefix" - hex str(), EPC starts with it;
+    "epc-value", "epc-mask" - hex str() of equal length, EPC bits under mask equal to value;
+    "pc-value", "pc-mask" - int(), bits of PC word under mask equal to value;
+    "xpc" - true or false, XPC indicator of PC word.
+    Rules are compiled once to tuples of predicates, for every rule "matched" and
+    "accepted" reads are counted, and for the default action under DEFAULT_NAME
+    """
+    ACTIONS = ("accept", "drop", "sample")
+    CONDITIONS = ("rssi-min", "rssi-max", "ant-mask", "epc-prefix", "epc-value", "epc-mask", "pc-value", "pc-mask", "xpc")
+    DEFAULT_NAME = "default"
+    def __init__(self, rules_set, default_action_set="accept"):
+        """
+        rules_set - list() of rule dict() with conditions, "action", "every" or "rate" for sample,
+        and optional "name", rule-<index> by default
+        default_action_set - "accept" or "drop" for reads not matched by any rule;
+        ValueError is raised for a wrong rule
+        """
+        if not isinstance(rules_set, list):
+            raise ValueError("tag-rules must be list of rules")
+        if default_action_set not in ("accept", "drop"):
+            raise ValueError("tag-rules-default must be 'accept' or 'drop'")
+        self.default_accept = (default_action_set == "accept")
+        self.__chain = list()       # [name, tuple() of predicates, accept if not sample, every, rate, counts [matched, accepted]]
+        self.__default_counts = [0, 0]
+        for __idx, __rule in enumerate(rules_set):
+            self.__chain.append(self.__compile(__rule, "rule-" + str(__idx)))
+        __names = [__rule[0] for __rule in self.__chain] + [self.DEFAULT_NAME]
+        if len(set(__names)) != len(__names):
+            raise ValueError("tag-rules: names of rules must be unique and not '" + self.DEFAULT_NAME + "'")
+    def __len__(self):
+        return len(self.__chain)
+    @classmethod
+    def __compile(cls, rule, default_name):
+        """ Rule dict() to the list() of the chain """
+        if not isinstance(rule, dict):
+            raise ValueError("tag-rules: rule must be JSON object: " + repr(rule))
+        __name = rule.get("name", default_name)
+        __unknown = set(rule.keys()) - set(cls.CONDITIONS) - {"name", "action", "every", "rate"}
+        if __unknown:
+            raise ValueError("tag-rules: unknown keys " + repr(sorted(__unknown)) + " in rule " + repr(__name))
+        for __key in ("rssi-min", "rssi-max", "ant-mask", "pc-value", "pc-mask", "every"):
+            if (__key in rule) and ((not isinstance(rule[__key], int)) or isinstance(rule[__key], bool) or (rule[__key] < 0)):
+                raise ValueError("tag-rules: '" + __key + "' must be int() >= 0 in rule " + repr(__name))
+        __predicates = list()
+        if "rssi-min" in rule:
+            __predicates.append(lambda __tag, __min=rule["rssi-min"]: __tag.params.get(0x01, -1) >= __min)
+        if "rssi-max" in rule:
+            __predicates.append(lambda __tag, __max=rule["rssi-max"]: 0 <= __tag.params.get(0x01, -1) <= __max)
+        if "ant-mask" in rule:
+            if not (1 <= rule["ant-mask"] <= 255):
+                raise ValueError("tag-rules: 'ant-mask' must be from 1 to 255 in rule " + repr(__name))
+            __predicates.append(lambda __tag, __mask=rule["ant-mask"]: (__tag.ant_id > 0) and bool((__mask >> (__tag.ant_id - 1)) & 1))
+        try:
+            if "epc-prefix" in rule:
+                __predicates.append(lambda __tag, __prefix=bytes.fromhex(rule["epc-prefix"]): __tag.EPC_code.startswith(__prefix))
+            if ("epc-value" in rule) or ("epc-mask" in rule):
+                __epc_value = bytes.fromhex(rule["epc-value"])
+                __epc_mask = bytes.fromhex(rule["epc-mask"])
+                if len(__epc_value) != len(__epc_mask):
+                    raise ValueError("not of equal length")
+                __predicates.append(lambda __tag, __len=len(__epc_mask), __value=int.from_bytes(__epc_value, "big"), __mask=int.from_bytes(__epc_mask, "big"): (len(__tag.EPC_code) >= __len) and ((int.from_bytes(__tag.EPC_code[:__len], "big") & __mask) == __value))
+        except (KeyError, TypeError, ValueError) as __exc_error_descr:
+            raise ValueError("tag-rules: 'epc-prefix', 'epc-value' and 'epc-mask' must be hex str(), value and mask of equal length, in rule " + repr(__name) + ": " + repr(__exc_error_descr))
+        if ("pc-value" in rule) or ("pc-mask" in rule):
+            __predicates.append(lambda __tag, __value=rule.get("pc-value", 0), __mask=rule.get("pc-mask", 0xFFFF): (__tag.PC_value & __mask) == __value)
+        if "xpc" in rule:
+            if not isinstance(rule["xpc"], bool):
+                raise ValueError("tag-rules: 'xpc' must be true or false in rule " + repr(__name))
+            __predicates.append(lambda __tag, __xpc=int(rule["xpc"]): __tag.XPC_indicator == __xpc)
+        __action = rule.get("action", "accept")
+        if __action not in cls.ACTIONS:
+            raise ValueError("tag-rules: 'action' must be one of " + repr(cls.ACTIONS) + " in rule " + repr(__name))
+        __every = None
+        __rate = None
+        if __action == "sample":
+            if ("every" in rule) == ("rate" in rule):
+                raise ValueError("tag-rules: sample needs either 'every' or 'rate' in rule " + repr(__name))
+            if "every" in rule:
+                __every = max(rule["every"], 1)
+            elif (not isinstance(rule["rate"], (int, float))) or isinstance(rule["rate"], bool) or not (0.0 <= rule["rate"] <= 1.0):
+                raise ValueError("tag-rules: 'rate' must be from 0.0 to 1.0 in rule " + repr(__name))
+            else:
+                __rate = float(rule["rate"])
+        return [__name, tuple(__predicates), __action == "accept", __every, __rate, [0, 0]]
+    def accept(self, tag_data):
+        """ True if decoded TagData() tag_data is to be stored, counted by the rule deciding """
+        for __name, __predicates, __accept, __every, __rate, __counts in self.__chain:
+            for __predicate in __predicates:
+                if not __predicate(tag_data):
+                    break
+            else:
+                __counts[0] += 1
+                if __every is not None:
+                    __accept = ((__counts[0] - 1) % __every) == 0
+                elif __rate is not None:
+                    __accept = random() < __rate
+                if __accept:
+                    __counts[1] += 1
+                return __accept
+        self.__default_counts[0] += 1
+        if self.default_accept:
+            self.__default_counts[1] += 1
+        return self.default_accept
+    def stats(self):
+        """ Dict() rule name -> matched, accepted and dropped reads, in the order of checking, default last """
+        __stats = OrderedDict()
+        for __name, __counts in [(__rule[0], __rule[5]) for __rule in self.__chain] + [(self.DEFAULT_NAME, self.__default_counts)]:
+            __stats[__name] = {"matched": __counts[0], "accepted": __counts[1], "dropped": __counts[0] - __counts[1]}
+        return __stats
+
+class ClockSkew:
+    """
+    Skew between tag reading time by Clou scanner clock (optional parameter TIME of tag data)
+    and time the tag data is received by server: count, mean, min, max and histogram
+    by EDGES_MS in milliseconds; mean is the correction to add to TIME of tags received
+    since the last clear(), as after the scanner clock is set
+    """
+    EDGES_MS = (-10000, -1000, -100, -10, -1, 1, 10, 100, 1000, 10000)
+    def __init__(self):
+        self.clear()
+    def clear(self):
+        """ Start counting from scratch """
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+        self.since = time()
+        self.buckets = [0] * (len(self.EDGES_MS) + 1)  # counts per range of EDGES_MS, below first and above last edge included
+    def update(self, tag_time, recv_time):
+        """ Count skew of tag with TIME tag_time received at recv_time, both float() timestamps """
+        __skew = recv_time - tag_time
+        self.count += 1
+        self.sum += __skew
+        if (self.min is None) or (__skew < self.min):
+            self.min = __skew
+        if (self.max is None) or (__skew > self.max):
+            self.max = __skew
+        self.buckets[bisect_right(self.EDGES_MS, __skew * 1000)] += 1
+    def stats(self):
+        """ Dict() of skew in seconds and histogram in ms ranges """
+        __labels = ["<" + str(self.EDGES_MS[0])] + [str(self.EDGES_MS[__idx]) + ".." + str(self.EDGES_MS[__idx + 1]) for __idx in range(len(self.EDGES_MS) - 1)] + [">=" + str(self.EDGES_MS[-1])]
+        return {
+            "count": self.count,
+            "mean": (self.sum / self.count) if self.count else None,
+            "min": self.min,
+            "max": self.max,
+            "since": self.since,
+            "histogram-ms": dict(zip(__labels, self.buckets))
+        }
+
+class Metrics:
+    """
+    Counters, gauges and histograms of one process, given out in Prometheus text
+    format by render(); a metric is declared once by counter(), gauge() or histogram()
+    and then updated by its name, labels are tuple() of label values in the order
+    of label_names declared, const_labels_set are added to all metrics.
+    Histogram buckets are counted apart and summed up only in families(),
+    so observe() is one bisect and two additions.
+    families() of several processes, e.g. passed as JSON, go out merged by renderFamilies()
+    """
+    LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+    def __init__(self, const_labels_set=None):
+        self.__const_labels = tuple((const_labels_set or dict()).items())
+        self.__metrics = OrderedDict()  # name -> [type, help, label names, buckets, dict() labels -> value]
+    def __declare(self, name, metric_type, help_text, label_names, buckets):
+        if name not in self.__metrics:
+            self.__metrics[name] = [metric_type, help_text, tuple(label_names), tuple(buckets), dict()]
+    def counter(self, name, help_text, label_names=()):
+        """ Declare counter name """
+        self.__declare(name, "counter", help_text, label_names, ())
+    def gauge(self, name, help_text, label_names=()):
+        """ Declare gauge name """
+        self.__declare(name, "gauge", help_text, label_names, ())
+    def histogram(self, name, help_text, label_names=(), buckets=LATENCY_BUCKETS):
+        """ Declare histogram name with upper bounds of buckets in ascending order """
+        self.__declare(name, "histogram", help_text, label_names, buckets)
+    def inc(self, name, value=1, labels=()):
+        """ Add value to counter name """
+        __values = self.__metrics[name][4]
+        __values[labels] = __values.get(labels, 0) + value
+    def set(self, name, value, labels=()):
+        """ Set gauge name, or counter name counted elsewhere """
+        self.__metrics[name][4][labels] = value
+    def observe(self, name, value, labels=()):
+        """ Count value into histogram name """
+        __metric = self.__metrics[name]
+        __hist = __metric[4].get(labels)
+        if __hist is None:
+            __hist = [[0] * (len(__metric[3]) + 1), 0.0]
+            __metric[4][labels] = __hist
+        __hist[0][bisect_left(__metric[3], value)] += 1
+        __hist[1] += value
+    @staticmethod
+    def __labels_text(label_pairs):
+        if not label_pairs:
+            return str()
+        return "{" + ",".join(__name + '="' + str(__value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"' for __name, __value in label_pairs) + "}"
+    def families(self):
+        """ List() of metrics as lists [name, type, help, list() of sample lines in text format] """
+        __families = list()
+        for __name, (__type, __help, __label_names, __buckets, __values) in self.__metrics.items():
+            __lines = list()
+            __families.append([__name, __type, __help, __lines])
+            for __labels, __value in list(__values.items()):
+                __label_pairs = self.__const_labels + tuple(zip(__label_names, __labels))
+                if __type != "histogram":
+                    __lines.append(__name + self.__labels_text(__label_pairs) + " " + repr(__value))
+                    continue
+                __cumulative = 0
+                for __idx, __bound in enumerate(__buckets + (None,)):
+                    __cumulative += __value[0][__idx]
+                    __lines.append(__name + "_bucket" + self.__labels_text(__label_pairs + (("le", "+Inf" if __bound is None else repr(float(__bound))),)) + " " + str(__cumulative))
+                __lines.append(__name + "_sum" + self.__labels_text(__label_pairs) + " " + repr(__value[1]))
+                __lines.append(__name + "_count" + self.__labels_text(__label_pairs) + " " + str(__cumulative))
+        return __families
+    @staticmethod
+    def renderFamilies(families_list):
+        """ Text exposition format of families() lists, samples of the same metric go under one header """
+        __merged = OrderedDict()
+        for __name, __type, __help, __lines in families_list:
+            if __name not in __merged:
+                __merged[__name] = ["# HELP " + __name + " " + __help, "# TYPE " + __name + " " + __type]
+            __merged[__name].extend(__lines)
+        return "".join(__line + "\n" for __lines in __merged.values() for __line in __lines)
+    def render(self):
+        """ All metrics in Prometheus text exposition format, str() """
+        return self.renderFamilies(self.families())
+
+class RequestTrace:
+    """
+    Latency of stages of web API requests traced by web-req-id: the trace of a request
+    is dict() stage -> timestamp, stamped by web worker and connector in the order of STAGES,
+    stages not passed by the request are missing (STS requests are not sent to reader);
+    the time of a stage is from the previous stage stamped. add() keeps the last
+    max_samples_set times per stage, percentiles() gives out nearest-rank QUANTILES of them
+    """
+    STAGES = ("web-enqueue", "connector-pickup", "frame-encoded", "bytes-sent", "reply-received", "reply-written", "web-pickup")
+    QUANTILES = (0.5, 0.9, 0.99)
+    def __init__(self, max_samples_set=1000):
+        self.traces_count = 0
+        self.__samples = {__stage: deque(maxlen=max_samples_set) for __stage in self.STAGES[1:] + ("total",)}
+    @classmethod
+    def stageTimes(cls, trace):
+        """ List() of tuples (stage, seconds from previous stage) of trace dict(), and ("total", seconds) if 2 stages or more """
+        __times = list()
+        __first = None
+        __prev = None
+        for __stage in cls.STAGES:
+            __stamp = trace.get(__stage)
+            if not isinstance(__stamp, (int, float)):
+                continue
+            if __prev is None:
+                __first = __stamp
+            else:
+                __times.append((__stage, __stamp - __prev))
+            __prev = __stamp
+        if __times:
+            __times.append(("total", __prev - __first))
+        return __times
+    def add(self, trace):
+        """ Keep times of stages of trace dict() """
+        self.traces_count += 1
+        for __stage, __seconds in self.stageTimes(trace):
+            self.__samples[__stage].append(__seconds)
+    def percentiles(self):
+        """ Dict() stage -> count, QUANTILES as p50, p90, p99, and max of seconds kept """
+        __result = dict()
+        for __stage, __samples in self.__samples.items():
+            if not __samples:
+                continue
+            __sorted = sorted(__samples)
+            __result[__stage] = {"count": len(__sorted)}
+            for __quantile in self.QUANTILES:
+                __result[__stage]["p" + str(round(__quantile * 100))] = __sorted[max(0, ceil(__quantile * len(__sorted)) - 1)]
+            __result[__stage]["max"] = __sorted[-1]
+        return __result
+
+class MemAccounting:
+    """
+    Approximate memory taken by structures of a running process: approxBytes() walks
+    objects with getsizeof(), containers by up to sample items with the rest
+    extrapolated, so a big buffer takes about the same time as a small one;
+    shared objects are counted every time they are met, so it is the upper estimate
+    """
+    SCALARS = (str, bytes, bytearray, int, float, bool, complex, type(None))
+    @staticmethod
+    def approxBytes(obj, sample=100, depth=6):
+        """ Approximate deep size of obj in bytes, walking down to depth levels """
+        __size = getsizeof(obj)
+        if isinstance(obj, MemAccounting.SCALARS) or (depth <= 0):
+            return __size
+        if isinstance(obj, dict):
+            __count = len(obj)
+            __items = list(islice(obj.items(), sample))
+            __measured = sum(MemAccounting.approxBytes(__key, sample, depth - 1) + MemAccounting.approxBytes(__value, sample, depth - 1) for __key, __value in __items)
+        elif isinstance(obj, (list, tuple, deque, set, frozenset)):
+            __count = len(obj)
+            __items = list(islice(obj, sample))
+            __measured = sum(MemAccounting.approxBytes(__item, sample, depth - 1) for __item in __items)
+        elif hasattr(obj, "__dict__"):
+            return __size + MemAccounting.approxBytes(vars(obj), sample, depth - 1)
+        elif hasattr(obj, "__slots__"):
+            return __size + sum(MemAccounting.approxBytes(getattr(obj, __slot), sample, depth - 1) for __slot in obj.__slots__ if hasattr(obj, __slot))
+        else:
+            return __size
+        if __items:
+            __size += int(__measured * __count / len(__items))
+        return __size
+    @staticmethod
+    def processMemory():
+        """ Dict() of resident memory of the process now and its peak in bytes, None if not known on the platform """
+        __mem = {"rss-bytes": None, "peak-rss-bytes": None}
+        try:
+            with open("/proc/self/status", "r") as __status_file:
+                for __line in __status_file:
+                    if __line.startswith("VmRSS:"):
+                        __mem["rss-bytes"] = int(__line.split()[1]) * 1024
+                    elif __line.startswith("VmHWM:"):
+                        __mem["peak-rss-bytes"] = int(__line.split()[1]) * 1024
+        except Exception:
+            pass
+        return __mem
+
+class MallocTracer:
+    """
+    Snapshots of tracemalloc for the whole process: start() starts tracing and takes
+    the base snapshot, snapshot() gives top allocations now, diff() gives top growth
+    since the base snapshot and takes the new base if asked, stop() stops tracing.
+    Allocations of tracemalloc itself and of imports are filtered out
+    """
+    KEY_TYPES = ("lineno", "filename", "traceback")
+    def __init__(self):
+        self.base = None            # base snapshot for diff()
+        self.base_time = None
+    def __take(self):
+        return tracemalloc.take_snapshot().filter_traces((tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, "<frozen importlib._bootstrap>"), tracemalloc.Filter(False, "<unknown>")))
+    @staticmethod
+    def __stat_dict(stat, key_type):
+        __trace = stat.traceback.format() if key_type == "traceback" else [str(stat.traceback[0].filename) + ":" + str(stat.traceback[0].lineno)]
+        __stat = {"where": __trace, "size": stat.size, "count": stat.count}
+        if hasattr(stat, "size_diff"):
+            __stat["size-diff"] = stat.size_diff
+            __stat["count-diff"] = stat.count_diff
+        return __stat
+    def start(self, frames=1):
+        """ Start tracing with frames of traceback kept, and take the base snapshot """
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+        self.base = self.__take()
+        self.base_time = time()
+    def snapshot(self, top=20, key_type="lineno"):
+        """ List() of top allocations by size now """
+        return [self.__stat_dict(__stat, key_type) for __stat in self.__take().statistics(key_type)[:top]]
+    def diff(self, top=20, key_type="lineno", rebase=False):
+        """ List() of top allocations by growth since the base snapshot, with rebase the new snapshot becomes the base """
+        if self.base is None:
+            raise ValueError("No base snapshot, start tracing first")
+        __snapshot = self.__take()
+        __stats = [self.__stat_dict(__stat, key_type) for __stat in __snapshot.compare_to(self.base, key_type)[:top]]
+        if rebase:
+            self.base = __snapshot
+            self.base_time = time()
+        return __stats
+    def stop(self):
+        """ Stop tracing and forget the base snapshot """
+        tracemalloc.stop()
+        self.base = None
+        self.base_time = None
+    def status(self):
+        """ Dict() of tracing state, memory traced now and its peak """
+        __status = {"tracing": tracemalloc.is_tracing(), "base-time": self.base_time, "traced-bytes": None, "traced-peak-bytes": None}
+        if __status["tracing"]:
+            __status["traced-bytes"], __status["traced-peak-bytes"] = tracemalloc.get_traced_memory()
+        return __status
 
 class SessionState:
     """
@@ -765,6 +1580,96 @@ class SessionState:
         self.connected = False  # False means now not connected, True means now connected
         self.global_shutdown_flag = False   # Launch app with False shutdown flag
 
+class ReceivedFrame:
+    """ Frame received from Clou scanner and decoded by ClouRFIDFrame().decodeFrame(), passed by reference """
+    __slots__ = ("res", "frame", "data", "recv_time")
+    def __init__(self, res, frame, data, recv_time):
+        self.res = res                  # int() result of decodeFrame()
+        self.frame = frame              # tuple() (message_id, message_type, init_by_reader)
+        self.data = data                # data_bytes, can contain 2 len bytes or not - depends on MID!
+        self.recv_time = recv_time      # float() time of receiving the chunk with the frame
+
+class RawCapture:
+    """
+    Binary capture of raw bytes exchanged with Clou scanner: chunks received
+    from socket and bytes sent, to replay them offline through ReceivedRawLine().
+    File starts with MAGIC, then records of RECORD_HEADER (float() timestamp,
+    direction DIR_RECV or DIR_SENT, length of bytes) followed by the bytes.
+    New file is started when max_bytes_set is reached, max_files_set newest files are kept.
+    Methods can be called from several threads, as from reader I/O thread and main loop.
+    """
+    MAGIC = b"CLOUCAP1"
+    RECORD_HEADER = Struct(">dBI")
+    DIR_RECV = 0
+    DIR_SENT = 1
+    def __init__(self, capture_dir_path_set, capture_head_str_set, max_bytes_set=64*2**20, max_files_set=10):
+        """
+        capture_dir_path_set - dir to put capture files
+        capture_head_str_set - header string for capture file name
+        max_bytes_set - int() max size of one capture file
+        max_files_set - int() max number of capture files kept, older are removed
+        """
+        assert isinstance(capture_dir_path_set, str), "capture_dir_path_set must be str()"
+        assert os_access("/" + capture_dir_path_set.strip("/"), os_F_OK), capture_dir_path_set + " does not exist"
+        assert isinstance(capture_head_str_set, str) and (capture_head_str_set != str()), "capture_head_str_set must be not empty str()"
+        assert isinstance(max_bytes_set, int) and (max_bytes_set > len(self.MAGIC)), "max_bytes_set must be int() > " + str(len(self.MAGIC))
+        assert isinstance(max_files_set, int) and (max_files_set > 0), "max_files_set must be int() > 0"
+        self.__dir_path = "/" + capture_dir_path_set.strip("/")
+        self.__head = capture_head_str_set
+        self.__max_bytes = max_bytes_set
+        self.__max_files = max_files_set
+        self.__file = None
+        self.__file_bytes = 0
+        self.__lock = Lock()
+        self.file_name = str()      # current capture file
+    def __rotate(self, time_stamp):
+        if self.__file is not None:
+            self.__file.close()
+        self.file_name = self.__head + strftime("-%Y%m%d-%H%M%S", gmtime(time_stamp)) + "-{0:06d}".format(int((time_stamp - int(time_stamp)) * 1000000)) + ".cap"
+        self.__file = open(self.__dir_path + "/" + self.file_name, "wb")
+        self.__file.write(self.MAGIC)
+        self.__file_bytes = len(self.MAGIC)
+        __files = sorted(__name for __name in os_listdir(self.__dir_path) if __name.startswith(self.__head + "-") and __name.endswith(".cap"))
+        for __name in __files[:-self.__max_files]:
+            try:
+                os_remove(self.__dir_path + "/" + __name)
+            except OSError:
+                pass
+    def write(self, direction, data_bytes, time_stamp):
+        """ Put data_bytes of direction DIR_RECV or DIR_SENT at time_stamp into capture """
+        with self.__lock:
+            if (self.__file is None) or (self.__file_bytes + self.RECORD_HEADER.size + len(data_bytes) > self.__max_bytes):
+                self.__rotate(time_stamp)
+            self.__file.write(self.RECORD_HEADER.pack(time_stamp, direction, len(data_bytes)))
+            self.__file.write(data_bytes)
+            self.__file_bytes += self.RECORD_HEADER.size + len(data_bytes)
+    def flush(self):
+        """ Write buffered records to the file """
+        with self.__lock:
+            if self.__file is not None:
+                self.__file.flush()
+    def close(self):
+        """ Close current capture file """
+        with self.__lock:
+            if self.__file is not None:
+                self.__file.close()
+                self.__file = None
+    @classmethod
+    def read(cls, capture_file_path):
+        """ Generator of tuples (timestamp, direction, bytes()) from capture file """
+        with open(capture_file_path, "rb") as __file:
+            if __file.read(len(cls.MAGIC)) != cls.MAGIC:
+                raise ValueError(capture_file_path + " is not a capture file")
+            while True:
+                __header = __file.read(cls.RECORD_HEADER.size)
+                if len(__header) < cls.RECORD_HEADER.size:
+                    return
+                __time_stamp, __direction, __len = cls.RECORD_HEADER.unpack(__header)
+                __data_bytes = __file.read(__len)
+                if len(__data_bytes) < __len:
+                    return
+                yield (__time_stamp, __direction, __data_bytes)
+
 class ReceivedRawLine(Crc16Ibm):
     """
     Class handling the raw datastream coming from reader.
@@ -794,6 +1699,11 @@ class ReceivedRawLine(Crc16Ibm):
         self.__rs485_mark = rs485_mark_set  # rs485_mark value the same as for ClouRFIDFrame() class init
         self.__parse_limit = parse_limit_set
         self.__unknown_bytes = list()   # List of bytes() objects, in each - unknown bytes left after unpack() calls
+        self.bytes_count = 0            # Public counters for all the life of the instance: bytes added to stream,
+        self.frames_count = 0           # frames extracted,
+        self.crc_errors = 0             # candidate frames with wrong CRC,
+        self.resyncs = 0                # times unknown bytes were skipped to the next frame,
+        self.unknown_bytes_count = 0    # and number of those bytes
     def add_to_stream(self, new_chunk_of_bytes):
         """
         Method to add new piece of bytes() received from socket
@@ -806,11 +1716,15 @@ class ReceivedRawLine(Crc16Ibm):
             self.__err_text = "new_chunk_of_bytes in ReceivedRawLine() add() method must be bytes()"
             return -1
         self.__raw_stream += new_chunk_of_bytes # Important - here appending the chunk to the end of raw stream
+        self.bytes_count += len(new_chunk_of_bytes)
         return 0
     def clear_stream(self):
         """ Method to erase contents of the raw bytes stream """
         self.__err_text = str()
         self.__raw_stream = bytes()
+    def buffered(self):
+        """ Number of bytes received and not unpacked into frames yet """
+        return len(self.__raw_stream)
     def get_unknowns(self):
         """ Get unknown bytes in a list() of bytes() objects, after returning it clears unknowns """
         self.__err_text = str()
@@ -862,14 +1776,19 @@ class ReceivedRawLine(Crc16Ibm):
                             crc16_u_lsb = crc16_u_value % 256
                             if (crc16_u_msb == res_cut_line_tmp[-2]) and (crc16_u_lsb == res_cut_line_tmp[-1]):
                                 self.frames.append(res_cut_line_tmp)    # Here append the decoded frame to the frames list!
+                                self.frames_count += 1
                                 new_raw_line = bytes()
                                 new_raw_line = self.__raw_stream[(len(res_cut_line_tmp) + response_raw_line_AA_idx):]
                                 if response_raw_line_AA_idx > 0:
                                     self.__unknown_bytes.append(self.__raw_stream[:response_raw_line_AA_idx])
+                                    self.resyncs += 1
+                                    self.unknown_bytes_count += response_raw_line_AA_idx
                                 self.__raw_stream = bytes()
                                 self.__raw_stream = new_raw_line
                                 tmp_idx_break_flag = False
                                 del new_raw_line
+                            else:
+                                self.crc_errors += 1
                             del crc16_u_msb, crc16_u_lsb, crc16_u_value, res_cut_line_tmp_crc
                         del res_cut_line_tmp, len_tmp
                     else:
@@ -1064,6 +1983,87 @@ class PackDataToClou(ClouProtocolDefinitions):
             return bytes()
         # And return from the method
         return __data_bytes_out
+    def checkQuery(self, query_dict, tdict):
+        """
+        Check the content of query method payload received from web API
+        before it is passed to the connector, with the same rules
+        packFromSndDict() applies when packing.
+        query_dict - dict() of the payload, {"msid": ..., "prms": {...}}
+        tdict - dict() of the whole command template JSON for query_dict["msid"]
+        Returns 0 if payload is OK, -1 if not, reason is in self.decode_error_text
+        """
+        self.decode_error = False
+        self.decode_error_text = str()
+        if not isinstance(query_dict, dict):
+            self.decode_error = True
+            self.decode_error_text = "Payload must be JSON object"
+            return -1
+        if not isinstance(query_dict.get("msid"), str):
+            self.decode_error = True
+            self.decode_error_text = "Key 'msid' must be in payload and must be string"
+            return -1
+        if (not isinstance(tdict, dict)) or (not isinstance(tdict.get("snd"), dict)):
+            self.decode_error = True
+            self.decode_error_text = "No command template for msid = '" + query_dict["msid"] + "'"
+            return -1
+        __qprms = query_dict.get("prms", dict())
+        if not isinstance(__qprms, dict):
+            self.decode_error = True
+            self.decode_error_text = "Key 'prms' in payload must be JSON object"
+            return -1
+        __tprms = tdict["snd"].get("prms", dict())
+        try:
+            for __prm_key in __qprms.keys():
+                if __prm_key not in __tprms.keys():
+                    self.decode_error = True
+                    self.decode_error_text = "Parameter '" + __prm_key + "' unknown for msid = '" + query_dict["msid"] + "'"
+                    return -1
+                if (not isinstance(__qprms[__prm_key], dict)) or ("val" not in __qprms[__prm_key].keys()):
+                    self.decode_error = True
+                    self.decode_error_text = "Parameter '" + __prm_key + "' must be JSON object with 'val' key"
+                    return -1
+            for __prm_key in __tprms.keys():
+                __prm = __tprms[__prm_key]
+                if __prm_key not in __qprms.keys():
+                    if __prm["pid"] == "M":
+                        self.decode_error = True
+                        self.decode_error_text = "Mandatory parameter '" + __prm_key + "' missing"
+                        return -1
+                    continue
+                __val_src = __qprms[__prm_key]["val"]
+                if (__prm["pid"] == "M") and (repr(__val_src) == "-1"):
+                    self.decode_error = True
+                    self.decode_error_text = "Value of mandatory parameter '" + __prm_key + "' must be filled, -1 means empty"
+                    return -1
+                if isinstance(__val_src, int):
+                    if __val_src < 0:
+                        self.decode_error = True
+                        self.decode_error_text = "Value of parameter '" + __prm_key + "' must be positive: " + repr(__val_src)
+                        return -1
+                    if __val_src >= 2**int(__prm["type"][1:]):
+                        self.decode_error = True
+                        self.decode_error_text = "Value of parameter '" + __prm_key + "' does not fit into " + __prm["type"] + ": " + repr(__val_src)
+                        return -1
+                elif isinstance(__val_src, str):
+                    try:
+                        __val = bytes.fromhex(__val_src)
+                    except ValueError:
+                        self.decode_error = True
+                        self.decode_error_text = "Value of parameter '" + __prm_key + "' is not hex string: " + repr(__val_src)
+                        return -1
+                    if __prm["is-fixed-len"] and (len(__val) != int(__prm["len"])):
+                        self.decode_error = True
+                        self.decode_error_text = "Length of parameter '" + __prm_key + "' value " + repr(__val_src) + " is " + str(len(__val)) + " bytes, must be " + str(__prm["len"])
+                        return -1
+                else:
+                    self.decode_error = True
+                    self.decode_error_text = "Wrong type of value of parameter '" + __prm_key + "': " + repr(__val_src)
+                    return -1
+        except Exception as __exc_error_descr:
+            self.decode_error = True
+            self.decode_error_text = "Error " + repr(__exc_error_descr) + " checking payload against template of msid = '" + query_dict["msid"] + "'"
+            return -1
+        return 0
     def unpackToRcvDict(self, rcv_dict):
         """
         Unpack the frame data from rcv_dict.
@@ -14,12 +14,243 @@ sudo curl -vv -d '{"msid": "MAN_QUERY_INFO"}' 'http://testapp.viledadev.ru/api/v
 import os
 import os.path
 from json import load, loads, dumps
-from time import time, sleep
+from time import time, sleep, perf_counter
 from random import seed, randrange, getrandbits
+from urllib.parse import parse_qs
+import zlib
 import ntplib
 import fme
+import clouprotocol
+
+# Command templates loaded from "cmds-dir", cached for the life of the worker
+# process and re-read only when a file modification time changes,
+# key is the template file name, value is tuple (mtime, template dict)
+cmd_templates_cache = dict()
+clou_defs = clouprotocol.ClouProtocolDefinitions()
+
+# Metrics of the worker process, created by the first request after "metrics" is on in config
+web_metrics = None
+
+def load_cmd_templates(cmds_dir):
+    """
+    Refresh cmd_templates_cache from cmds_dir and return dict() msid -> template,
+    files are re-read only if modified since the previous call
+    """
+    __templates = dict()
+    __seen_files = list()
+    for __tmp_name_walk_f in os.listdir(cmds_dir):
+        if (__tmp_name_walk_f[:-5] in clou_defs.FULL_MID_LIST) and (__tmp_name_walk_f[-5:] == ".json"):
+            __json_file_name = os.path.join(cmds_dir, __tmp_name_walk_f)
+            __mtime = os.stat(__json_file_name).st_mtime
+            __seen_files.append(__tmp_name_walk_f)
+            if (__tmp_name_walk_f not in cmd_templates_cache) or (cmd_templates_cache[__tmp_name_walk_f][0] != __mtime):
+                __json_file = open(__json_file_name, "r")
+                cmd_templates_cache[__tmp_name_walk_f] = (__mtime, load(__json_file))
+                __json_file.close()
+            __templates[__tmp_name_walk_f[:-5]] = cmd_templates_cache[__tmp_name_walk_f][1]
+    for __cached_name in list(cmd_templates_cache.keys()):
+        if __cached_name not in __seen_files:
+            del cmd_templates_cache[__cached_name]
+    return __templates
+
+def check_inventory(inventory_prms, max_duration):
+    """
+    Check parameters of inventory, return str() with the reason if wrong,
+    or empty str() if parameters are OK
+    """
+    if not isinstance(inventory_prms, dict):
+        return "Inventory parameters must be JSON object"
+    if (not isinstance(inventory_prms.get("duration"), (int, float))) or isinstance(inventory_prms["duration"], bool):
+        return "Key 'duration' must be number of seconds"
+    if (inventory_prms["duration"] <= 0) or (inventory_prms["duration"] > max_duration):
+        return "Key 'duration' must be > 0 and <= inventory-max-duration = " + repr(max_duration)
+    if (not isinstance(inventory_prms.get("ant"), int)) or isinstance(inventory_prms["ant"], bool) or (inventory_prms["ant"] < 1) or (inventory_prms["ant"] > 255):
+        return "Key 'ant' must be antenna mask integer from 1 to 255"
+    if inventory_prms.get("dedupe", "epc") not in ["epc", "epc-ant", "none"]:
+        return "Key 'dedupe' must be 'epc', 'epc-ant' or 'none'"
+    return str()
+
+def check_profile(profile_prms, max_duration):
+    """
+    Check parameters of profiling, return str() with the reason if wrong,
+    or empty str() if parameters are OK
+    """
+    if not isinstance(profile_prms, dict):
+        return "Profile parameters must be JSON object"
+    if profile_prms.get("mode", "stages") not in ["stages", "cprofile", "sample"]:
+        return "Key 'mode' must be 'stages', 'cprofile' or 'sample'"
+    if (not isinstance(profile_prms.get("duration", 10.0), (int, float))) or isinstance(profile_prms.get("duration"), bool):
+        return "Key 'duration' must be number of seconds"
+    if (profile_prms.get("duration", 10.0) <= 0) or (profile_prms.get("duration", 10.0) > max_duration):
+        return "Key 'duration' must be > 0 and <= profile-max-duration = " + repr(max_duration)
+    if (not isinstance(profile_prms.get("top", 30), int)) or isinstance(profile_prms.get("top"), bool) or (profile_prms.get("top", 30) < 1):
+        return "Key 'top' must be positive integer"
+    if profile_prms.get("sort", "cumulative") not in ["cumulative", "tottime", "calls", "own", "total"]:
+        return "Key 'sort' must be 'cumulative', 'tottime', 'calls' for cprofile, 'own' or 'total' for sample"
+    if not isinstance(profile_prms.get("file", False), bool):
+        return "Key 'file' must be true or false"
+    return str()
+
+def check_memstats(memstats_prms):
+    """
+    Check parameters of memstats, return str() with the reason if wrong,
+    or empty str() if parameters are OK
+    """
+    if not isinstance(memstats_prms, dict):
+        return "Memstats parameters must be JSON object"
+    if memstats_prms.get("tracemalloc") not in [None, "start", "snapshot", "diff", "stop"]:
+        return "Key 'tracemalloc' must be 'start', 'snapshot', 'diff' or 'stop'"
+    if memstats_prms.get("key", "lineno") not in ["lineno", "filename", "traceback"]:
+        return "Key 'key' must be 'lineno', 'filename' or 'traceback'"
+    for __int_key in ["top", "frames"]:
+        if (not isinstance(memstats_prms.get(__int_key, 1), int)) or isinstance(memstats_prms.get(__int_key), bool) or (memstats_prms.get(__int_key, 1) < 1):
+            return "Key '" + __int_key + "' must be positive integer"
+    return str()
+
+def init_web_metrics(metrics_on):
+    """ Create metrics of the worker process if metrics_on and not created yet """
+    global web_metrics
+    if metrics_on and (web_metrics is None):
+        web_metrics = clouprotocol.Metrics({"worker": str(os.getpid())})
+        web_metrics.histogram("clouweb_request_seconds", "Time of serving web API request by worker process", ("method", "status"))
+        web_metrics.histogram("clouweb_request_stage_seconds", "Time of stages of traced web API requests, from the previous stage", ("method", "stage"))
+
+def trace_finish(trace, web_req_id, rid, api_method, status, trace_log_file):
+    """
+    Trace of web API request is over: stamped web-pickup if reply is received,
+    counted by stages in metrics, written as JSON line to trace_log_file if set;
+    returns the trace as JSON str() for X-Clou-Trace header
+    """
+    if status != "504":
+        trace["web-pickup"] = time()
+    __stage_times = clouprotocol.RequestTrace.stageTimes(trace)
+    if web_metrics is not None:
+        for __stage, __seconds in __stage_times:
+            web_metrics.observe("clouweb_request_stage_seconds", __seconds, (api_method, __stage))
+    if trace_log_file:
+        try:
+            __trace_log = open(trace_log_file, "a")
+            __trace_log.write(dumps({"web-req-id": web_req_id, "rid": rid, "api-method": api_method, "status": status, "trace": trace, "stages": dict(__stage_times)}) + "\n")
+            __trace_log.close()
+        except Exception:
+            pass
+    return dumps(trace)
+
+def collect_metrics(clou_run_dir, readers_list, worker_id, reply_wait_timeout, reply_read_delay):
+    """
+    Metrics of this worker process and of connectors of readers_list in Prometheus text format;
+    connectors are asked with STS "metrics" all at once, clou_reader_up is 0
+    for a reader not replied within reply_wait_timeout
+    """
+    __fme_msgs = dict()
+    __req_ids = dict()
+    __families = list()
+    __up = clouprotocol.Metrics()
+    __up.gauge("clou_reader_up", "1 if connector of reader replied metrics", ("rid",))
+    for __rid in readers_list:
+        __up.set("clou_reader_up", 0, (__rid,))
+        __dir_msg_name = "/" + clou_run_dir.strip("/") + "/" + __rid
+        if not os.access(__dir_msg_name, os.F_OK):
+            continue
+        __fme_msg = fme.FileMessageExchange(worker_id, __dir_msg_name, message_types_set=["STS"])
+        __req_ids[__rid] = "{0:032x}".format(getrandbits(128))
+        if __fme_msg.snd(__rid, "STS", {"web-req-id": __req_ids[__rid], "query-content": {"api-method": "metrics"}}) == 0:
+            __fme_msg.wake_notify()
+            __fme_msgs[__rid] = __fme_msg
+    __wait_start = time()
+    while __fme_msgs and (time() <= (__wait_start + reply_wait_timeout)):
+        for __rid in list(__fme_msgs.keys()):
+            if __fme_msgs[__rid].rcv(__rid, "STS") <= 0:
+                continue
+            for __msg_rcv_item in __fme_msgs[__rid].getall():
+                if __msg_rcv_item[0]["web-req-id"] == __req_ids[__rid]:
+                    if __msg_rcv_item[0]["reply-content"].get("is-ok"):
+                        __families.extend(__msg_rcv_item[0]["reply-content"]["result"])
+                        __up.set("clou_reader_up", 1, (__rid,))
+                    del __fme_msgs[__rid]
+                    break
+        if __fme_msgs:
+            sleep(reply_read_delay)
+    __families = __up.families() + __families
+    if web_metrics is not None:
+        __families = web_metrics.families() + __families
+    return clouprotocol.Metrics.renderFamilies(__families)
+
+def choose_content_encoding(accept_encoding):
+    """ Pick gzip or deflate accepted in Accept-Encoding header value, or empty str() if none """
+    __accepted = dict()
+    for __accept_item in accept_encoding.split(","):
+        __accept_parts = __accept_item.strip().split(";")
+        __accept_q = 1.0
+        for __accept_param in __accept_parts[1:]:
+            if __accept_param.strip().startswith("q="):
+                try:
+                    __accept_q = float(__accept_param.strip()[2:])
+                except ValueError:
+                    __accept_q = 0.0
+        __accepted[__accept_parts[0].strip().lower()] = __accept_q
+    for __coding in ["gzip", "deflate"]:
+        if __accepted.get(__coding, __accepted.get("*", 0.0)) > 0.0:
+            return __coding
+    return str()
+
+def compress_stream(payload, content_encoding, chunk_size=65536):
+    """ Generator giving payload compressed with gzip or deflate piece by piece """
+    if content_encoding == "gzip":
+        __compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    else:
+        __compressor = zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS)
+    for __idx in range(0, len(payload), chunk_size):
+        __compressed_chunk = __compressor.compress(payload[__idx:(__idx + chunk_size)])
+        if __compressed_chunk:
+            yield __compressed_chunk
+    yield __compressor.flush()
+
+def reply_response(environ, start_response, response_status, reply_content, trace_header=str()):
+    """
+    Send the reply from connector to web client: ETag from connector goes to header,
+    not modified reply gives 304 without body, large bodies are compressed
+    if client accepts gzip or deflate; trace of request goes to X-Clou-Trace header
+    """
+    response_headers = [("Content-type", "application/json"), ("Vary", "Accept-Encoding")]
+    if trace_header:
+        response_headers.append(("X-Clou-Trace", trace_header))
+    if isinstance(reply_content, dict) and ("etag" in reply_content):
+        response_headers.append(("ETag", reply_content.pop("etag")))
+    if isinstance(reply_content, dict) and reply_content.pop("not-modified", False):
+        start_response("304 Not Modified", response_headers[1:])
+        return [bytes()]
+    response_payload = bytes()
+    if environ['REQUEST_METHOD'] != "HEAD":
+        response_payload = dumps(reply_content, skipkeys=True).encode("ascii")
+    content_encoding = choose_content_encoding(environ.get("HTTP_ACCEPT_ENCODING", str()))
+    if content_encoding and (len(response_payload) >= 1024):
+        response_headers.append(("Content-Encoding", content_encoding))
+        start_response(response_status, response_headers)
+        return compress_stream(response_payload, content_encoding)
+    response_headers.append(("Content-Length", str(len(response_payload))))
+    start_response(response_status, response_headers)
+    return response_payload
 
 def application(environ, start_response):
+    """
+    WSGI entry, serves the request with serve_request(), and with "metrics"
+    on counts time of serving it by API method and response status
+    """
+    if web_metrics is None:
+        return serve_request(environ, start_response)
+    __request_start = perf_counter()
+    __response_status = [str()]
+    def __start_response(status, response_headers, exc_info=None):
+        __response_status[0] = status.split(" ", 1)[0]
+        if exc_info is None:
+            return start_response(status, response_headers)
+        return start_response(status, response_headers, exc_info)
+    __response = serve_request(environ, __start_response)
+    web_metrics.observe("clouweb_request_seconds", perf_counter() - __request_start, (environ.get("clouweb.api-method", "other"), __response_status[0]))
+    return __response
+
+def serve_request(environ, start_response):
     """ Main web application """
     conf_file_name = "/usr/share/dev/clouweb/clou.conf"
     response_payload_success = bytes()
@@ -29,8 +260,14 @@ def application(environ, start_response):
         "getdatacount",
         "getdata",
         "cleandata",
+        "getstats",
+        "cleanstats",
         "shutdown",
-        "update"
+        "update",
+        "jobs",
+        "inventory",
+        "profile",
+        "memstats"
         ]
 
     try:
@@ -63,6 +300,15 @@ def application(environ, start_response):
         api_method = request_url_split[1]
         request_url_apipart = os.path.split(request_url_split_left)[0].strip("/")
         rid_value = os.path.split(request_url_split_left)[1]
+        # Jobs API has one more level in the path: api/v1/<rid>/jobs/<job id>
+        job_id_value = str()
+        if (rid_value == "jobs") and (os.path.split(request_url_apipart)[0].strip("/") == "api/v1"):
+            job_id_value = api_method
+            api_method = "jobs"
+            rid_value = os.path.split(request_url_apipart)[1]
+            request_url_apipart = "api/v1"
+            if (len(job_id_value) != 32) or any((__idx not in set("0123456789abcdef")) for __idx in job_id_value):
+                raise Exception("Wrong job id: " + job_id_value)
     except Exception as __exc_error_descr:
         response_status = "404 Not Found"
         response_payload = bytes('{"Error": "' + repr(__exc_error_descr) + '"}', "ascii")
@@ -70,11 +316,14 @@ def application(environ, start_response):
         start_response(response_status, response_headers)
         return response_payload
 
-    if (request_url_apipart != "api/v1") or (api_method not in ref_full_api_method_list):
+    # Metrics of web workers and connectors of all readers in Prometheus text format
+    metrics_route = (request_path_info_val.strip("/") == "metrics")
+    if (not metrics_route) and ((request_url_apipart != "api/v1") or (api_method not in ref_full_api_method_list)):
         response_status = "404 Not Found"
         response_headers = list()
         start_response(response_status, response_headers)
         return bytes()
+    environ["clouweb.api-method"] = api_method
 
     try:
         app_config_json_file = open(conf_file_name, "r")
@@ -133,6 +382,9 @@ def application(environ, start_response):
                 tmp_err_param = tmp_idx_readers + " not in JSON keys"
                 raise Exception
         reply_wait_timeout = app_config_json["reply-from-reader-timeout"]
+        job_max_wait = float(app_config_json.get("job-max-wait", 5.0))
+        inventory_max_duration = float(app_config_json.get("inventory-max-duration", 60.0))
+        profile_max_duration = float(app_config_json.get("profile-max-duration", 60.0))
         reply_read_delay = app_config_json["delay-between-reads"]
         if not isinstance(reply_wait_timeout, float):
             tmp_err_param = "reply_wait_timeout"
@@ -140,12 +392,19 @@ def application(environ, start_response):
         if not isinstance(reply_read_delay, float):
             tmp_err_param = "reply_read_delay"
             raise Exception
+        metrics_on = bool(app_config_json.get("metrics", False))
+        trace_on = bool(app_config_json.get("trace", False))
+        trace_log_file = app_config_json.get("trace-log-file", str())
+        if not isinstance(trace_log_file, str):
+            tmp_err_param = "trace-log-file"
+            raise Exception
     except Exception as __exc_error_descr:
         response_status = "500 Internal Server Error"
         response_payload = bytes('{"Error": "Missing or wrong parameters:' + tmp_err_param + ' in config: ' + repr(__exc_error_descr) + '"}', "ascii")
         response_headers = [("Content-type", "application/json"), ("Content-Length", str(len(response_payload)))]
         start_response(response_status, response_headers)
         return response_payload
+    init_web_metrics(metrics_on)
 
     # Here we check for worker files and create own random worker ID to be different
     try:
@@ -172,6 +431,31 @@ def application(environ, start_response):
         start_response(response_status, response_headers)
         return response_payload
 
+    if metrics_route:
+        try:
+            if not metrics_on:
+                raise Exception('"metrics" is not enabled in config')
+            response_payload = collect_metrics(clou_run_dir, readers_list, str(this_worker_id), reply_wait_timeout, reply_read_delay).encode("utf-8")
+        except Exception as __exc_error_descr:
+            try:
+                os.remove(this_worker_id_filename)
+            except Exception:
+                pass
+            response_status = "404 Not Found" if not metrics_on else "500 Internal Server Error"
+            response_payload = dumps({"Error": "Can not collect metrics: " + repr(__exc_error_descr)}).encode("ascii")
+            response_headers = [("Content-type", "application/json"), ("Content-Length", str(len(response_payload)))]
+            start_response(response_status, response_headers)
+            return response_payload
+        try:
+            os.remove(this_worker_id_filename)
+        except Exception:
+            pass
+        if request_method_val == "HEAD":
+            response_payload = bytes()
+        response_headers = [("Content-type", "text/plain; version=0.0.4; charset=utf-8"), ("Content-Length", str(len(response_payload)))]
+        start_response("200 OK", response_headers)
+        return response_payload
+
     try:
         request_payload = str(environ['wsgi.input'].read().decode("utf-8"))
         if not request_payload.isascii():
@@ -190,6 +474,82 @@ def application(environ, start_response):
         start_response(response_status, response_headers)
         return response_payload
 
+    # Check query payload against command templates before anything is sent to connector,
+    # for jobs each query in "queries" list is checked the same way
+    # Inventory parameters are checked for inventory method and inventory jobs, and profiling parameters
+    queries_to_check = list()
+    inventory_error = str()
+    profile_error = str()
+    memstats_error = str()
+    if api_method == "query":
+        queries_to_check = [request_payload_dict]
+    elif api_method == "inventory":
+        inventory_error = check_inventory(request_payload_dict, inventory_max_duration)
+    elif api_method == "profile":
+        profile_error = check_profile(request_payload_dict, profile_max_duration)
+    elif api_method == "memstats":
+        memstats_error = check_memstats(request_payload_dict)
+    elif (api_method == "jobs") and (job_id_value == str()) and (request_method_val == "POST") and isinstance(request_payload_dict, dict) and ("inventory" in request_payload_dict):
+        inventory_error = check_inventory(request_payload_dict["inventory"], inventory_max_duration)
+    elif (api_method == "jobs") and (job_id_value == str()) and (request_method_val == "POST"):
+        if isinstance(request_payload_dict, dict) and isinstance(request_payload_dict.get("queries"), list) and request_payload_dict["queries"]:
+            queries_to_check = request_payload_dict["queries"]
+        else:
+            try:
+                os.remove(this_worker_id_filename)
+            except Exception:
+                pass
+            response_status = "400 Bad Request"
+            response_payload = dumps({"Error": "Job payload must contain not empty 'queries' list or 'inventory'"}).encode("ascii")
+            response_headers = [("Content-type", "application/json"), ("Content-Length", str(len(response_payload)))]
+            start_response(response_status, response_headers)
+            return response_payload
+    if inventory_error or profile_error or memstats_error:
+        try:
+            os.remove(this_worker_id_filename)
+        except Exception:
+            pass
+        response_status = "400 Bad Request"
+        if profile_error:
+            response_payload = dumps({"Error": "Wrong profile parameters: " + profile_error}).encode("ascii")
+        elif memstats_error:
+            response_payload = dumps({"Error": "Wrong memstats parameters: " + memstats_error}).encode("ascii")
+        else:
+            response_payload = dumps({"Error": "Wrong inventory parameters: " + inventory_error}).encode("ascii")
+        response_headers = [("Content-type", "application/json"), ("Content-Length", str(len(response_payload)))]
+        start_response(response_status, response_headers)
+        return response_payload
+    if queries_to_check:
+        try:
+            cmds_dir = "/" + app_config_json["cmds-dir"].strip("/")
+            cmd_templates = load_cmd_templates(cmds_dir)
+            query_checker = clouprotocol.PackDataToClou(cmds_dir)
+        except Exception as __exc_error_descr:
+            try:
+                os.remove(this_worker_id_filename)
+            except Exception:
+                pass
+            response_status = "500 Internal Server Error"
+            response_payload = dumps({"Error": "Can not load command templates: " + repr(__exc_error_descr)}).encode("ascii")
+            response_headers = [("Content-type", "application/json"), ("Content-Length", str(len(response_payload)))]
+            start_response(response_status, response_headers)
+            return response_payload
+        for __query_idx, __query_to_check in enumerate(queries_to_check):
+            __query_msid = __query_to_check.get("msid") if isinstance(__query_to_check, dict) else None
+            if query_checker.checkQuery(__query_to_check, cmd_templates.get(__query_msid)) != 0:
+                try:
+                    os.remove(this_worker_id_filename)
+                except Exception:
+                    pass
+                response_status = "400 Bad Request"
+                if api_method == "query":
+                    response_payload = dumps({"Error": "Wrong query payload: " + query_checker.decode_error_text}).encode("ascii")
+                else:
+                    response_payload = dumps({"Error": "Wrong query #" + str(__query_idx) + " in job payload: " + query_checker.decode_error_text}).encode("ascii")
+                response_headers = [("Content-type", "application/json"), ("Content-Length", str(len(response_payload)))]
+                start_response(response_status, response_headers)
+                return response_payload
+
     dir_msg_name = str("/" + clou_run_dir.strip("/") + "/" + rid_value)
 
     try:
@@ -242,9 +602,13 @@ def application(environ, start_response):
     try:
         if api_method == "query":
             msg_content_to_send["query-content"] = request_payload_dict
+            if trace_on:
+                msg_content_to_send["trace"] = {"web-enqueue": time()}
             if fme_msg.snd(rid_value, "CLU", msg_content_to_send) == -1:
                 msg_content_to_send = dict()
                 raise Exception
+            # Connector sleeps in select() until woken up, or until its fme-poll-interval
+            fme_msg.wake_notify()
     except Exception as __exc_error_descr:
         try:
             os.remove(this_worker_id_filename)
@@ -265,6 +629,8 @@ def application(environ, start_response):
                         os.remove(this_worker_id_filename)
                     except Exception:
                         pass
+                    if trace_on:
+                        trace_finish(msg_content_to_send["trace"], msg_content_to_send["web-req-id"], rid_value, api_method, "504", trace_log_file)
                     response_status = "504 Gateway Timeout"
                     response_payload = bytes('{"Error": "Waiting time of reply from reader exceeded configured timeout = ' + repr(reply_wait_timeout) + 'sec"}', "ascii")
                     response_headers = [("Content-type", "application/json"), ("Content-Length", str(len(response_payload)))]
@@ -275,16 +641,14 @@ def application(environ, start_response):
                     msg_rcv_list = fme_msg.getall()
                     for msg_rcv_list_item in msg_rcv_list:
                         if msg_rcv_list_item[0]["web-req-id"] == msg_content_to_send["web-req-id"]:
-                            if request_method_val != "HEAD":
-                                response_payload_success = dumps(msg_rcv_list_item[0]["reply-content"], skipkeys=True).encode("ascii")
-                            response_status = "200 OK"
-                            response_headers = [("Content-type", "application/json"), ("Content-Length", str(len(response_payload_success)))]
                             try:
                                 os.remove(this_worker_id_filename)
                             except Exception:
                                 pass
-                            start_response(response_status, response_headers)
-                            return response_payload_success
+                            __trace_header = str()
+                            if trace_on:
+                                __trace_header = trace_finish(msg_rcv_list_item[0].get("trace", msg_content_to_send["trace"]), msg_content_to_send["web-req-id"], rid_value, api_method, "200", trace_log_file)
+                            return reply_response(environ, start_response, "200 OK", msg_rcv_list_item[0]["reply-content"], __trace_header)
                     sleep(reply_read_delay)
                 else:
                     sleep(reply_read_delay)
@@ -299,12 +663,57 @@ def application(environ, start_response):
         start_response(response_status, response_headers)
         return response_payload
 
+    # Content of status type of web request, and time to wait for the reply
+    sts_query_content = dict()
+    sts_reply_wait_timeout = reply_wait_timeout
+    if api_method in ["update", "shutdown", "getdata", "getdatacount", "cleandata", "getstatus", "getstats", "cleanstats"]:
+        sts_query_content = {"api-method": api_method}
+        # Connector replies with 'not-modified' and no payload if ETag still matches
+        if (api_method in ["getdata", "getdatacount", "getstats"]) and environ.get("HTTP_IF_NONE_MATCH"):
+            sts_query_content["if-none-match"] = environ["HTTP_IF_NONE_MATCH"]
+    elif api_method == "jobs":
+        if (job_id_value == str()) and (request_method_val == "POST"):
+            # New job gets the id of this web request
+            sts_query_content = {"api-method": "job-submit", "job-id": msg_content_to_send["web-req-id"], "prms": request_payload_dict}
+        elif job_id_value == str():
+            sts_query_content = {"api-method": "job-list"}
+        else:
+            # Long polling only if asked with wait=<seconds> in query string, connector replies
+            # as soon as the job is finished or the wait time is over; the worker is held
+            # for the wait, so it is capped by job-max-wait, well below the worker timeout
+            try:
+                __job_wait = float(parse_qs(environ.get("QUERY_STRING", str())).get("wait", ["0"])[0])
+            except Exception:
+                __job_wait = float()
+            __job_wait = min(max(__job_wait, 0.0), job_max_wait)
+            sts_query_content = {"api-method": "job-status", "job-id": job_id_value, "wait": __job_wait}
+            sts_reply_wait_timeout = reply_wait_timeout + __job_wait
+            del __job_wait
+    elif api_method == "inventory":
+        # Inventory runs as a job on connector, reply comes when the job is finished:
+        # start command round trip, inventory window, stop command round trip
+        sts_query_content = {"api-method": "inventory", "job-id": msg_content_to_send["web-req-id"], "prms": {"inventory": request_payload_dict}}
+        sts_reply_wait_timeout = (3 * reply_wait_timeout) + float(request_payload_dict["duration"])
+    elif api_method == "memstats":
+        # Snapshots of tracemalloc of a big heap take seconds
+        sts_query_content = {"api-method": "memstats", "prms": request_payload_dict}
+        if "tracemalloc" in request_payload_dict:
+            sts_reply_wait_timeout = max(reply_wait_timeout, 30.0)
+    elif api_method == "profile":
+        # Connector replies when profiling is over
+        sts_query_content = {"api-method": "profile", "prms": request_payload_dict}
+        sts_reply_wait_timeout = reply_wait_timeout + float(request_payload_dict.get("duration", 10.0))
+
     try:
-        if api_method in ["update", "shutdown", "getdata", "getdatacount", "cleandata", "getstatus"]:
-            msg_content_to_send["query-content"] = {"api-method": api_method}
+        if sts_query_content:
+            msg_content_to_send["query-content"] = sts_query_content
+            # Submitted job gets no reply, its steps are not traced
+            if trace_on and (sts_query_content["api-method"] != "job-submit"):
+                msg_content_to_send["trace"] = {"web-enqueue": time()}
             if fme_msg.snd(rid_value, "STS", msg_content_to_send) == -1:
                 msg_content_to_send = dict()
                 raise Exception
+            fme_msg.wake_notify()
     except Exception as __exc_error_descr:
         try:
             os.remove(this_worker_id_filename)
@@ -316,17 +725,33 @@ def application(environ, start_response):
         start_response(response_status, response_headers)
         return response_payload
 
+    # Job is accepted as soon as it is passed to connector, no waiting for reply
+    if sts_query_content.get("api-method") == "job-submit":
+        try:
+            os.remove(this_worker_id_filename)
+        except Exception:
+            pass
+        response_status = "202 Accepted"
+        response_payload = bytes()
+        if request_method_val != "HEAD":
+            response_payload = dumps({"job-id": msg_content_to_send["web-req-id"], "state": "submitted"}).encode("ascii")
+        response_headers = [("Content-type", "application/json"), ("Content-Length", str(len(response_payload))), ("Location", "/api/v1/" + rid_value + "/jobs/" + msg_content_to_send["web-req-id"])]
+        start_response(response_status, response_headers)
+        return response_payload
+
     try:
-        if api_method in ["update", "shutdown", "getdata", "getdatacount", "cleandata", "getstatus"]:
+        if sts_query_content:
             reply_wait_timeout_start = time()
             while True:
-                if time() > (reply_wait_timeout_start + reply_wait_timeout):
+                if time() > (reply_wait_timeout_start + sts_reply_wait_timeout):
                     try:
                         os.remove(this_worker_id_filename)
                     except Exception:
                         pass
+                    if trace_on:
+                        trace_finish(msg_content_to_send["trace"], msg_content_to_send["web-req-id"], rid_value, api_method, "504", trace_log_file)
                     response_status = "504 Gateway Timeout"
-                    response_payload = bytes('{"Error": "Waiting time of reply from reader exceeded configured timeout = ' + repr(reply_wait_timeout) + 'sec"}', "ascii")
+                    response_payload = bytes('{"Error": "Waiting time of reply from reader exceeded configured timeout = ' + repr(sts_reply_wait_timeout) + 'sec"}', "ascii")
                     response_headers = [("Content-type", "application/json"), ("Content-Length", str(len(response_payload)))]
                     start_response(response_status, response_headers)
                     return response_payload
@@ -335,16 +760,19 @@ def application(environ, start_response):
                     msg_rcv_list = fme_msg.getall()
                     for msg_rcv_list_item in msg_rcv_list:
                         if msg_rcv_list_item[0]["web-req-id"] == msg_content_to_send["web-req-id"]:
-                            if request_method_val != "HEAD":
-                                response_payload_success = dumps(msg_rcv_list_item[0]["reply-content"], skipkeys=True).encode("ascii")
                             response_status = "200 OK"
-                            response_headers = [("Content-type", "application/json"), ("Content-Length", str(len(response_payload_success)))]
+                            if (sts_query_content["api-method"] == "job-status") and (not msg_rcv_list_item[0]["reply-content"].get("is-ok")):
+                                response_status = "404 Not Found"
+                            elif (sts_query_content["api-method"] == "inventory") and (not msg_rcv_list_item[0]["reply-content"].get("is-ok")):
+                                response_status = "502 Bad Gateway"
                             try:
                                 os.remove(this_worker_id_filename)
                             except Exception:
                                 pass
-                            start_response(response_status, response_headers)
-                            return response_payload_success
+                            __trace_header = str()
+                            if trace_on:
+                                __trace_header = trace_finish(msg_rcv_list_item[0].get("trace", msg_content_to_send["trace"]), msg_content_to_send["web-req-id"], rid_value, api_method, response_status[:3], trace_log_file)
+                            return reply_response(environ, start_response, response_status, msg_rcv_list_item[0]["reply-content"], __trace_header)
                     sleep(reply_read_delay)
                 else:
                     sleep(reply_read_delay)
@@ -7,9 +7,12 @@ Benefits:
 - two sided communication
 Nagatives:
 - not tested for high load
+Receiver can wait for messages in select() on the wake-up socket
+from wake_listen(), senders ping it with wake_notify() after snd().
 """
 import os
 import os.path
+from socket import socket, AF_UNIX, SOCK_DGRAM
 from json import loads, dumps
 import hashlib
 import zlib
@@ -40,6 +43,8 @@ class FileMessageExchange:
         self.__list_dicts_rcv = list()
         self.__text_encoding = "utf-8"
         self.__message_types_available = message_types_set
+        self.__wake_path = self.__msg_dir_path.rstrip("/") + ".wake"
+        self.__wake_sock = None
     def snd(self, snd_to_id, msgtype_to_send, dict_data_to_snd, msgtype_static_name=""):
         """
         Method snd() to send the message through file.
@@ -329,6 +334,63 @@ class FileMessageExchange:
                 return -1
         self.__message_types_available = msg_types_to_set
         return __set_msg_types_res
+    def wake_listen(self):
+        """
+        Create non-blocking socket receiving wake-up notifications, sent with wake_notify()
+        by other instances working in the same msg_dir_path_set folder, to wait for new
+        messages in select() instead of scanning the folder all the time.
+        Returns the socket, or None if failed.
+        """
+        self.__err = str()
+        try:
+            if os.access(self.__wake_path, os.F_OK):
+                os.remove(self.__wake_path)
+            self.__wake_sock = socket(AF_UNIX, SOCK_DGRAM)
+            self.__wake_sock.setblocking(False)
+            self.__wake_sock.bind(self.__wake_path)
+        except Exception as __exc_error_descr:
+            self.__err = "Error creating wake-up socket " + self.__wake_path + ": " + repr(__exc_error_descr)
+            self.__wake_sock = None
+        return self.__wake_sock
+    def wake_drain(self):
+        """ Read out all wake-up notifications received, returns their count """
+        self.__err = str()
+        __wake_count = int()
+        while self.__wake_sock is not None:
+            try:
+                self.__wake_sock.recv(64)
+            except OSError:
+                break
+            __wake_count += 1
+        return __wake_count
+    def wake_notify(self):
+        """ Wake up the instance waiting on wake_listen() socket in the same folder, use after snd() """
+        self.__err = str()
+        try:
+            with socket(AF_UNIX, SOCK_DGRAM) as __notify_sock:
+                __notify_sock.setblocking(False)
+                __notify_sock.sendto(b"W", self.__wake_path)
+        except BlockingIOError:
+            # Receiver has not read out previous notifications yet, so it is awake anyway
+            pass
+        except Exception as __exc_error_descr:
+            self.__err = "Error sending wake-up to " + self.__wake_path + ": " + repr(__exc_error_descr)
+            return -1
+        return 0
+    def wake_close(self):
+        """ Close the wake_listen() socket and remove its file """
+        self.__err = str()
+        if self.__wake_sock is None:
+            return 0
+        try:
+            self.__wake_sock.close()
+            self.__wake_sock = None
+            if os.access(self.__wake_path, os.F_OK):
+                os.remove(self.__wake_path)
+        except Exception as __exc_error_descr:
+            self.__err = "Error closing wake-up socket " + self.__wake_path + ": " + repr(__exc_error_descr)
+            return -1
+        return 0
     def geterr(self):
         """ Get error description if returned -1 """
         return self.__err